@@ -0,0 +1,79 @@
+"""Vectorized frame analysis for the capture pipeline"""
+import numpy as np
+
+
+class ChangeDetector:
+    """Dirty-tile detection between consecutive BGRA captures.
+
+    Each pixel is compared as a single uint32 against the previous capture.
+    The per-pixel mask is folded into tiles by OR-ing it eight pixels at a
+    time as uint64 words, and the fraction of tiles that changed is
+    returned. A ratio of 0.0 means the frame is identical to the last one.
+    """
+    def __init__(self, width, height, tile=32):
+        if tile % 8:
+            raise ValueError("Tile size must be a multiple of 8 pixels")
+        self.width = width
+        self.height = height
+        self.tile = tile
+        self._prev = np.empty((height, width), np.uint32)
+        self._mask = np.empty((height, width), np.bool_)
+
+        # Whole tiles are reduced as words; a partial last column is reduced separately
+        self._full_cols = width // tile
+        self._full_width = self._full_cols * tile
+        cols = self._full_cols + (1 if width % tile else 0)
+        self._cols = np.zeros((height, cols), np.uint64)
+        self._row_starts = np.arange(0, height, tile)
+        self.tile_count = len(self._row_starts) * cols
+        self._has_prev = False
+
+        # Counters
+        self.frames = 0
+        self.static_frames = 0
+        self.ratio_sum = 0.0
+        self.last_ratio = 1.0
+
+    def reset(self):
+        """Forget the previous frame so the next one counts as fully changed"""
+        self._has_prev = False
+
+    def update(self, bgra):
+        """Compare `bgra` with the previous capture and return the changed-tile ratio"""
+        pixels = np.ascontiguousarray(bgra).view(np.uint32).reshape(self.height, self.width)
+        self.frames += 1
+
+        if not self._has_prev:
+            np.copyto(self._prev, pixels)
+            self._has_prev = True
+            ratio = 1.0
+        else:
+            np.not_equal(pixels, self._prev, out=self._mask)
+
+            # One uint64 word holds the mask of eight adjacent pixels
+            cols = self._cols[:, :self._full_cols]
+            words = self._mask[:, :self._full_width].view(np.uint64).reshape(self.height, self._full_cols, self.tile // 8)
+            np.copyto(cols, words[:, :, 0])
+            for i in range(1, self.tile // 8):
+                np.bitwise_or(cols, words[:, :, i], out=cols)
+            if self._full_width < self.width:
+                self._cols[:, -1] = self._mask[:, self._full_width:].any(axis=1)
+
+            tiles = np.bitwise_or.reduceat(self._cols, self._row_starts, axis=0)
+            ratio = np.count_nonzero(tiles) / self.tile_count
+            if ratio:
+                np.copyto(self._prev, pixels)
+
+        if ratio == 0.0:
+            self.static_frames += 1
+        self.ratio_sum += ratio
+        self.last_ratio = ratio
+        return ratio
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "static_frames": self.static_frames,
+            "mean_changed_ratio": round(self.ratio_sum / self.frames, 4) if self.frames else 0.0,
+            "last_changed_ratio": self.last_ratio,
+        }
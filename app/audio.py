@@ -0,0 +1,988 @@
+"""Audio capture helpers: ring buffer, mixing and streaming writers for recorded PCM"""
+import os
+import time
+import struct
+import threading
+import subprocess
+from collections import deque, namedtuple
+
+import numpy as np
+
+from pipeline import FrameQueue, QueueClosed, BLOCK
+from ffmpeg_runner import get_runner
+
+# A capture device and the format it was opened with
+AudioDevice = namedtuple("AudioDevice", "name index rate channels")
+
+# Intermediate audio files written when audio cannot be muxed live, by
+# extension. FLAC is lossless and about half the size of WAV; Opus is far
+# smaller but lossy, and re-encoded again by the merge.
+AUDIO_INTERMEDIATES = {
+    ".flac": ['-c:a', 'flac', '-compression_level', '5'],
+    ".opus": ['-c:a', 'libopus', '-b:a', '128k', '-ar', '48000'],
+}
+
+
+class AudioRingBuffer:
+    """Preallocated single-producer/single-consumer ring of PCM frames.
+
+    The capture callback calls `write` and one drain thread calls `read`.
+    Each side only advances its own counter, after its copy is complete,
+    so no lock is needed. When the drain falls behind, the newest frames
+    that do not fit are dropped and counted in `overflow_frames` instead
+    of blocking the audio callback.
+
+    Blocks written with a timestamp keep it, so the drain can ask for the
+    capture time of any frame it reads with `timestamp_at`.
+    """
+    def __init__(self, capacity, channels, dtype=np.int16, rate=None):
+        self.capacity = capacity
+        self.channels = channels
+        self.rate = rate
+        self.buffer = np.zeros((capacity, channels), dtype)
+        self._stamps = deque()  # (frame position, timestamp) per block
+        self.write_pos = 0      # total frames ever written
+        self.read_pos = 0       # total frames ever read
+        self.overflow_frames = 0
+        self.overflows = 0
+        self.max_fill = 0
+
+    def available(self):
+        return self.write_pos - self.read_pos
+
+    def write(self, frames, timestamp=None):
+        """Producer side: copy (n, channels) frames in, dropping what does not fit"""
+        count = len(frames)
+        free = self.capacity - self.available()
+        if count > free:
+            self.overflows += 1
+            self.overflow_frames += count - free
+            frames = frames[:free]
+            count = free
+        if count and timestamp is not None:
+            self._stamps.append((self.write_pos, timestamp))
+        start = self.write_pos % self.capacity
+        first = min(count, self.capacity - start)
+        self.buffer[start:start + first] = frames[:first]
+        self.buffer[:count - first] = frames[first:]
+        self.write_pos += count
+        self.max_fill = max(self.max_fill, self.available())
+        return count
+
+    def read(self, out):
+        """Consumer side: copy up to len(out) frames into `out`, return the count"""
+        count = min(len(out), self.available())
+        start = self.read_pos % self.capacity
+        first = min(count, self.capacity - start)
+        out[:first] = self.buffer[start:start + first]
+        out[first:count] = self.buffer[:count - first]
+        self.read_pos += count
+        return count
+
+    def timestamp_at(self, position):
+        """Capture time of frame `position`, from the latest block stamped at or before it"""
+        stamps = self._stamps
+        # Consumer side only: drop stamps of blocks that were fully read
+        while len(stamps) > 1 and stamps[1][0] <= position:
+            stamps.popleft()
+        if not stamps or stamps[0][0] > position:
+            return None
+        stamp_pos, timestamp = stamps[0]
+        return timestamp + (position - stamp_pos) / self.rate
+
+    def stats(self):
+        return {
+            "capacity": self.capacity,
+            "written": self.write_pos,
+            "read": self.read_pos,
+            "overflows": self.overflows,
+            "overflow_frames": self.overflow_frames,
+            "max_fill": self.max_fill,
+        }
+
+
+class DriftCorrector:
+    """Keeps an audio track on the session clock before it reaches `sink`.
+
+    Each block arrives with the session time of its first frame. The gap
+    between where that puts it and how many frames have been written is
+    the track's offset. A large offset (the first block, or a gap after a
+    dropped buffer) is fixed at once with silence or by dropping frames.
+    Slow drift between the sound card's sample clock and the monotonic
+    clock is smoothed and absorbed by resampling blocks by at most
+    `max_ratio`, which is inaudible, so the muxer's sample-count
+    timestamps stay equal to session time. Frames past where the session
+    clock puts the end of the latest block are held back until the next
+    block or `finish`, which cuts them at the end of the session, so a
+    fast sample clock cannot run the track past the video.
+    """
+    def __init__(self, sink, rate, channels, deadband=0.02, hard_limit=0.2, max_ratio=0.005, smoothing=0.05):
+        self.sink = sink
+        self.rate = rate
+        self.channels = channels
+        self.deadband = deadband * rate
+        self.hard_limit = hard_limit * rate
+        self.max_ratio = max_ratio
+        self.smoothing = smoothing
+        self.written = 0        # Frames passed to the sink
+        self.drift = 0.0        # Smoothed offset in frames, positive when audio is behind
+        self.offset = 0         # Latest raw offset in frames
+        self.end = None         # Frame the track is cut at, once known
+        self.started = False
+        self._held = None       # Frames counted in `written` but not yet passed to the sink
+
+        # Counters
+        self.inserted = 0
+        self.dropped = 0
+        self.stretched = 0
+        self.trimmed = 0
+        self.max_offset = 0
+
+    def write(self, block, timestamp):
+        clock = int(round(timestamp * self.rate))
+        offset = clock - self.written
+        self.offset = offset
+        # Where the session clock puts the end of this block
+        clock += len(block)
+        self.max_offset = max(self.max_offset, abs(offset)) if self.started else 0
+
+        if not self.started or abs(offset) > self.hard_limit:
+            if offset > 0:
+                self._silence(offset)
+            elif offset < 0:
+                skip = min(-offset, len(block))
+                self.dropped += skip
+                block = block[skip:]
+            self.drift = 0.0
+            self.started = True
+        else:
+            self.drift += self.smoothing * (offset - self.drift)
+            if abs(self.drift) > self.deadband and len(block) > 1:
+                limit = max(1, int(len(block) * self.max_ratio))
+                change = int(max(-limit, min(limit, round(self.drift))))
+                block = self._resample(block, len(block) + change)
+                self.stretched += change
+                self.drift -= change
+
+        if self.end is not None:
+            block = block[:max(0, self.end - self.written)]
+        if len(block):
+            self.written += len(block)
+            if self._held is not None:
+                block = np.concatenate([self._held, block])
+            hold = min(len(block), max(0, self.written - clock))
+            self._held = block[len(block) - hold:].copy() if hold else None
+            self.sink.write(block[:len(block) - hold])
+
+    def pad_to(self, frame):
+        """Fill the track with silence up to `frame`, for a source that went quiet"""
+        missing = frame - self.written
+        if missing > 0:
+            self._silence(missing)
+
+    def end_at(self, end_time):
+        """Discard audio captured after session time `end_time`"""
+        self.end = int(round(end_time * self.rate))
+
+    def finish(self, end_time):
+        """Cut or pad with silence so the track lasts exactly until `end_time`"""
+        self.end_at(end_time)
+        held, self._held = self._held, None
+        if held is not None:
+            keep = max(0, len(held) - max(0, self.written - self.end))
+            self.sink.write(held[:keep])
+            self.trimmed += len(held) - keep
+            self.written -= len(held) - keep
+        missing = self.end - self.written
+        if missing > 0:
+            self._silence(missing)
+
+    def _silence(self, frames):
+        # Held frames come before the silence
+        if self._held is not None:
+            self.sink.write(self._held)
+            self._held = None
+        chunk = np.zeros((min(frames, self.rate), self.channels), np.int16)
+        remaining = frames
+        while remaining:
+            count = min(remaining, len(chunk))
+            self.sink.write(chunk[:count])
+            remaining -= count
+        self.written += frames
+        self.inserted += frames
+
+    @staticmethod
+    def _resample(block, length):
+        positions = np.linspace(0, len(block) - 1, length)
+        source = np.arange(len(block))
+        out = np.empty((length, block.shape[1]), block.dtype)
+        for channel in range(block.shape[1]):
+            out[:, channel] = np.round(np.interp(positions, source, block[:, channel]))
+        return out
+
+    def offset_ms(self):
+        """Latest offset of the track from the session clock"""
+        return self.offset / self.rate * 1000
+
+    def stats(self):
+        return {
+            "offset_ms": round(self.offset_ms(), 1),
+            "max_offset_ms": round(self.max_offset / self.rate * 1000, 1),
+            "inserted_frames": self.inserted,
+            "dropped_frames": self.dropped,
+            "stretched_frames": self.stretched,
+            "trimmed_frames": self.trimmed,
+        }
+
+
+def remix_channels(block, channels):
+    """(n, c) frames as (n, channels): mono is duplicated, anything else is downmixed or truncated"""
+    have = block.shape[1]
+    if have == channels:
+        return block
+    if have == 1:
+        return np.repeat(block, channels, axis=1)
+    if channels == 1:
+        return block.mean(axis=1, keepdims=True).astype(block.dtype)
+    if have > channels:
+        return block[:, :channels]
+    return np.concatenate([block, np.repeat(block[:, -1:], channels - have, axis=1)], axis=1)
+
+
+class Resampler:
+    """Streaming linear-interpolation sample rate converter.
+
+    The fractional read position and the last input frame carry over
+    between blocks, so a stream cut into arbitrary blocks comes out the
+    same as if it were converted in one go. Linear interpolation is
+    plenty for speech and system sounds mixed into a screen recording.
+    """
+    def __init__(self, src_rate, dst_rate):
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self.step = src_rate / dst_rate
+        self.position = 1.0     # Next output frame, in input frames after `last`
+        self.last = None
+
+    def process(self, block):
+        if self.src_rate == self.dst_rate or not len(block):
+            return block
+        if self.last is None:
+            self.last = block[:1]
+        source = np.concatenate([self.last, block]).astype(np.float32)
+        end = len(source) - 1
+        count = int((end - self.position) // self.step) + 1 if self.position <= end else 0
+        positions = self.position + np.arange(count) * self.step
+        index = positions.astype(np.intp)
+        frac = (positions - index).astype(np.float32)[:, None]
+        upper = np.minimum(index + 1, end)
+        out = source[index]
+        out += (source[upper] - out) * frac
+        self.position += count * self.step - end
+        self.last = block[-1:]
+        return np.round(out).astype(block.dtype)
+
+
+class Framer:
+    """Cuts a stream of (n, channels) blocks into whole analysis frames.
+
+    `push` yields float32 arrays of shape (k, size, channels); a partial
+    frame at the end of a block waits for the next one.
+    """
+    def __init__(self, size, channels):
+        self.size = size
+        self._pending = np.empty((size, channels), np.float32)
+        self._fill = 0
+
+    def push(self, block):
+        fill = self._fill
+        if fill:
+            take = min(len(block), self.size - fill)
+            self._pending[fill:fill + take] = block[:take]
+            self._fill = fill = fill + take
+            block = block[take:]
+            if fill < self.size:
+                return
+            yield self._pending[None]
+            self._fill = 0
+        whole = len(block) // self.size * self.size
+        if whole:
+            yield block[:whole].reshape(-1, self.size, block.shape[1]).astype(np.float32)
+        rest = len(block) - whole
+        self._pending[:rest] = block[whole:]
+        self._fill = rest
+
+
+# BS.1770 K-weighting (high shelf, then high-pass) as 48 kHz biquads
+K_WEIGHTING = (
+    ((1.53512485958697, -2.69169618940638, 1.19839281085285), (1.0, -1.69065929318241, 0.73248077421585)),
+    ((1.0, -2.0, 1.0), (1.0, -1.99004745483398, 0.99007225036621)),
+)
+
+
+def k_weighting_power(freqs):
+    """|H(f)|^2 of the K-weighting filter at frequencies `freqs` (Hz)"""
+    z = np.exp(-2j * np.pi * np.asarray(freqs) / 48000)
+    response = np.ones(len(z), complex)
+    for b, a in K_WEIGHTING:
+        response *= (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+    return np.abs(response) ** 2
+
+
+class LoudnessMeter:
+    """BS.1770-style loudness (LUFS) of an int16 stream, measured as it is captured.
+
+    Frames are K-weighted in the frequency domain, one 100 ms step at a
+    time: by Parseval the mean square of the filtered step is a weighted
+    sum of its spectrum, which vectorizes where the standard IIR filter
+    runs sample by sample. Momentary (400 ms) and short-term (3 s)
+    loudness average the latest steps; integrated loudness gates 400 ms
+    blocks at -70 LUFS and then 10 LU below their mean.
+    """
+    STEP = 0.1
+    ABSOLUTE_GATE = -70.0
+    RELATIVE_GATE = -10.0
+
+    def __init__(self, rate, channels):
+        self.rate = rate
+        self.step = int(rate * self.STEP)
+        # Spectrum weights giving the mean square of a full-scale-normalized step
+        weights = k_weighting_power(np.fft.rfftfreq(self.step, 1 / rate))
+        weights[1:(self.step + 1) // 2] *= 2    # rfft folds the negative frequencies
+        self.weights = (weights / (self.step ** 2 * 32768.0 ** 2)).astype(np.float32)[:, None]
+        self._framer = Framer(self.step, channels)
+        self.powers = []        # Channel-summed mean square per step
+
+    def process(self, block):
+        """Meter (n, channels) frames"""
+        for steps in self._framer.push(block):
+            self._measure(steps)
+
+    def _measure(self, steps):
+        spectrum = np.fft.rfft(steps, axis=1)
+        power = (spectrum.real ** 2 + spectrum.imag ** 2) * self.weights
+        self.powers.extend(power.sum(axis=(1, 2)).tolist())
+
+    @staticmethod
+    def to_lufs(power):
+        return -0.691 + 10 * np.log10(power) if power > 0 else -np.inf
+
+    def window(self, seconds):
+        """Loudness of the last `seconds`, or None before any full step"""
+        count = int(round(seconds / self.STEP))
+        if not self.powers:
+            return None
+        recent = self.powers[-count:]
+        return self.to_lufs(sum(recent) / len(recent))
+
+    def momentary(self):
+        return self.window(0.4)
+
+    def short_term(self):
+        return self.window(3.0)
+
+    def integrated(self):
+        """Gated loudness of everything metered so far, or None"""
+        powers = np.asarray(self.powers)
+        if len(powers) < 4:
+            return None
+        # 400 ms blocks with 75% overlap
+        blocks = np.convolve(powers, np.full(4, 0.25), mode="valid")
+        blocks = blocks[blocks > 10 ** ((self.ABSOLUTE_GATE + 0.691) / 10)]
+        if not len(blocks):
+            return None
+        relative = self.to_lufs(blocks.mean()) + self.RELATIVE_GATE
+        blocks = blocks[blocks > 10 ** ((relative + 0.691) / 10)]
+        return float(self.to_lufs(blocks.mean()))
+
+
+class AutoGain:
+    """Gain that brings a source to `target` LUFS, following its loudness slowly.
+
+    The first measurement sets the gain directly; after that it moves at
+    most `slew_db` per second up and four times that down. While the
+    source is below `gate` (silence, room noise) the gain is held, so
+    quiet passages are not pumped up to full loudness.
+    """
+    def __init__(self, target=-16.0, gain=1.0, min_gain_db=-12.0, max_gain_db=24.0, slew_db=3.0, gate=-50.0):
+        self.target = target
+        self.gain_db = 20 * np.log10(gain)
+        self.min_gain_db = min_gain_db
+        self.max_gain_db = max_gain_db
+        self.slew_db = slew_db
+        self.gate = gate
+        self.settled = False
+
+    @property
+    def gain(self):
+        return 10 ** (self.gain_db / 20)
+
+    def update(self, loudness, seconds):
+        """Adjust for the latest loudness after `seconds` of audio; returns the gain"""
+        if loudness is not None and loudness > self.gate:
+            wanted = min(self.max_gain_db, max(self.min_gain_db, self.target - loudness))
+            change = wanted - self.gain_db
+            if self.settled:
+                change = min(self.slew_db * seconds, max(-4 * self.slew_db * seconds, change))
+            self.gain_db += change
+            self.settled = True
+        return self.gain
+
+
+class VoiceActivityDetector:
+    """Sound or silence for every 30 ms frame of a stream, vectorized per block.
+
+    A frame is active when its level is `margin` dB above the noise floor
+    and above `threshold` dBFS. The floor follows the quietest frames: it
+    drops at once and rises by at most `rise_db` per second, so steady
+    hum and fan noise count as silence.
+    """
+    FRAME = 0.03
+
+    def __init__(self, rate, channels, threshold=-50.0, margin=10.0, rise_db=0.5):
+        self.size = int(rate * self.FRAME)
+        self.threshold = threshold
+        self.margin = margin
+        self.rise_db = rise_db
+        # Until quieter frames are seen, assume a quiet room
+        self.floor = threshold - margin
+        self.frames = 0         # Frames decided so far
+        self.active_frames = 0
+        self._framer = Framer(self.size, channels)
+
+    @property
+    def time(self):
+        """Stream time of the next frame to be decided"""
+        return self.frames * self.FRAME
+
+    def process(self, block):
+        """Decide the frames completed by `block`; returns one bool per frame"""
+        decided = [self._decide(frames) for frames in self._framer.push(block)]
+        if not decided:
+            return np.zeros(0, np.bool_)
+        return np.concatenate(decided) if len(decided) > 1 else decided[0]
+
+    def _decide(self, frames):
+        power = np.einsum("fsc,fsc->f", frames, frames) / (frames.shape[1] * frames.shape[2] * 32768.0 ** 2)
+        level = 10 * np.log10(power + 1e-12)
+        quietest = float(level.min())
+        if quietest < self.floor:
+            self.floor = quietest
+        else:
+            self.floor = min(quietest, self.floor + self.rise_db * len(level) * self.FRAME)
+        active = (level > self.threshold) & (level > self.floor + self.margin)
+        self.frames += len(level)
+        self.active_frames += int(np.count_nonzero(active))
+        return active
+
+
+class AudioSource:
+    """One capture device feeding an AudioMixer.
+
+    The device callback writes raw blocks to `ring` at the device's own
+    rate and channel count. `drain` brings them to the mixer's format and
+    through a DriftCorrector onto the session clock, into `track`, where
+    every source lines up frame for frame.
+
+    With `autogain` the mixer meters the source and sets its gain from
+    the loudness, otherwise `gain` is fixed.
+    """
+    def __init__(self, name, rate, channels, out_rate, out_channels, gain=1.0, ring_seconds=4, autogain=None):
+        self.name = name
+        self.rate = rate
+        self.channels = channels
+        self.gain = gain
+        self.autogain = autogain
+        self.meter = LoudnessMeter(out_rate, out_channels) if autogain else None
+        self.ring = AudioRingBuffer(rate * ring_seconds, channels, rate=rate)
+        self.track = AudioRingBuffer(out_rate * ring_seconds, out_channels)
+        self.resampler = Resampler(rate, out_rate)
+        self.corrector = DriftCorrector(self.track, out_rate, out_channels)
+        self.out_channels = out_channels
+        self._scratch = np.empty((rate // 2, channels), np.int16)
+
+    def drain(self, session, clock=time.monotonic):
+        """Move captured frames that fall inside recorded spans into `track`"""
+        ring = self.ring
+        while True:
+            position = ring.read_pos
+            count = ring.read(self._scratch)
+            if not count:
+                return
+            begin = ring.timestamp_at(position)
+            if begin is None:
+                begin = clock() - count / self.rate
+            # Keep only the samples taken while the session was recording
+            for span_begin, span_end in session.recorded_spans(begin, begin + count / self.rate):
+                first = int(round((span_begin - begin) * self.rate))
+                last = min(count, int(round((span_end - begin) * self.rate)))
+                if last > first:
+                    self.process(self._scratch[first:last], session.session_time(begin + first / self.rate))
+
+    def process(self, block, session_t):
+        """Convert one block of device frames and place it at session time `session_t`"""
+        block = self.resampler.process(remix_channels(block, self.out_channels))
+        self.corrector.write(block, session_t)
+
+    def stats(self):
+        stats = {"ring_" + key: value for key, value in self.ring.stats().items()
+                 if key in ("overflows", "overflow_frames", "max_fill")}
+        stats.update(self.corrector.stats())
+        if self.meter:
+            loudness = self.meter.integrated()
+            stats.update(loudness_lufs=round(loudness, 1) if loudness is not None else None,
+                         gain_db=round(float(20 * np.log10(self.gain)), 1))
+        return stats
+
+
+class Limiter:
+    """Clip protection for float PCM on its way to int16.
+
+    A block that would clip is scaled down to fit its peak at once, so
+    nothing clips; the gain then recovers by at most `release` per block,
+    ramped across the block so the recovery is not heard as steps.
+    """
+    CEILING = 32767.0
+
+    def __init__(self, ceiling=0.98, release=0.05):
+        self.ceiling = ceiling * self.CEILING
+        self.release = release
+        self.gain = 1.0
+        self.engaged = 0        # Blocks that needed gain reduction
+
+    def process(self, block, out):
+        """Scale float `block` in place and write it into the int16 `out`"""
+        peak = float(np.abs(block).max())
+        target = min(1.0, self.ceiling / peak) if peak else 1.0
+        if target < self.gain:
+            self.engaged += 1
+            block *= np.float32(target)
+            self.gain = target
+        elif self.gain < 1.0:
+            target = min(target, self.gain + self.release)
+            block *= np.linspace(self.gain, target, len(block), dtype=np.float32)[:, None]
+            self.gain = target
+        np.rint(block, out=block)
+        out = out[:len(block)]
+        out[:] = block
+        return out
+
+
+class AudioMixer:
+    """Mixes time-aligned AudioSources into one track, or keeps them apart.
+
+    With one sink, every source is scaled by its gain, summed in float
+    and limited into that sink. With one sink per source, each source is
+    scaled and limited into its own. Gain changes from a source's
+    AutoGain are ramped across the block, and each output is metered.
+    With a `timeline` (idle.ActivityTimeline), every source also runs
+    voice activity detection and sound from any of them is marked on it. Sources only advance together: a
+    source that stops delivering (a loopback device during silence) is
+    padded with silence once it lags `max_lag` seconds behind the others.
+    """
+    def __init__(self, sources, sinks, rate, channels, max_lag=0.5, block_seconds=0.5, timeline=None):
+        if len(sinks) not in (1, len(sources)):
+            raise ValueError("Need one sink, or one per source")
+        self.sources = sources
+        self.sinks = sinks
+        self.rate = rate
+        self.channels = channels
+        self.max_lag = int(max_lag * rate)
+        self.limiters = [Limiter() for _ in sinks]
+        self.meters = [LoudnessMeter(rate, channels) for _ in sinks]
+        self.timeline = timeline
+        self.vads = [VoiceActivityDetector(rate, channels) for _ in sources] if timeline else []
+        block = int(block_seconds * rate)
+        self._in = np.empty((block, channels), np.int16)
+        self._mix = np.empty((block, channels), np.float32)
+        self._gained = np.empty((block, channels), np.float32)
+        self._out = np.empty((block, channels), np.int16)
+        self.frames = 0
+
+    @property
+    def separate(self):
+        return len(self.sinks) > 1
+
+    def mix(self, final=False):
+        """Mix every frame that all sources have; `final` flushes what is left"""
+        correctors = [source.corrector for source in self.sources]
+        if not final and len(self.sources) > 1:
+            lead = max(corrector.written for corrector in correctors)
+            for corrector in correctors:
+                corrector.pad_to(lead - self.max_lag)
+        while True:
+            available = [source.track.available() for source in self.sources]
+            count = min(max(available) if final else min(available), len(self._in))
+            if not count:
+                return
+            self._mix_block(count)
+
+    def _mix_block(self, count):
+        mix = self._mix[:count]
+        gained = self._gained[:count]
+        if not self.separate:
+            mix.fill(0)
+        activity = None
+        for index, source in enumerate(self.sources):
+            frames = source.track.read(self._in[:count])
+            # A short source at the very end is padded with silence
+            self._in[frames:count] = 0
+            if self.vads:
+                vad = self.vads[index]
+                start = vad.time
+                active = vad.process(self._in[:count])
+                activity = active if activity is None else activity | active
+            previous = source.gain
+            if source.autogain:
+                source.meter.process(self._in[:count])
+                source.gain = source.autogain.update(source.meter.short_term(), count / self.rate)
+            if source.gain == previous:
+                np.multiply(self._in[:count], np.float32(source.gain), out=gained)
+            else:
+                ramp = np.linspace(previous, source.gain, count, dtype=np.float32)[:, None]
+                np.multiply(self._in[:count], ramp, out=gained)
+            if self.separate:
+                self._write(index, gained)
+            else:
+                mix += gained
+        if not self.separate:
+            self._write(0, mix)
+        if activity is not None and len(activity):
+            self.timeline.mark_audio(start, activity, VoiceActivityDetector.FRAME)
+        self.frames += count
+
+    def _write(self, index, block):
+        out = self.limiters[index].process(block, self._out)
+        self.meters[index].process(out)
+        self.sinks[index].write(out)
+
+    def loudness(self):
+        """Integrated loudness of each output track"""
+        return [meter.integrated() for meter in self.meters]
+
+    def stats(self):
+        return {
+            "mixed_frames": self.frames,
+            "limited_blocks": sum(limiter.engaged for limiter in self.limiters),
+            "output_lufs": [round(value, 1) if value is not None else None for value in self.loudness()],
+            "active_frames": [vad.active_frames for vad in self.vads],
+        }
+
+
+def find_loopback_device(p):
+    """Input device that captures what the system plays, or None.
+
+    Uses PyAudioWPatch's WASAPI loopback when that PyAudio build is in
+    use, otherwise looks for a PulseAudio/PipeWire monitor source or a
+    "Stereo Mix" style device.
+    """
+    if hasattr(p, "get_default_wasapi_loopback"):
+        try:
+            return p.get_default_wasapi_loopback()
+        except Exception:
+            pass
+    for index in range(p.get_device_count()):
+        info = p.get_device_info_by_index(index)
+        name = info.get("name", "").lower()
+        if info.get("maxInputChannels", 0) > 0 and (
+                info.get("isLoopbackDevice") or "monitor" in name
+                or "stereo mix" in name or "what u hear" in name or "loopback" in name):
+            return info
+    return None
+
+
+def negotiate_format(p, info, sample_format, max_channels=2, rates=(48000, 44100)):
+    """(rate, channels) to open input device `info` with.
+
+    Takes the device's own channel count up to `max_channels`, so a mono
+    microphone is recorded as mono, and its default sample rate, falling
+    back to the common rates in `rates`.
+    """
+    channels = max(1, min(max_channels, int(info["maxInputChannels"])))
+    default_rate = int(info["defaultSampleRate"])
+    for rate in [default_rate] + [rate for rate in rates if rate != default_rate]:
+        try:
+            if p.is_format_supported(rate, input_device=info["index"], input_channels=channels,
+                                     input_format=sample_format):
+                return rate, channels
+        except ValueError:
+            continue
+    raise Exception(f"No supported sample rate for {info['name']}")
+
+
+def select_devices(p, sample_format, microphone=True, system_audio=False):
+    """AudioDevices for the default microphone and/or the system loopback.
+
+    A missing loopback device is left out; the caller can tell from the
+    result.
+    """
+    found = []
+    if microphone:
+        found.append(("microphone", p.get_default_input_device_info()))
+    if system_audio:
+        info = find_loopback_device(p)
+        if info is not None:
+            found.append(("system", info))
+    return [AudioDevice(name, int(info["index"]), *negotiate_format(p, info, sample_format))
+            for name, info in found]
+
+
+def track_format(devices):
+    """(rate, channels) of the recorded track: the first device's rate, and
+    stereo only if some device delivers it"""
+    return devices[0].rate, max(device.channels for device in devices)
+
+
+class StreamingWavWriter:
+    """PCM WAV written to disk as it is recorded.
+
+    Memory use is constant: every block goes straight to the file. The
+    RIFF and data sizes in the header are rewritten every
+    `fixup_seconds`, so after a crash the file is valid up to the last
+    fix-up and `recovery.repair_wav_header` can reclaim the rest.
+    """
+    HEADER_SIZE = 44
+    # The RIFF size fields are 32-bit
+    MAX_DATA = 0xFFFFFFFF - HEADER_SIZE + 8
+
+    def __init__(self, filename, channels, sample_width, rate, fixup_seconds=2.0, clock=time.monotonic):
+        self.filename = filename
+        self.channels = channels
+        self.sample_width = sample_width
+        self.rate = rate
+        self.fixup_seconds = fixup_seconds
+        self.clock = clock
+        self.data_bytes = 0
+        self.file = None
+        self._last_fixup = 0.0
+
+    @property
+    def frame_size(self):
+        return self.channels * self.sample_width
+
+    @property
+    def frames_written(self):
+        return self.data_bytes // self.frame_size
+
+    def open(self):
+        self.file = open(self.filename, "wb")
+        self.file.write(self._header(0))
+        self.file.flush()
+        self._last_fixup = self.clock()
+
+    def _header(self, data_size):
+        data_size = min(data_size, self.MAX_DATA)
+        byte_rate = self.rate * self.frame_size
+        return struct.pack(
+            "<4sI4s4sIHHIIHH4sI",
+            b"RIFF", 36 + data_size, b"WAVE",
+            b"fmt ", 16, 1, self.channels, self.rate, byte_rate, self.frame_size, self.sample_width * 8,
+            b"data", data_size
+        )
+
+    def write(self, data):
+        """Append raw interleaved PCM (bytes or a contiguous NumPy array)"""
+        self.file.write(data)
+        self.data_bytes += len(memoryview(data).cast("B"))
+        if self.clock() - self._last_fixup >= self.fixup_seconds:
+            self.fixup()
+
+    def fixup(self):
+        """Make the header describe everything written so far"""
+        self.file.seek(0)
+        self.file.write(self._header(self.data_bytes))
+        self.file.seek(0, 2)
+        self.file.flush()
+        self._last_fixup = self.clock()
+
+    def close(self):
+        if self.file is None:
+            return
+        self.fixup()
+        self.file.close()
+        self.file = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FFmpegAudioWriter:
+    """PCM compressed on the fly by an ffmpeg process, e.g. into FLAC.
+
+    Same interface as StreamingWavWriter. ffmpeg flushes every packet,
+    so a FLAC or Ogg file cut off by a crash still decodes up to the end.
+    """
+    def __init__(self, filename, channels, sample_width, rate, codec_args=None, ffmpeg_exe=None):
+        self.filename = filename
+        self.channels = channels
+        self.sample_width = sample_width
+        self.rate = rate
+        self.codec_args = codec_args or AUDIO_INTERMEDIATES[os.path.splitext(filename)[1].lower()]
+        self.runner = get_runner(ffmpeg_exe)
+        self.data_bytes = 0
+        self.proc = None
+        self._stderr_tail = deque(maxlen=20)
+        self._stderr_thread = None
+
+    @property
+    def sample_format(self):
+        return {1: "u8", 2: "s16le", 4: "s32le"}[self.sample_width]
+
+    @property
+    def frames_written(self):
+        return self.data_bytes // (self.channels * self.sample_width)
+
+    def open(self):
+        args = ['-f', self.sample_format, '-ar', str(self.rate), '-ac', str(self.channels), '-i', 'pipe:0',
+                ] + self.codec_args + ['-flush_packets', '1', '-y', self.filename]
+        self.proc = self.runner.popen(args, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.PIPE)
+        # Keep reading so a chatty ffmpeg never blocks on a full stderr pipe
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, args=(self.proc,), daemon=True)
+        self._stderr_thread.start()
+
+    def _drain_stderr(self, proc):
+        for line in proc.stderr:
+            self._stderr_tail.append(line.decode(errors="replace").rstrip())
+
+    def error_output(self):
+        if self._stderr_thread is not None:
+            self._stderr_thread.join(timeout=2)
+        return "\n".join(self._stderr_tail)
+
+    def write(self, data):
+        """Append raw interleaved PCM (bytes or a contiguous NumPy array)"""
+        try:
+            self.proc.stdin.write(data)
+        except (BrokenPipeError, OSError):
+            self.proc.wait()
+            raise Exception(f"Audio encoder exited: {self.error_output()}")
+        self.data_bytes += len(memoryview(data).cast("B"))
+
+    def close(self):
+        if self.proc is None:
+            return
+        proc, self.proc = self.proc, None
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+        if proc.wait() != 0:
+            raise Exception(f"Audio encoder failed: {self.error_output()}")
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def intermediate_available(ext):
+    """Whether the shared ffmpeg can write audio intermediates with extension `ext`"""
+    args = AUDIO_INTERMEDIATES.get(ext)
+    runner = get_runner()
+    return bool(args) and runner.available and runner.has_encoder(args[args.index('-c:a') + 1])
+
+
+def open_audio_writer(filename, channels, sample_width, rate):
+    """Open a streaming writer for `filename`: compressed for the extensions
+    in AUDIO_INTERMEDIATES, otherwise WAV"""
+    if os.path.splitext(filename)[1].lower() in AUDIO_INTERMEDIATES:
+        writer = FFmpegAudioWriter(filename, channels, sample_width, rate)
+    else:
+        writer = StreamingWavWriter(filename, channels, sample_width, rate)
+    writer.open()
+    return writer
+
+
+class AudioFeed:
+    """Hands captured PCM from the audio thread to an encoder that muxes it live.
+
+    Blocks wait in a bounded queue until the encoder's audio input takes
+    them. If the queue stays full for `put_timeout` (the encoder's input
+    stalled) a block is replaced by as much silence, queued ahead of the
+    next block that fits, so the track keeps its length and its sync;
+    during a stall blocks are not waited for again until one fits. If
+    the encoder turns out not to support live audio it calls
+    `detach`, and the feed spills everything to `fallback_filename` as a
+    WAV (or a compressed intermediate, by its extension) to be merged
+    after the recording instead.
+    """
+    def __init__(self, channels, rate, sample_width=2, fallback_filename=None, maxsize=512, put_timeout=0.5):
+        self.channels = channels
+        self.rate = rate
+        self.sample_width = sample_width
+        self.fallback_filename = fallback_filename
+        self.put_timeout = put_timeout
+        self.queue = FrameQueue(maxsize, BLOCK, name="audio")
+        self._writer = None
+        self._lock = threading.Lock()
+        self._gap = 0               # Bytes of silence owed to the track
+        self.spilled = False
+        self.silenced_frames = 0    # Frames replaced by silence
+
+    @property
+    def sample_format(self):
+        return {1: "u8", 2: "s16le", 4: "s32le"}[self.sample_width]
+
+    def write(self, frames):
+        with self._lock:
+            if self._writer is not None:
+                if self._gap:
+                    self._writer.write(bytes(self._gap))
+                    self._gap = 0
+                self._writer.write(frames)
+                return
+        # The caller reuses its buffer, so queue a copy
+        data = frames.tobytes()
+        self._put(bytes(self._gap) + data if self._gap else data)
+
+    def _put(self, data):
+        if self.queue.put(data, timeout=0 if self._gap else self.put_timeout):
+            self._gap = 0
+        else:
+            self.silenced_frames += (len(data) - self._gap) // (self.sample_width * self.channels)
+            self._gap = len(data)
+
+    def detach(self):
+        """The encoder cannot take audio: write it to the fallback file"""
+        with self._lock:
+            if self._writer is not None or self.fallback_filename is None:
+                return
+            writer = open_audio_writer(self.fallback_filename, self.channels, self.sample_width, self.rate)
+            while True:
+                try:
+                    block = self.queue.get(timeout=0)
+                except QueueClosed:
+                    break
+                if block is None:
+                    break
+                writer.write(block)
+            self._writer = writer
+            self.spilled = True
+
+    def stats(self):
+        return {"dropped": self.queue.dropped, "silenced_frames": self.silenced_frames,
+                "high_water": self.queue.high_water, "blocked_time": round(self.queue.blocked_time, 3),
+                "spilled": self.spilled}
+
+    def close(self):
+        """No more audio: the encoder's input sees end of stream"""
+        with self._lock:
+            if self._gap:
+                # Audio lost at the very end still counts towards the length
+                if self._writer is not None:
+                    self._writer.write(bytes(self._gap))
+                else:
+                    self.queue.put(bytes(self._gap), timeout=self.put_timeout)
+                self._gap = 0
+        self.queue.close()
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
@@ -0,0 +1,379 @@
+"""Screen capture backends"""
+import os
+import sys
+import ctypes
+import ctypes.util
+import numpy as np
+
+try:
+    import mss
+except ImportError:
+    mss = None
+
+try:
+    import win32gui
+except ImportError:
+    win32gui = None
+
+
+def bgra_view(screenshot):
+    """Zero-copy (h, w, 4) view over an mss screenshot's raw BGRA buffer"""
+    return np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(screenshot.height, screenshot.width, 4)
+
+
+def window_rect(hwnd):
+    """Screen area covered by a window handle"""
+    if win32gui is None:
+        raise Exception("Window capture requires pywin32")
+    rect = win32gui.GetWindowRect(hwnd)
+    return {
+        "left": rect[0],
+        "top": rect[1],
+        "width": rect[2] - rect[0],
+        "height": rect[3] - rect[1]
+    }
+
+
+def resolve_capture_area(monitors, mode="monitor", monitor_number=1, window_hwnd=None, region=None):
+    """Determine the screen area to capture.
+
+    `monitors` follows the mss convention: index 0 is the union of all
+    screens and 1..n are the individual monitors.
+    """
+    if mode == "monitor" and monitor_number < len(monitors):
+        return monitors[monitor_number]
+    elif mode == "window" and window_hwnd:
+        return window_rect(window_hwnd)
+    elif mode == "region" and region:
+        return {
+            "left": region[0],
+            "top": region[1],
+            "width": region[2],
+            "height": region[3]
+        }
+    return monitors[1]
+
+
+class CaptureBackend:
+    """Base class for screen grabbers.
+
+    `open` is called on the thread that will grab, `grab` returns an
+    (height, width, 4) uint8 BGRA array that stays valid after the next
+    grab, and `close` releases native resources.
+    """
+    name = None
+
+    def __init__(self):
+        self.area = None
+
+    def monitors(self):
+        raise NotImplementedError
+
+    def open(self, area):
+        self.area = area
+
+    def grab(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MSSBackend(CaptureBackend):
+    """Capture through mss (GDI BitBlt on Windows, XGetImage on Linux)"""
+    name = "mss"
+
+    def __init__(self):
+        super().__init__()
+        if mss is None:
+            raise Exception("The mss capture backend requires the 'mss' package")
+        self.sct = None
+
+    def monitors(self):
+        with mss.mss() as sct:
+            return [dict(monitor) for monitor in sct.monitors]
+
+    def open(self, area):
+        super().open(area)
+        # mss handles must be created on the thread that uses them
+        self.sct = mss.mss()
+
+    def grab(self):
+        return bgra_view(self.sct.grab(self.area))
+
+    def close(self):
+        if self.sct is not None:
+            self.sct.close()
+            self.sct = None
+
+
+class SyntheticBackend(CaptureBackend):
+    """Deterministic generated frames for headless runs and benchmarks.
+
+    Every grab advances one frame of a moving pattern over a fixed
+    gradient, so the same frame number always produces the same pixels.
+    The "static" pattern never changes after the first frame.
+    """
+    name = "synthetic"
+
+    def __init__(self, width=1920, height=1080, fps=30, pattern="moving"):
+        super().__init__()
+        if pattern not in ("moving", "static"):
+            raise ValueError(f"Unknown synthetic pattern: {pattern}")
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.pattern = pattern
+        self.frame_number = 0
+        self._base = None
+
+    def monitors(self):
+        screen = {"left": 0, "top": 0, "width": self.width, "height": self.height}
+        return [screen, dict(screen)]
+
+    def open(self, area):
+        super().open(area)
+        width, height = area["width"], area["height"]
+        self.frame_number = 0
+
+        # Horizontal/vertical gradient background
+        self._base = np.empty((height, width, 4), np.uint8)
+        self._base[..., 0] = (np.arange(width, dtype=np.uint32) * 255 // max(1, width - 1)).astype(np.uint8)
+        self._base[..., 1] = (np.arange(height, dtype=np.uint32) * 255 // max(1, height - 1)).astype(np.uint8)[:, None]
+        self._base[..., 2] = 64
+        self._base[..., 3] = 255
+
+    def grab(self):
+        frame = self._base.copy()
+        n = self.frame_number
+        self.frame_number += 1
+        if self.pattern == "static":
+            return frame
+
+        height, width = frame.shape[:2]
+        size = max(8, min(width, height) // 8)
+
+        # A box crossing the screen once every two seconds, and a bar
+        # sweeping down once every four
+        period = max(1, 2 * self.fps)
+        x = (n % period) * max(1, width - size) // period
+        y = (height - size) // 2
+        frame[y:y+size, x:x+size, :3] = (255, 255, 255)
+
+        bar_period = max(1, 4 * self.fps)
+        bar_y = (n % bar_period) * height // bar_period
+        frame[bar_y:bar_y+4, :, :3] = (0, 0, 255)
+        return frame
+
+
+class _XImage(ctypes.Structure):
+    _fields_ = [
+        ("width", ctypes.c_int),
+        ("height", ctypes.c_int),
+        ("xoffset", ctypes.c_int),
+        ("format", ctypes.c_int),
+        ("data", ctypes.c_void_p),
+        ("byte_order", ctypes.c_int),
+        ("bitmap_unit", ctypes.c_int),
+        ("bitmap_bit_order", ctypes.c_int),
+        ("bitmap_pad", ctypes.c_int),
+        ("depth", ctypes.c_int),
+        ("bytes_per_line", ctypes.c_int),
+        ("bits_per_pixel", ctypes.c_int),
+        ("red_mask", ctypes.c_ulong),
+        ("green_mask", ctypes.c_ulong),
+        ("blue_mask", ctypes.c_ulong),
+    ]
+
+
+class _XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [
+        ("shmseg", ctypes.c_ulong),
+        ("shmid", ctypes.c_int),
+        ("shmaddr", ctypes.c_void_p),
+        ("readOnly", ctypes.c_int),
+    ]
+
+
+class XShmBackend(CaptureBackend):
+    """X11 capture through the MIT-SHM extension.
+
+    The X server copies each grab straight into a shared memory segment
+    that stays attached for the whole recording, avoiding the socket
+    transfer XGetImage pays per frame.
+    """
+    name = "xshm"
+
+    _IPC_PRIVATE = 0
+    _IPC_CREAT = 0o1000
+    _IPC_RMID = 0
+    _ZPIXMAP = 2
+    _ALL_PLANES = 0xFFFFFFFF
+
+    def __init__(self):
+        super().__init__()
+        if not sys.platform.startswith("linux"):
+            raise Exception("The xshm capture backend is only available on Linux/X11")
+        x11 = ctypes.util.find_library("X11")
+        xext = ctypes.util.find_library("Xext")
+        if not x11 or not xext:
+            raise Exception("The xshm capture backend requires libX11 and libXext")
+        self.xlib = ctypes.CDLL(x11)
+        self.xext = ctypes.CDLL(xext)
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._declare()
+
+        self.display = None
+        self.ximage = None
+        self.shminfo = None
+        self._view = None
+
+    def _declare(self):
+        xlib, xext, libc = self.xlib, self.xext, self.libc
+        xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        xlib.XOpenDisplay.restype = ctypes.c_void_p
+        xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        xlib.XDefaultScreen.argtypes = [ctypes.c_void_p]
+        xlib.XRootWindow.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XRootWindow.restype = ctypes.c_ulong
+        xlib.XDefaultVisual.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XDefaultVisual.restype = ctypes.c_void_p
+        xlib.XDefaultDepth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XDisplayWidth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XDisplayHeight.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XDestroyImage.argtypes = [ctypes.POINTER(_XImage)]
+        xext.XShmQueryExtension.argtypes = [ctypes.c_void_p]
+        xext.XShmCreateImage.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int,
+                                         ctypes.c_char_p, ctypes.POINTER(_XShmSegmentInfo),
+                                         ctypes.c_uint, ctypes.c_uint]
+        xext.XShmCreateImage.restype = ctypes.POINTER(_XImage)
+        xext.XShmAttach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+        xext.XShmDetach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+        xext.XShmGetImage.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(_XImage),
+                                      ctypes.c_int, ctypes.c_int, ctypes.c_ulong]
+        libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+        libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        libc.shmat.restype = ctypes.c_void_p
+        libc.shmdt.argtypes = [ctypes.c_void_p]
+        libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+
+    def _open_display(self):
+        display = self.xlib.XOpenDisplay(None)
+        if not display:
+            raise Exception(f"Cannot open X display {os.environ.get('DISPLAY', '')!r}")
+        return display
+
+    def monitors(self):
+        if mss is not None:
+            with mss.mss() as sct:
+                return [dict(monitor) for monitor in sct.monitors]
+        display = self._open_display()
+        try:
+            screen = self.xlib.XDefaultScreen(display)
+            root = {"left": 0, "top": 0,
+                    "width": self.xlib.XDisplayWidth(display, screen),
+                    "height": self.xlib.XDisplayHeight(display, screen)}
+        finally:
+            self.xlib.XCloseDisplay(display)
+        return [root, dict(root)]
+
+    def open(self, area):
+        super().open(area)
+        xlib, xext, libc = self.xlib, self.xext, self.libc
+        self.display = self._open_display()
+        if not xext.XShmQueryExtension(self.display):
+            self.close()
+            raise Exception("X server does not support the MIT-SHM extension")
+
+        screen = xlib.XDefaultScreen(self.display)
+        self.root = xlib.XRootWindow(self.display, screen)
+        visual = xlib.XDefaultVisual(self.display, screen)
+        depth = xlib.XDefaultDepth(self.display, screen)
+        width, height = area["width"], area["height"]
+
+        self.shminfo = _XShmSegmentInfo()
+        self.ximage = xext.XShmCreateImage(self.display, visual, depth, self._ZPIXMAP, None,
+                                           ctypes.byref(self.shminfo), width, height)
+        if not self.ximage:
+            self.close()
+            raise Exception("XShmCreateImage failed")
+        image = self.ximage.contents
+        if image.bits_per_pixel != 32:
+            self.close()
+            raise Exception(f"Unsupported X visual: {image.bits_per_pixel} bits per pixel")
+
+        size = image.bytes_per_line * height
+        self.shminfo.shmid = libc.shmget(self._IPC_PRIVATE, size, self._IPC_CREAT | 0o600)
+        if self.shminfo.shmid < 0:
+            self.close()
+            raise Exception(f"shmget failed: {os.strerror(ctypes.get_errno())}")
+        self.shminfo.shmaddr = libc.shmat(self.shminfo.shmid, None, 0)
+        if self.shminfo.shmaddr in (None, ctypes.c_void_p(-1).value):
+            self.shminfo.shmaddr = None
+            self.close()
+            raise Exception(f"shmat failed: {os.strerror(ctypes.get_errno())}")
+        self.shminfo.readOnly = 0
+        image.data = self.shminfo.shmaddr
+
+        if not xext.XShmAttach(self.display, ctypes.byref(self.shminfo)):
+            self.close()
+            raise Exception("XShmAttach failed")
+        xlib.XSync(self.display, 0)
+        # Segment is freed automatically once both sides detach
+        libc.shmctl(self.shminfo.shmid, self._IPC_RMID, None)
+
+        buf = (ctypes.c_ubyte * size).from_address(self.shminfo.shmaddr)
+        pixels = np.frombuffer(buf, dtype=np.uint8).reshape(height, image.bytes_per_line // 4, 4)
+        self._view = pixels[:, :width]
+
+    def grab(self):
+        if not self.xext.XShmGetImage(self.display, self.root, self.ximage,
+                                      self.area["left"], self.area["top"], self._ALL_PLANES):
+            raise Exception("XShmGetImage failed")
+        # The shared segment is overwritten by the next grab
+        return self._view.copy()
+
+    def close(self):
+        self._view = None
+        if self.display:
+            if self.shminfo is not None and self.shminfo.shmaddr:
+                self.xext.XShmDetach(self.display, ctypes.byref(self.shminfo))
+                self.xlib.XSync(self.display, 0)
+            if self.ximage:
+                # The image data is the shared segment, not malloc'd memory
+                self.ximage.contents.data = None
+                self.xlib.XDestroyImage(self.ximage)
+            self.xlib.XCloseDisplay(self.display)
+        if self.shminfo is not None and self.shminfo.shmaddr:
+            self.libc.shmdt(self.shminfo.shmaddr)
+        self.display = None
+        self.ximage = None
+        self.shminfo = None
+
+
+CAPTURE_BACKENDS = {
+    MSSBackend.name: MSSBackend,
+    XShmBackend.name: XShmBackend,
+    SyntheticBackend.name: SyntheticBackend,
+}
+
+
+def create_capture_backend(name=None, **options):
+    """Instantiate a capture backend by name.
+
+    The name defaults to the FLUX_CAPTURE_BACKEND environment variable,
+    then "mss"; this is how the app picks a backend, there is no setting
+    for it in the UI.
+    """
+    name = name or os.environ.get("FLUX_CAPTURE_BACKEND") or MSSBackend.name
+    if name not in CAPTURE_BACKENDS:
+        raise ValueError(f"Unknown capture backend: {name}")
+    return CAPTURE_BACKENDS[name](**options)
+
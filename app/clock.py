@@ -0,0 +1,218 @@
+"""Monotonic timing helpers for the capture pipeline"""
+import time
+import threading
+
+
+class SessionClock:
+    """The one timeline every track of a recording session is stamped on.
+
+    Session time is seconds since `start` on the monotonic clock, with
+    paused spans removed. Pause, resume and stop are events at one
+    monotonic instant; each track maps its own capture timestamps through
+    them, so every track is cut at exactly the same point no matter how
+    often its thread looks at the clock.
+    """
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.start_time = None
+        self.stop_time = None
+        self.pauses = []            # (paused_at, resumed_at or None)
+        self._resumed = threading.Event()
+        self._resumed.set()
+
+    @property
+    def running(self):
+        return self.start_time is not None and self.stop_time is None
+
+    @property
+    def paused(self):
+        return bool(self.pauses) and self.pauses[-1][1] is None
+
+    @property
+    def paused_at(self):
+        return self.pauses[-1][0] if self.paused else None
+
+    def start(self):
+        self.start_time = self.clock()
+        self.stop_time = None
+        self.pauses = []
+        self._resumed.set()
+
+    def pause(self):
+        if self.running and not self.paused:
+            self._resumed.clear()
+            self.pauses.append((self.clock(), None))
+
+    def resume(self):
+        if self.paused:
+            self.pauses[-1] = (self.pauses[-1][0], self.clock())
+            self._resumed.set()
+
+    def wait_resumed(self, timeout=None):
+        """Block while paused; returns True once recording continues"""
+        return self._resumed.wait(timeout)
+
+    def stop(self):
+        """End the session; returns its length in seconds"""
+        if self.stop_time is None:
+            self.stop_time = self.paused_at or self.clock()
+            self._resumed.set()
+        return self.now()
+
+    def paused_before(self, timestamp):
+        """Seconds spent paused between the start and `timestamp`"""
+        total = 0.0
+        for paused_at, resumed_at in self.pauses:
+            if paused_at >= timestamp:
+                break
+            total += min(timestamp, resumed_at if resumed_at is not None else timestamp) - paused_at
+        return total
+
+    def session_time(self, timestamp):
+        """Session time of a monotonic `timestamp`; paused spans take up none"""
+        if self.stop_time is not None:
+            timestamp = min(timestamp, self.stop_time)
+        return timestamp - self.start_time - self.paused_before(timestamp)
+
+    def recorded_spans(self, begin, end):
+        """Parts of the monotonic interval [begin, end) that are recorded"""
+        begin = max(begin, self.start_time)
+        if self.stop_time is not None:
+            end = min(end, self.stop_time)
+        spans = []
+        for paused_at, resumed_at in self.pauses:
+            if begin >= end:
+                break
+            if paused_at > begin:
+                spans.append((begin, min(paused_at, end)))
+            if resumed_at is None:
+                return spans
+            begin = max(begin, resumed_at)
+        if begin < end:
+            spans.append((begin, end))
+        return spans
+
+    def now(self):
+        if self.start_time is None:
+            return 0.0
+        return max(0.0, self.session_time(self.clock()))
+
+
+class FrameScheduler:
+    """Paces capture against absolute frame deadlines on the monotonic clock.
+
+    Slot N is due at start + N / fps. Deadlines never accumulate the error of
+    previous sleeps, and a late capture is assigned the slot it actually
+    landed in. The encoder asks `repeats_for(slot)` how many times to write
+    each frame so the output always holds one frame per elapsed slot and its
+    duration matches wall-clock time.
+
+    With a `session` clock, slots are counted in session time: slot 0 is
+    the session start and pauses and the stop are the session's events,
+    so the video is cut at the same instants as every other track.
+    """
+    def __init__(self, fps, clock=time.monotonic, sleep=time.sleep, session=None):
+        self.fps = fps
+        self.interval = 1.0 / fps
+        self.clock = clock
+        self.sleep = sleep
+        self.session = session
+        self.start_time = None
+        self.stop_time = None
+        self.paused_at = None
+        self.next_slot = 0
+        self.written_slots = 0
+
+        # Counters
+        self.captured = 0
+        self.missed = 0
+        self.duplicated = 0
+        self.dropped = 0
+
+    def start(self):
+        self.start_time = self.clock() if self.session is None else self.session.start_time
+        self.stop_time = None
+        self.paused_at = None
+        self.next_slot = 0
+
+    def elapsed(self):
+        """Recorded time in seconds, excluding pauses"""
+        if self.session is not None:
+            return self.session.now()
+        if self.start_time is None:
+            return 0.0
+        now = self.stop_time or self.paused_at or self.clock()
+        return max(0.0, now - self.start_time)
+
+    def _recording(self):
+        if self.session is not None:
+            return self.session.running and not self.session.paused
+        return self.stop_time is None and self.paused_at is None
+
+    def wait(self):
+        """Sleep until the next deadline and return the slot to capture for.
+
+        Returns None if recording paused or stopped while waiting.
+        """
+        deadline = self.next_slot * self.interval
+        now = self.elapsed()
+        while now < deadline:
+            if not self._recording():
+                return None
+            self.sleep(min(deadline - now, self.interval))
+            now = self.elapsed()
+        if not self._recording():
+            return None
+
+        slot = int(now / self.interval)
+        if slot > self.next_slot:
+            self.missed += slot - self.next_slot
+        self.next_slot = slot + 1
+        self.captured += 1
+        return slot
+
+    def pause(self):
+        if self.paused_at is None:
+            self.paused_at = self.clock()
+
+    def resume(self):
+        # Shift the timeline so the paused span takes up no slots
+        if self.paused_at is not None:
+            self.start_time += self.clock() - self.paused_at
+            self.paused_at = None
+
+    def stop(self):
+        if self.stop_time is None:
+            self.stop_time = self.paused_at or self.clock()
+
+    def repeats_for(self, slot):
+        """Number of times the frame captured for `slot` should be written.
+
+        Slots skipped since the last written frame are filled by duplicating
+        this frame; a frame for a slot that is already covered is dropped.
+        """
+        if slot < self.written_slots:
+            self.dropped += 1
+            return 0
+        repeats = slot - self.written_slots + 1
+        self.duplicated += repeats - 1
+        self.written_slots = slot + 1
+        return repeats
+
+    def remaining_slots(self):
+        """Slots between the last written frame and the stop time"""
+        total = int(round(self.elapsed() / self.interval))
+        remaining = max(0, total - self.written_slots)
+        self.duplicated += remaining
+        self.written_slots += remaining
+        return remaining
+
+    def stats(self):
+        return {
+            "fps": self.fps,
+            "captured": self.captured,
+            "missed_deadlines": self.missed,
+            "written": self.written_slots,
+            "duplicated": self.duplicated,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,325 @@
+"""Picture-in-picture: the webcam composited onto the screen frame"""
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+from jobs import Job
+
+RECTANGLE = "rectangle"
+ROUNDED = "rounded"
+CIRCLE = "circle"
+
+POSITIONS = {
+    # name: (x, y) as fractions of the free space around the overlay
+    "top-left": (0.0, 0.0),
+    "top-right": (1.0, 0.0),
+    "bottom-left": (0.0, 1.0),
+    "bottom-right": (1.0, 1.0),
+}
+
+# Appended to a recording's base name for its separate webcam track
+WEBCAM_TRACK_SUFFIX = "_webcam.mp4"
+
+# Masks are drawn this many times larger and averaged down, for smooth edges
+_SUPERSAMPLE = 4
+
+
+def _shape_mask(width, height, shape, radius, inset):
+    """Coverage (0..1, float32) of `shape` inset by `inset` pixels in a width x height box"""
+    s = _SUPERSAMPLE
+    canvas = np.zeros((height * s, width * s), np.uint8)
+    x0, y0 = int(inset * s), int(inset * s)
+    x1, y1 = width * s - 1 - x0, height * s - 1 - y0
+    if x1 <= x0 or y1 <= y0:
+        return np.zeros((height, width), np.float32)
+    if shape == CIRCLE:
+        center = ((x0 + x1) // 2, (y0 + y1) // 2)
+        cv2.ellipse(canvas, center, ((x1 - x0) // 2, (y1 - y0) // 2), 0, 0, 360, 255, -1)
+    elif shape == ROUNDED and radius > inset:
+        r = int((radius - inset) * s)
+        r = min(r, (x1 - x0) // 2, (y1 - y0) // 2)
+        cv2.rectangle(canvas, (x0 + r, y0), (x1 - r, y1), 255, -1)
+        cv2.rectangle(canvas, (x0, y0 + r), (x1, y1 - r), 255, -1)
+        for cx, cy in ((x0 + r, y0 + r), (x1 - r, y0 + r), (x0 + r, y1 - r), (x1 - r, y1 - r)):
+            cv2.circle(canvas, (cx, cy), r, 255, -1)
+    else:
+        cv2.rectangle(canvas, (x0, y0), (x1, y1), 255, -1)
+    return cv2.resize(canvas, (width, height), interpolation=cv2.INTER_AREA).astype(np.float32) / 255
+
+
+class PictureInPicture:
+    """Where and how the webcam sits on the frame.
+
+    `position` is a corner name from POSITIONS or an (x, y) pair of
+    fractions; `size` is the overlay width as a fraction of the frame
+    width; `margin` keeps it off the frame edge. `shape` is RECTANGLE,
+    ROUNDED (corner `radius` as a fraction of the shorter side) or CIRCLE,
+    which crops the camera square. A `border` of `border_color` (BGR) is
+    drawn inside the shape, and `opacity` blends the whole overlay.
+
+    Everything that depends only on geometry, the ROI and the per-pixel
+    blend weights, is computed once per frame and overlay size. Per frame,
+    the fully opaque core of the camera is copied and only the strips
+    around it (edges, border, or everything when translucent) are
+    blended, in place, within the ROI.
+    """
+    def __init__(self, position="bottom-right", size=0.2, shape=RECTANGLE, radius=0.15,
+                 border=0, border_color=(255, 255, 255), opacity=1.0, margin=20):
+        if shape not in (RECTANGLE, ROUNDED, CIRCLE):
+            raise ValueError(f"Unknown overlay shape: {shape}")
+        if isinstance(position, str):
+            if position not in POSITIONS:
+                raise ValueError(f"Unknown overlay position: {position}")
+            position = POSITIONS[position]
+        self.position = position
+        self.size = size
+        self.shape = shape
+        self.radius = radius
+        self.border = border
+        self.border_color = border_color
+        self.opacity = min(max(opacity, 0.0), 1.0)
+        self.margin = margin
+        self._geometry = None
+        self._key = None
+        self._resized = None
+        self._layer = None
+
+    @property
+    def aspect(self):
+        """Width/height the camera is cropped to, or None to keep its own"""
+        return 1.0 if self.shape == CIRCLE else None
+
+    def overlay_width(self, frame_width):
+        return int(frame_width * self.size)
+
+    def overlay_size(self, frame_width, camera_width, camera_height):
+        """(width, height) of the overlay for a camera of the given size"""
+        width = self.overlay_width(frame_width)
+        return width, int(width / (self.aspect or camera_width / camera_height))
+
+    def placement(self, frame_w, frame_h, width, height):
+        """Top-left corner of a width x height overlay, or None if it does not fit"""
+        free_w = frame_w - width - 2 * self.margin
+        free_h = frame_h - height - 2 * self.margin
+        if free_w < 0 or free_h < 0:
+            return None
+        return (self.margin + int(round(free_w * self.position[0])),
+                self.margin + int(round(free_h * self.position[1])))
+
+    def masks(self, width, height):
+        """Coverage of the whole shape and of the camera inside the border"""
+        radius = self.radius * min(width, height)
+        outer = _shape_mask(width, height, self.shape, radius, 0)
+        inner = _shape_mask(width, height, self.shape, radius, self.border) if self.border else outer
+        return outer, inner
+
+    def composite(self, frame, overlay):
+        """Blend `overlay` (BGR) onto `frame` (BGR or BGRA) in place.
+
+        An overlay that is not already at overlay size is cropped and
+        resized first; one that does not fit the frame is left out.
+        """
+        h, w = frame.shape[:2]
+        overlay = self._fit(overlay, self.overlay_width(w))
+        if overlay is None:
+            return
+        oh, ow = overlay.shape[:2]
+        geometry = self._prepare(w, h, ow, oh, frame.shape[2])
+        if geometry is None:
+            return
+        (x, y), core, strips = geometry
+        roi = frame[y:y + oh, x:x + ow]
+
+        layer = overlay
+        if frame.shape[2] == 4:
+            layer = cv2.cvtColor(overlay, cv2.COLOR_BGR2BGRA, dst=self._layer)
+        if core is not None:
+            np.copyto(roi[core], layer[core])
+        for area, camera_weight, border_weight, border, scratch, background_weight, overlay_weight in strips:
+            source = layer[area]
+            if border is not None:
+                # Border colour over the camera, then the result over the screen
+                source = cv2.blendLinear(source, border, camera_weight, border_weight, dst=scratch)
+            cv2.blendLinear(roi[area], source, background_weight, overlay_weight, dst=roi[area])
+
+    def _fit(self, overlay, width):
+        if width <= 0:
+            return None
+        aspect = self.aspect
+        if overlay.shape[1] == width and (aspect is None or overlay.shape[0] == int(width / aspect)):
+            return overlay
+        oh, ow = overlay.shape[:2]
+        if aspect is not None:
+            # Centre crop to the overlay's aspect ratio
+            if ow / oh > aspect:
+                crop = int(oh * aspect)
+                overlay = overlay[:, (ow - crop) // 2:(ow - crop) // 2 + crop]
+            else:
+                crop = int(ow / aspect)
+                overlay = overlay[(oh - crop) // 2:(oh - crop) // 2 + crop]
+            oh, ow = overlay.shape[:2]
+        height = int(width / (ow / oh))
+        if self._resized is None or self._resized.shape[:2] != (height, width):
+            self._resized = np.empty((height, width, 3), np.uint8)
+        cv2.resize(overlay, (width, height), dst=self._resized, interpolation=cv2.INTER_AREA)
+        return self._resized
+
+    def _prepare(self, frame_w, frame_h, width, height, channels):
+        key = (frame_w, frame_h, width, height, channels)
+        if key == self._key:
+            return self._geometry
+        self._key = key
+        self._geometry = None
+
+        placement = self.placement(frame_w, frame_h, width, height)
+        if placement is None:
+            return None
+        self._layer = np.empty((height, width, channels), np.uint8) if channels == 4 else None
+
+        outer, inner = self.masks(width, height)
+
+        # Per pixel: screen * (1 - a * outer) + a * (camera * inner
+        # + border colour * (outer - inner)). blendLinear divides by the
+        # sum of the weights, so outside the shape the camera gets a
+        # nominal weight instead of 0/0
+        a = self.opacity
+        overlay_weight = a * outer
+        background_weight = 1 - overlay_weight
+        border_weight = outer - inner
+        camera_weight = np.where(outer > 0, inner, 1).astype(np.float32)
+
+        # Camera pixels that cover the screen completely are copied; the
+        # largest such centred rectangle is the core, and the strips
+        # around it are blended
+        core = _opaque_core((overlay_weight >= 1 - 1e-6) & (inner >= 1 - 1e-6))
+        if core is None:
+            areas = [(slice(0, height), slice(0, width))]
+        else:
+            (y0, y1), (x0, x1) = core
+            areas = [(slice(0, y0), slice(0, width)), (slice(y1, height), slice(0, width)),
+                     (slice(y0, y1), slice(0, x0)), (slice(y0, y1), slice(x1, width))]
+            core = (slice(y0, y1), slice(x0, x1))
+
+        color = tuple(self.border_color[:3]) + (255,) * (channels - 3)
+        strips = []
+        for area in _trim(areas, overlay_weight > 0, max(16, height // 8)):
+            rows, cols = area[0].stop - area[0].start, area[1].stop - area[1].start
+            border = np.full((rows, cols, channels), color, np.uint8) if self.border else None
+            strips.append((area,
+                           np.ascontiguousarray(camera_weight[area]),
+                           np.ascontiguousarray(border_weight[area]),
+                           border,
+                           np.empty_like(border) if self.border else None,
+                           np.ascontiguousarray(background_weight[area]),
+                           np.ascontiguousarray(overlay_weight[area])))
+        self._geometry = (placement, core, strips)
+        return self._geometry
+
+
+def _trim(areas, visible, band):
+    """Split `areas` into bands of `band` rows, each cut to its `visible` columns"""
+    for rows, cols in areas:
+        for top in range(rows.start, rows.stop, band):
+            bottom = min(top + band, rows.stop)
+            columns = np.nonzero(visible[top:bottom, cols].any(axis=0))[0]
+            if len(columns):
+                yield slice(top, bottom), slice(cols.start + columns[0], cols.start + columns[-1] + 1)
+
+
+def _opaque_core(opaque):
+    """(rows, cols) of the largest centred rectangle inside `opaque`, or None"""
+    height, width = opaque.shape
+    best, best_area = None, 0
+    # Opaque span [left, right) of each row around the centre column
+    centre = width // 2
+    left = np.full(height, centre + 1)
+    right = np.full(height, centre)
+    for y in np.nonzero(opaque[:, centre])[0]:
+        row = opaque[y]
+        gaps_left = np.nonzero(~row[:centre])[0]
+        gaps_right = np.nonzero(~row[centre:])[0]
+        left[y] = gaps_left[-1] + 1 if len(gaps_left) else 0
+        right[y] = centre + gaps_right[0] if len(gaps_right) else width
+    for top in range(height // 2):
+        bottom = height - top
+        x0, x1 = left[top:bottom].max(), right[top:bottom].min()
+        area = (bottom - top) * (x1 - x0)
+        if x1 > x0 and area > best_area:
+            best, best_area = ((top, bottom), (int(x0), int(x1))), area
+    return best
+
+
+def webcam_track_path(video_path):
+    """Where the separate webcam track of `video_path` is recorded"""
+    base_name, _ = os.path.splitext(video_path)
+    return base_name + WEBCAM_TRACK_SUFFIX
+
+
+def _video_size(path):
+    capture = cv2.VideoCapture(path)
+    try:
+        width, height = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    finally:
+        capture.release()
+    if not width or not height:
+        raise Exception(f"Could not read {os.path.basename(path)}")
+    return width, height
+
+
+def composite_job(video_path, camera_path, layout, output=None):
+    """Job compositing a recorded webcam track onto its screen recording.
+
+    Both were written on the session clock from slot 0, so frame n of
+    one belongs with frame n of the other. `layout` (a PictureInPicture)
+    is drawn by ffmpeg from the same masks the live compositor uses,
+    saved as images next to the output; the screen's audio is copied.
+    """
+    frame_w, frame_h = _video_size(video_path)
+    camera_w, camera_h = _video_size(camera_path)
+    width, height = layout.overlay_size(frame_w, camera_w, camera_h)
+    placement = layout.placement(frame_w, frame_h, width, height)
+    if placement is None:
+        raise Exception("The webcam overlay does not fit the recording")
+    x, y = placement
+
+    crop = ""
+    if layout.aspect is not None:
+        crop_w = min(camera_w, int(camera_h * layout.aspect))
+        crop_h = min(camera_h, int(camera_w / layout.aspect))
+        crop = f"crop={crop_w}:{crop_h},"
+
+    # Camera alpha, and the border as its own translucent layer on top
+    outer, inner = layout.masks(width, height)
+    alpha = np.round(255 * layout.opacity * inner).astype(np.uint8)
+    border = np.zeros((height, width, 4), np.uint8)
+    border[:, :, :3] = layout.border_color[:3]
+    border[:, :, 3] = np.round(255 * layout.opacity * (outer - inner))
+    folder = os.path.dirname(os.path.abspath(video_path))
+    mask_files = []
+    for image in (alpha, border):
+        fd, path = tempfile.mkstemp(suffix=".png", dir=folder)
+        os.close(fd)
+        cv2.imwrite(path, image)
+        mask_files.append(path)
+
+    if output is None:
+        base_name, ext = os.path.splitext(video_path)
+        output = f"{base_name}_pip{ext}"
+    graph = (f"[1:v]{crop}scale={width}:{height},format=rgba[camera];"
+             f"[2:v]format=gray[alpha];"
+             f"[camera][alpha]alphamerge=shortest=1[overlay];"
+             f"[0:v][overlay]overlay={x}:{y}:eof_action=pass[framed];"
+             f"[framed][3:v]overlay={x}:{y}:shortest=1,format=yuv420p[video]")
+    # The masks are still images, looped to last as long as the video;
+    # `shortest` ends each merge with its video instead of the loop
+    args = ['-i', video_path, '-i', camera_path,
+            '-loop', '1', '-i', mask_files[0], '-loop', '1', '-i', mask_files[1],
+            '-filter_complex', graph,
+            '-map', '[video]', '-map', '0:a?',
+            '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '20',
+            '-c:a', 'copy',
+            '-y', output]
+    return Job("composite", f"Compositing webcam into {os.path.basename(video_path)}", args,
+               output=output, temp_files=mask_files)
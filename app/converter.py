@@ -0,0 +1,110 @@
+"""Frame conversion and scaling into pooled buffers"""
+import cv2
+import numpy as np
+
+from compositor import PictureInPicture
+
+# Raw pixel formats an encoder can accept, named as ffmpeg names them
+BGR24 = "bgr24"
+BGRA = "bgra"
+YUV420P = "yuv420p"
+
+
+def frame_shape(pixel_format, width, height):
+    """Array shape of one raw frame in `pixel_format`"""
+    if pixel_format == BGR24:
+        return (height, width, 3)
+    elif pixel_format == BGRA:
+        return (height, width, 4)
+    elif pixel_format == YUV420P:
+        # Planar I420: full-size Y plane followed by quarter-size U and V
+        return (height * 3 // 2, width)
+    raise ValueError(f"Unsupported pixel format: {pixel_format}")
+
+
+def bgra_to_i420(bgra, dst=None):
+    """Vectorized BGRA -> planar I420 (yuv420p), 1.5 bytes per pixel instead of 4"""
+    return cv2.cvtColor(bgra, cv2.COLOR_BGRA2YUV_I420, dst=dst)
+
+
+class FrameConverter:
+    """Converts captured BGRA frames to the encoder's pixel format without allocating.
+
+    Output frames come from `pool`; every OpenCV call writes through `dst=`
+    into a buffer that was allocated once for the capture geometry. With
+    BGRA output and no scaling the captured buffer itself is passed through.
+    The webcam is composited by `pip` (a PictureInPicture).
+    """
+    def __init__(self, pool, capture_size, output_size, pixel_format=BGR24, pip=None):
+        if pixel_format == YUV420P and (output_size[0] % 2 or output_size[1] % 2):
+            raise ValueError("yuv420p output needs even dimensions")
+        self.pool = pool
+        self.capture_size = capture_size    # (width, height)
+        self.output_size = output_size      # (width, height)
+        self.pixel_format = pixel_format
+        self.pip = pip or PictureInPicture()
+
+        # Dropping an odd last row/column is a crop, not a rescale
+        self.cropped = (capture_size != output_size
+                        and 0 <= capture_size[0] - output_size[0] <= 1
+                        and 0 <= capture_size[1] - output_size[1] <= 1)
+        self.scaled = capture_size != output_size and not self.cropped
+
+        # Scratch for the intermediate image the overlay is drawn on, when
+        # it is neither the captured buffer nor the pooled output
+        self._scratch = None
+        if self.scaled and pixel_format == BGR24:
+            width, height = capture_size
+            self._scratch = np.empty((height, width, 3), np.uint8)
+        elif self.scaled and pixel_format == YUV420P:
+            width, height = output_size
+            self._scratch = np.empty((height, width, 4), np.uint8)
+
+    def convert(self, bgra, web_frame=None):
+        """BGRA capture -> frame at output size in the output pixel format"""
+        if self.cropped:
+            bgra = bgra[:self.output_size[1], :self.output_size[0]]
+
+        if self.pixel_format == BGR24:
+            out = self.pool.acquire()
+            if self.scaled:
+                cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=self._scratch)
+                cv2.resize(self._scratch, self.output_size, dst=out, interpolation=cv2.INTER_AREA)
+            else:
+                cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=out)
+            self.overlay(out, web_frame)
+            return out
+
+        if self.pixel_format == BGRA:
+            if self.scaled:
+                out = self.pool.acquire()
+                cv2.resize(bgra, self.output_size, dst=out, interpolation=cv2.INTER_AREA)
+            elif (web_frame is not None and not bgra.flags.writeable) or not bgra.flags.c_contiguous:
+                out = self.pool.acquire()
+                np.copyto(out, bgra)
+            else:
+                # Straight through: the encoder reads the captured buffer
+                out = bgra
+            self.overlay(out, web_frame)
+            return out
+
+        # yuv420p: scale and overlay in BGRA, then one planar conversion
+        if self.scaled:
+            cv2.resize(bgra, self.output_size, dst=self._scratch, interpolation=cv2.INTER_AREA)
+            image = self._scratch
+        else:
+            image = bgra
+            if web_frame is not None and not bgra.flags.writeable:
+                if self._scratch is None:
+                    self._scratch = np.empty(bgra.shape, np.uint8)
+                np.copyto(self._scratch, bgra)
+                image = self._scratch
+        self.overlay(image, web_frame)
+        out = self.pool.acquire()
+        bgra_to_i420(image, dst=out)
+        return out
+
+    def overlay(self, frame, web_frame):
+        """Composite the webcam frame, if any, onto `frame` in place"""
+        if web_frame is not None:
+            self.pip.composite(frame, web_frame)
@@ -0,0 +1,425 @@
+"""Video encoder backends: ffmpeg subprocess pipe and cv2.VideoWriter"""
+import os
+import socket
+import time
+import logging
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from pipeline import QueueClosed
+from ffmpeg_runner import get_runner
+
+
+class VideoEncoder:
+    """Base class for encoders fed one raw frame at a time"""
+    name = None
+    input_format = "bgr24"
+
+    def __init__(self, filename, width, height, fps):
+        self.filename = filename
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frames_written = 0
+
+    def open(self):
+        raise NotImplementedError
+
+    def write(self, frame):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+
+class OpenCVEncoder(VideoEncoder):
+    """cv2.VideoWriter with a FOURCC codec (mp4v, XVID, ...)"""
+    name = "opencv"
+
+    def __init__(self, filename, width, height, fps, fourcc="mp4v"):
+        super().__init__(filename, width, height, fps)
+        self.fourcc = fourcc
+        self.writer = None
+
+    def open(self):
+        self.writer = cv2.VideoWriter(
+            self.filename,
+            cv2.VideoWriter_fourcc(*self.fourcc),
+            self.fps,
+            (self.width, self.height)
+        )
+        if not self.writer.isOpened():
+            raise Exception(f"Failed to open video writer with codec {self.fourcc}")
+
+    def write(self, frame):
+        self.writer.write(frame)
+        self.frames_written += 1
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+
+
+class FFmpegEncoder(VideoEncoder):
+    """Pipes raw frames into an ffmpeg subprocess's stdin.
+
+    The codec, preset, CRF and thread count are passed straight to ffmpeg;
+    preset and CRF are only used for the x264/x265 encoders that accept
+    them. `threads=0` lets the encoder pick a thread count.
+
+    `input_format` is the raw layout written to the pipe: "bgr24", "bgra"
+    (the captured buffer as-is) or "yuv420p" (converted in-process, 62%
+    less pipe traffic than bgra).
+
+    `fragment_seconds` makes the output crash-safe: MP4 is written as
+    fragments (an empty moov up front, one moof per fragment) and MKV
+    clusters are closed at that interval, each starting on a keyframe.
+    A killed process then leaves a file playable up to the last fragment.
+
+    `audio_feeds` (audio.AudioFeed objects, one per track) add live PCM
+    inputs, muxed into the same file, so no merge pass is needed after
+    recording. ffmpeg reads each from a loopback TCP connection, since
+    stdin already carries video.
+    """
+    name = "ffmpeg"
+    CRF_CODECS = ("libx264", "libx265")
+    AUDIO_CLOSE_TIMEOUT = 5.0
+
+    def __init__(self, filename, width, height, fps, codec="libx264", preset="veryfast", crf=23, threads=0,
+                 pix_fmt="yuv420p", input_format="bgr24", fragment_seconds=None, audio_feeds=(),
+                 audio_codec="aac", audio_bitrate="192k", audio_filter=None, ffmpeg_exe=None):
+        super().__init__(filename, width, height, fps)
+        self.input_format = input_format
+        self.fragment_seconds = fragment_seconds
+        self.audio_feeds = list(audio_feeds)
+        self.audio_codec = audio_codec
+        self.audio_bitrate = audio_bitrate
+        self.audio_filter = audio_filter
+        self._audio_servers = []
+        self._audio_threads = []
+        self.codec = codec
+        self.preset = preset
+        self.crf = crf
+        self.threads = threads
+        self.pix_fmt = pix_fmt
+        self.runner = get_runner(ffmpeg_exe)
+        self.ffmpeg_exe = self.runner.path
+        self.proc = None
+        self._stderr_tail = deque(maxlen=20)
+        self._stderr_thread = None
+
+    def input_args(self):
+        args = [
+            '-f', 'rawvideo',
+            '-pix_fmt', self.input_format,
+            '-s', f"{self.width}x{self.height}",
+            '-framerate', str(self.fps),
+            '-i', 'pipe:0',
+        ]
+        if self._audio_servers:
+            # Raw inputs need no probing; without this ffmpeg buffers a few
+            # MB of video before it even connects to the audio input
+            probe = ['-probesize', '32', '-analyzeduration', '0']
+            args = ['-thread_queue_size', '64'] + probe + args
+            for feed, server in zip(self.audio_feeds, self._audio_servers):
+                port = server.getsockname()[1]
+                args += ['-thread_queue_size', '1024'] + probe + [
+                    '-f', feed.sample_format, '-ar', str(feed.rate), '-ac', str(feed.channels),
+                    '-i', f"tcp://127.0.0.1:{port}",
+                ]
+        return args
+
+    def audio_args(self):
+        if not self._audio_servers:
+            return ['-an']
+        args = ['-map', '0:v:0']
+        for index in range(len(self._audio_servers)):
+            args += ['-map', f'{index + 1}:a:0']
+        args += ['-c:a', self.audio_codec, '-b:a', self.audio_bitrate]
+        if self.audio_filter:
+            args += ['-filter:a', self.audio_filter]
+        return args
+
+    def output_args(self):
+        args = self.audio_args() + ['-c:v', self.codec]
+        if self.codec in self.CRF_CODECS:
+            args += ['-preset', self.preset, '-crf', str(self.crf)]
+        args += ['-threads', str(self.threads), '-pix_fmt', self.pix_fmt]
+        if self.pix_fmt == "yuv420p" and (self.width % 2 or self.height % 2):
+            # 4:2:0 chroma needs even dimensions
+            args += ['-vf', 'crop=trunc(iw/2)*2:trunc(ih/2)*2']
+        args += self.fragment_args()
+        return args
+
+    def fragment_args(self):
+        if not self.fragment_seconds:
+            return []
+        # A keyframe at every fragment boundary so each fragment decodes
+        # alone, and no output buffering so a finished fragment is on disk
+        args = ['-g', str(max(1, round(self.fps * self.fragment_seconds))), '-flush_packets', '1']
+        ext = os.path.splitext(self.filename)[1].lower()
+        if ext in (".mp4", ".mov", ".m4v"):
+            args += ['-movflags', '+frag_keyframe+empty_moov+default_base_moof',
+                     '-frag_duration', str(int(self.fragment_seconds * 1_000_000))]
+        elif ext in (".mkv", ".webm"):
+            args += ['-cluster_time_limit', str(int(self.fragment_seconds * 1000))]
+        return args
+
+    def args(self):
+        return self.input_args() + self.output_args() + ['-y', self.filename]
+
+    def command(self):
+        return self.runner.command(self.args())
+
+    def open(self):
+        self.runner.require()
+        if self.runner.encoders and self.codec not in self.runner.encoders:
+            raise Exception(f"FFmpeg has no {self.codec} encoder")
+        try:
+            for _ in self.audio_feeds:
+                server = socket.create_server(("127.0.0.1", 0))
+                server.settimeout(0.5)
+                self._audio_servers.append(server)
+            logging.info(f"Starting encoder: {' '.join(self.command())}")
+            self.proc = self.runner.popen(
+                self.args(),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE
+            )
+        except Exception:
+            # The caller falls back to another encoder; don't leave ports listening
+            for server in self._audio_servers:
+                server.close()
+            self._audio_servers = []
+            raise
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
+        self._stderr_thread.start()
+        for feed, server in zip(self.audio_feeds, self._audio_servers):
+            thread = threading.Thread(target=self._pump_audio, args=(feed, server), daemon=True)
+            thread.start()
+            self._audio_threads.append(thread)
+
+    def _pump_audio(self, feed, server):
+        """Send queued PCM to one of ffmpeg's audio inputs until the feed is closed"""
+        conn = None
+        try:
+            # ffmpeg connects once it has opened the inputs before this one
+            while conn is None and self.proc.poll() is None:
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    continue
+            if conn is None:
+                return
+            while True:
+                try:
+                    block = feed.queue.get(timeout=0.5)
+                except QueueClosed:
+                    break
+                if block is not None:
+                    conn.sendall(block)
+        except OSError as e:
+            logging.error(f"Audio input to encoder failed: {e}")
+        finally:
+            if conn is not None:
+                conn.close()
+            server.close()
+
+    def _drain_stderr(self):
+        for line in self.proc.stderr:
+            self._stderr_tail.append(line.decode(errors="replace").rstrip())
+
+    def error_output(self):
+        return "\n".join(self._stderr_tail)
+
+    def write(self, frame):
+        if not frame.flags.c_contiguous:
+            frame = frame.copy()
+        try:
+            self.proc.stdin.write(memoryview(frame))
+        except (BrokenPipeError, OSError):
+            self.proc.wait()
+            raise Exception(f"FFmpeg encoder exited: {self.error_output()}")
+        self.frames_written += 1
+
+    def close(self):
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        # The audio thread closes the feeds once it has delivered audio up
+        # to the session's stop time; don't wait forever for it
+        deadline = time.monotonic() + self.AUDIO_CLOSE_TIMEOUT
+        for thread in self._audio_threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        for feed, thread in zip(self.audio_feeds, self._audio_threads):
+            feed.queue.close()
+            thread.join()
+        returncode = self.proc.wait()
+        if self._stderr_thread:
+            self._stderr_thread.join(1)
+        self.proc = None
+        if returncode != 0:
+            raise Exception(f"FFmpeg encoder failed ({returncode}): {self.error_output()}")
+
+
+def transcode_segment(ffmpeg_exe, source, target, codec, preset, crf, threads, pix_fmt):
+    """Process-pool job: encode one spooled segment at final quality"""
+    args = ['-i', source, '-an', '-c:v', codec]
+    if codec in FFmpegEncoder.CRF_CODECS:
+        args += ['-preset', preset, '-crf', str(crf)]
+    args += ['-threads', str(threads), '-pix_fmt', pix_fmt, '-y', target]
+    # Each worker process resolves its runner once, for all its segments
+    result = get_runner(ffmpeg_exe).run(args)
+    if result.returncode != 0:
+        raise Exception(f"Segment encode failed for {os.path.basename(source)}: {result.stderr.strip()}")
+    os.remove(source)
+    return target
+
+
+class SegmentedEncoder(VideoEncoder):
+    """Rolling segments encoded in parallel by a process pool.
+
+    Capture writes fixed-duration chunks through a cheap lossless x264
+    spool encoder. Each finished chunk is handed to a worker process that
+    encodes it at the final settings, so the expensive encode scales with
+    core count instead of running in one stream. At close the segments are
+    concatenated with stream copy into `filename`. Finished chunks are
+    complete files on disk, so a crash only loses the open one.
+    """
+    name = "segmented"
+    SPOOL_SETTINGS = {"codec": "libx264", "preset": "ultrafast", "crf": 0}
+
+    def __init__(self, filename, width, height, fps, settings, segment_seconds=30, workers=None):
+        super().__init__(filename, width, height, fps)
+        self.settings = dict(settings)
+        self.input_format = self.settings.get("input_format", "bgr24")
+        self.segment_frames = max(1, int(segment_seconds * fps))
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.ffmpeg_exe = get_runner(self.settings.pop("ffmpeg_exe", None)).path
+        base, self.ext = os.path.splitext(filename)
+        self.segment_base = base
+        self.segments = []
+        self.futures = []
+        self.pool = None
+        self.spool = None
+        self.segment_written = 0
+
+    def segment_path(self, index, spool=False):
+        suffix = ".spool.mkv" if spool else self.ext
+        return f"{self.segment_base}.seg{index:04d}{suffix}"
+
+    def open(self):
+        if not self.ffmpeg_exe:
+            raise Exception("FFmpeg not found")
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            self._start_segment()
+        except Exception:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+            self.spool = None
+            raise
+
+    def _start_segment(self):
+        index = len(self.segments)
+        spool_path = self.segment_path(index, spool=True)
+        self.spool = FFmpegEncoder(spool_path, self.width, self.height, self.fps,
+                                   input_format=self.input_format, ffmpeg_exe=self.ffmpeg_exe,
+                                   **self.SPOOL_SETTINGS)
+        self.spool.open()
+        self.segments.append(self.segment_path(index))
+        self.segment_written = 0
+
+    def _finish_segment(self):
+        spool_path = self.spool.filename
+        self.spool.close()
+        self.spool = None
+        # Leave the remaining cores to the capture pipeline and other workers
+        threads = max(1, (os.cpu_count() or 2) // self.workers)
+        self.futures.append(self.pool.submit(
+            transcode_segment, self.ffmpeg_exe, spool_path, self.segments[-1],
+            self.settings.get("codec", "libx264"), self.settings.get("preset", "veryfast"),
+            self.settings.get("crf", 23), self.settings.get("threads") or threads,
+            self.settings.get("pix_fmt", "yuv420p")
+        ))
+
+    def write(self, frame):
+        if self.segment_written >= self.segment_frames:
+            self._finish_segment()
+            self._start_segment()
+        self.spool.write(frame)
+        self.segment_written += 1
+        self.frames_written += 1
+
+    def pending_segments(self):
+        return sum(1 for future in self.futures if not future.done())
+
+    def close(self):
+        if self.pool is None:
+            return
+        try:
+            if self.spool is not None:
+                self._finish_segment()
+            # Surface the first worker failure, after all jobs have finished
+            errors = [future.exception() for future in self.futures]
+            errors = [e for e in errors if e is not None]
+            if errors:
+                raise Exception(f"{len(errors)} segment(s) failed to encode: {errors[0]}")
+            self._concat()
+        finally:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+
+    def _concat(self):
+        list_path = f"{self.segment_base}.segments.txt"
+        with open(list_path, "w", encoding="utf-8") as f:
+            for segment in self.segments:
+                # Concat demuxer syntax: single quotes escaped as '\''
+                escaped = os.path.abspath(segment).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        result = get_runner(self.ffmpeg_exe).run(
+            ['-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy', '-y', self.filename])
+        if result.returncode != 0:
+            raise Exception(f"Segment concat failed, segments kept: {result.stderr.strip()}")
+        os.remove(list_path)
+        for segment in self.segments:
+            os.remove(segment)
+
+
+def create_encoder(filename, width, height, fps, settings=None, fourcc="mp4v", segment_seconds=None, audio_feeds=()):
+    """Open an encoder for `settings`, falling back to cv2.VideoWriter.
+
+    `settings` holds FFmpegEncoder options (codec, preset, crf, threads);
+    None selects cv2.VideoWriter with `fourcc` directly. `segment_seconds`
+    switches to rolling segments encoded by a process pool. `audio_feeds`
+    are muxed live by FFmpegEncoder; any other encoder detaches them so
+    the audio is written to fallback WAVs for a merge after recording.
+    """
+    if settings is not None:
+        if segment_seconds:
+            encoder = SegmentedEncoder(filename, width, height, fps, settings, segment_seconds)
+        else:
+            encoder = FFmpegEncoder(filename, width, height, fps, audio_feeds=audio_feeds, **settings)
+        try:
+            encoder.open()
+            if encoder.name != FFmpegEncoder.name:
+                for feed in audio_feeds:
+                    feed.detach()
+            return encoder
+        except Exception as e:
+            logging.warning(f"FFmpeg encoder unavailable, falling back to cv2.VideoWriter: {e}")
+
+    for feed in audio_feeds:
+        feed.detach()
+    encoder = OpenCVEncoder(filename, width, height, fps, fourcc)
+    encoder.open()
+    return encoder
@@ -0,0 +1,138 @@
+"""The ffmpeg binary: located, probed and run through one shared runner"""
+import os
+import re
+import shutil
+import logging
+import threading
+import subprocess
+
+_VERSION_RE = re.compile(r"version\s+n?(\d+)\.(\d+)(?:\.(\d+))?")
+
+
+def hidden_startupinfo():
+    """Hide the console window of child processes on Windows"""
+    if os.name != 'nt':
+        return None
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    return startupinfo
+
+
+def locate_ffmpeg():
+    """Locate an ffmpeg executable: the imageio-ffmpeg binary, then PATH"""
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return shutil.which("ffmpeg")
+
+
+class FFmpegRunner:
+    """One ffmpeg executable and what it can do, looked up once.
+
+    The version and the list of encoders are probed on first use (or by
+    `probe` ahead of time) and cached for the process. Every ffmpeg
+    invocation goes through `popen` or `run`, which add the common flags
+    and hide the console window on Windows.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._version = None
+        self._encoders = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return self.path is not None
+
+    def require(self):
+        if not self.available:
+            raise Exception("FFmpeg not found")
+        return self
+
+    def command(self, args, loglevel="error"):
+        """Full command line for ffmpeg `args`; loglevel None keeps the default output"""
+        cmd = [self.require().path, '-hide_banner', '-nostdin']
+        if loglevel:
+            cmd += ['-loglevel', loglevel]
+        return cmd + list(args)
+
+    def popen(self, args, loglevel="error", **kwargs):
+        """Start ffmpeg with `args`; keyword arguments go to subprocess.Popen"""
+        return subprocess.Popen(self.command(args, loglevel), startupinfo=hidden_startupinfo(), **kwargs)
+
+    def run(self, args, loglevel="error", text=True):
+        """Run ffmpeg to completion; returns the CompletedProcess, with text output unless `text` is False"""
+        return subprocess.run(self.command(args, loglevel), capture_output=True, text=text,
+                              startupinfo=hidden_startupinfo())
+
+    def probe(self):
+        """Read the version and encoders, unless already known"""
+        with self._lock:
+            if self._encoders is not None or not self.available:
+                return self
+            try:
+                self._version = self._parse_version(self.run(['-version']).stdout)
+                self._encoders = self._parse_names(self.run(['-encoders']).stdout, "V", "A", "S")
+                logging.info(f"FFmpeg {'.'.join(map(str, self._version or ()))} at {self.path}: "
+                             f"{len(self._encoders)} encoders")
+            except OSError as e:
+                logging.error(f"FFmpeg probe failed: {e}")
+                self._encoders = set()
+        return self
+
+    @staticmethod
+    def _parse_version(text):
+        match = _VERSION_RE.search(text)
+        return tuple(int(part) for part in match.groups() if part is not None) if match else None
+
+    @staticmethod
+    def _parse_names(text, *kinds):
+        # " V....D libx264   ..." below a "------" rule
+        names = set()
+        listing = False
+        for line in text.splitlines():
+            parts = line.split()
+            if not listing:
+                listing = bool(parts) and set(parts[0]) == {"-"}
+                continue
+            if len(parts) >= 2 and any(kind in parts[0] for kind in kinds):
+                names.update(parts[1].split(","))
+        return names
+
+    @property
+    def encoders(self):
+        return self.probe()._encoders or set()
+
+    def has_encoder(self, name):
+        return name in self.encoders
+
+
+_runners = {}
+_runners_lock = threading.Lock()
+_located = []   # The path found by locate_ffmpeg, once looked up
+
+
+def resolve_ffmpeg(path):
+    """Absolute, normalized path of the executable `path` (a path or a name on PATH)"""
+    resolved = shutil.which(path) or path
+    return os.path.normcase(os.path.realpath(resolved))
+
+
+def get_runner(path=None):
+    """The shared runner for `path`, or for the ffmpeg found by `locate_ffmpeg`.
+
+    Runners are keyed by the resolved executable, so however a path is
+    spelled, each ffmpeg is probed once.
+    """
+    with _runners_lock:
+        if path is None:
+            if not _located:
+                _located.append(locate_ffmpeg())
+            path = _located[0]
+        key = resolve_ffmpeg(path) if path else None
+        runner = _runners.get(key)
+        if runner is None:
+            runner = FFmpegRunner(key)
+            _runners[key] = runner
+        return runner
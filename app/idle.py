@@ -0,0 +1,124 @@
+"""Idle span detection: silent, static stretches of a recording, and cutting them out"""
+import os
+
+import numpy as np
+
+from jobs import Job
+
+
+class ActivityTimeline:
+    """Sound and screen activity of a session on a grid of session time.
+
+    The audio thread marks sound (audio.VoiceActivityDetector) and the
+    capture pipeline marks screen changes, each in its own array so no
+    lock is needed. `idle_spans` then finds the stretches where neither
+    happened.
+    """
+    def __init__(self, resolution=0.1, min_change=0.002):
+        self.resolution = resolution
+        # Changed-tile ratio below which a frame counts as static (a
+        # blinking caret or ticking clock)
+        self.min_change = min_change
+        self._audio = np.zeros(4096, np.bool_)
+        self._video = np.zeros(4096, np.bool_)
+        self.audio_end = 0      # Cells covered by audio so far
+        self.video_end = 0      # Cells covered by video so far
+
+    @staticmethod
+    def _grow(cells, size):
+        if size <= len(cells):
+            return cells
+        grown = np.zeros(max(size, len(cells) * 2), np.bool_)
+        grown[:len(cells)] = cells
+        return grown
+
+    def mark_video(self, timestamp, ratio):
+        """A frame at session time `timestamp` with `ratio` of its tiles changed"""
+        cell = int(timestamp / self.resolution)
+        self._video = self._grow(self._video, cell + 1)
+        if ratio >= self.min_change:
+            self._video[cell] = True
+        self.video_end = max(self.video_end, cell + 1)
+
+    def mark_audio(self, start, active, frame_seconds):
+        """Activity of consecutive audio frames starting at session time `start`"""
+        cells = ((start + np.arange(len(active)) * frame_seconds) / self.resolution).astype(np.intp)
+        self._audio = self._grow(self._audio, int(cells[-1]) + 1)
+        self._audio[cells[active]] = True
+        self.audio_end = max(self.audio_end, int(cells[-1]) + 1)
+
+    @property
+    def duration(self):
+        return max(self.audio_end, self.video_end) * self.resolution
+
+    def idle_spans(self, min_idle=3.0, padding=0.5):
+        """(start, end) session times of idle stretches of at least `min_idle` seconds.
+
+        `padding` seconds are kept around any activity, so a cut never
+        clips the start or tail of a sentence.
+        """
+        size = max(self.audio_end, self.video_end)
+        if not size:
+            return []
+        active = self._audio[:size] | self._video[:size]
+
+        # Widen activity by `padding` on both sides with a running count
+        pad = int(round(padding / self.resolution))
+        counts = np.concatenate([[0], np.cumsum(active)])
+        index = np.arange(size)
+        near = counts[np.minimum(size, index + pad + 1)] - counts[np.maximum(0, index - pad)]
+        idle = near == 0
+
+        edges = np.diff(np.concatenate([[0], idle.astype(np.int8), [0]]))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        long_enough = (ends - starts) * self.resolution >= min_idle
+        return [(round(float(start * self.resolution), 3), round(float(end * self.resolution), 3))
+                for start, end in zip(starts[long_enough], ends[long_enough])]
+
+
+def kept_spans(idle_spans, duration):
+    """The complement of `idle_spans` within [0, duration]"""
+    kept = []
+    position = 0.0
+    for start, end in idle_spans:
+        if start > position:
+            kept.append((position, start))
+        position = max(position, end)
+    if duration > position:
+        kept.append((position, duration))
+    return kept
+
+
+def idle_cut_job(video_path, idle_spans, duration, has_audio=True, exact=True):
+    """Job writing `<name>_condensed<ext>` without the idle spans.
+
+    `exact` cuts at the span boundaries by re-encoding through select
+    filters. Otherwise the kept parts are stream-copied with the concat
+    demuxer, which is lossless and fast, but every part starts at the
+    keyframe before it, so less idle time is removed.
+    """
+    base, ext = os.path.splitext(video_path)
+    output = f"{base}_condensed{ext}"
+    kept = kept_spans(idle_spans, duration)
+    kept_seconds = sum(end - start for start, end in kept)
+    description = f"Cutting idle time from {os.path.basename(video_path)}"
+
+    if exact:
+        condition = "+".join(f"between(t,{start:.3f},{end:.3f})" for start, end in kept)
+        args = ['-i', video_path, '-map', '0:v:0',
+                '-vf', f"select='{condition}',setpts=N/FRAME_RATE/TB",
+                '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23', '-pix_fmt', 'yuv420p']
+        if has_audio:
+            args += ['-map', '0:a', '-af', f"aselect='{condition}',asetpts=N/SR/TB",
+                     '-c:a', 'aac', '-b:a', '192k']
+        args += ['-y', output]
+        return Job("cut", description, args, output=output, duration=kept_seconds)
+
+    list_path = f"{base}.cut.txt"
+    escaped = os.path.abspath(video_path).replace("'", "'\\''")
+    with open(list_path, "w", encoding="utf-8") as f:
+        for start, end in kept:
+            f.write(f"file '{escaped}'\ninpoint {start:.3f}\noutpoint {end:.3f}\n")
+    args = ['-f', 'concat', '-safe', '0', '-i', list_path, '-map', '0', '-c', 'copy', '-y', output]
+    return Job("cut", description, args, output=output, duration=kept_seconds, temp_files=[list_path])
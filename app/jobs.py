@@ -0,0 +1,194 @@
+"""Background post-processing: ffmpeg jobs with progress and cancellation"""
+import os
+import re
+import logging
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from ffmpeg_runner import get_runner
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+_DURATION_RE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+
+
+def parse_timestamp(hours, minutes, seconds):
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+class Job:
+    """One ffmpeg run, plus an optional step that finishes it off.
+
+    `args` are the ffmpeg arguments after the executable; `output` is
+    removed if the job fails or is cancelled. `duration` (seconds of
+    output) turns ffmpeg's progress into a percentage; when omitted it is
+    read from the first input's "Duration:" line. `finalize` runs on the
+    worker after ffmpeg succeeds, e.g. to replace the source file.
+    `temp_files` (e.g. a concat list) are removed once the job ends.
+    """
+    _ids = 0
+
+    def __init__(self, kind, description, args, output=None, duration=None, finalize=None, temp_files=()):
+        Job._ids += 1
+        self.id = Job._ids
+        self.kind = kind
+        self.description = description
+        self.args = args
+        self.output = output
+        self.duration = duration
+        self.finalize = finalize
+        self.temp_files = list(temp_files)
+        self.state = QUEUED
+        self.progress = 0.0     # 0..100
+        self.error = None
+        self.proc = None
+        self.cancelled = threading.Event()
+
+    @property
+    def finished(self):
+        return self.state in (DONE, FAILED, CANCELLED)
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.kind} {self.state} {self.progress:.0f}%>"
+
+
+class JobQueue:
+    """Runs jobs as ffmpeg processes, at most `max_workers` at a time.
+
+    Each ffmpeg runs in its own process and is supervised by a worker
+    thread, so nothing blocks the caller. `listener(job)` is called from
+    the worker threads on every state change and whole-percent progress
+    step; a Qt caller forwards it through a signal to the UI thread.
+    """
+    def __init__(self, max_workers=2, listener=None, ffmpeg_exe=None):
+        self.max_workers = max_workers
+        self.listener = listener
+        self.runner = get_runner(ffmpeg_exe)
+        self.jobs = []
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+
+    def submit(self, job):
+        self.runner.require()
+        with self._lock:
+            self.jobs.append(job)
+        self._notify(job)
+        self._executor.submit(self._run, job)
+        return job
+
+    def cancel(self, job):
+        """Cancel a queued job, or stop a running one and discard its output"""
+        job.cancelled.set()
+        proc = job.proc
+        if proc is not None and proc.poll() is None:
+            proc.terminate()
+
+    def active(self):
+        with self._lock:
+            return [job for job in self.jobs if not job.finished]
+
+    def shutdown(self, cancel=True):
+        if cancel:
+            for job in self.active():
+                self.cancel(job)
+        self._executor.shutdown(wait=True)
+
+    def _notify(self, job):
+        if self.listener:
+            try:
+                self.listener(job)
+            except Exception as e:
+                logging.error(f"Job listener failed: {e}")
+
+    def _run(self, job):
+        if job.cancelled.is_set():
+            job.state = CANCELLED
+            self._notify(job)
+            return
+
+        job.state = RUNNING
+        self._notify(job)
+        try:
+            self._run_ffmpeg(job)
+            if job.cancelled.is_set():
+                raise InterruptedError
+            if job.finalize:
+                job.finalize()
+            job.progress = 100.0
+            job.state = DONE
+        except InterruptedError:
+            job.state = CANCELLED
+            self._discard_output(job)
+        except Exception as e:
+            logging.error(f"{job.kind} job failed: {e}")
+            job.error = str(e)
+            job.state = FAILED
+            self._discard_output(job)
+        finally:
+            job.proc = None
+            for path in job.temp_files:
+                self._remove(path)
+        self._notify(job)
+
+    def _run_ffmpeg(self, job):
+        # Machine-readable progress on stdout, errors and the input
+        # summary (for the duration) on stderr
+        job.proc = self.runner.popen(
+            ['-nostats', '-progress', 'pipe:1'] + job.args,
+            loglevel=None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        if job.cancelled.is_set():
+            job.proc.terminate()
+
+        stderr_tail = deque(maxlen=20)
+
+        def drain_stderr():
+            for raw in job.proc.stderr:
+                line = raw.decode(errors="replace").rstrip()
+                stderr_tail.append(line)
+                if job.duration is None:
+                    match = _DURATION_RE.search(line)
+                    if match:
+                        job.duration = parse_timestamp(*match.groups())
+
+        stderr_thread = threading.Thread(target=drain_stderr, daemon=True)
+        stderr_thread.start()
+
+        for raw in job.proc.stdout:
+            if job.cancelled.is_set():
+                continue
+            key, _, value = raw.decode(errors="replace").strip().partition("=")
+            # out_time_us and (despite the name) out_time_ms are both microseconds
+            if key in ("out_time_us", "out_time_ms") and value.isdigit() and job.duration:
+                progress = min(99.0, int(value) / 1e6 / job.duration * 100)
+                if int(progress) != int(job.progress):
+                    job.progress = progress
+                    self._notify(job)
+
+        returncode = job.proc.wait()
+        stderr_thread.join(1)
+        if job.cancelled.is_set():
+            raise InterruptedError
+        if returncode != 0:
+            errors = [line for line in stderr_tail if line]
+            raise Exception(errors[-1] if errors else f"ffmpeg exited with {returncode}")
+
+    @classmethod
+    def _discard_output(cls, job):
+        if job.output:
+            cls._remove(job.output)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
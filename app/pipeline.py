@@ -0,0 +1,296 @@
+"""Staged frame pipeline: bounded queues joining worker threads"""
+import threading
+import time
+import logging
+from collections import deque
+import numpy as np
+
+# Backpressure policies for a full FrameQueue
+BLOCK = "block"              # Producer waits until there is room
+DROP_OLDEST = "drop_oldest"  # Oldest queued item is discarded to make room
+DROP_NEWEST = "drop_newest"  # Incoming item is discarded
+BACKPRESSURE_POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST)
+
+
+class Frame:
+    """A captured frame travelling through the pipeline"""
+    __slots__ = ("slot", "data", "changed", "content")
+
+    def __init__(self, slot, data):
+        self.slot = slot
+        self.data = data
+        self.changed = 1.0   # Fraction of tiles changed since the previous capture
+        self.content = 0     # Id of the distinct screen content this frame shows
+
+
+class QueueClosed(Exception):
+    """Raised by FrameQueue.get once the queue is closed and drained"""
+
+
+class FrameQueue:
+    """Bounded FIFO between two pipeline stages with a backpressure policy"""
+    def __init__(self, maxsize, policy=BLOCK, name="queue"):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        if maxsize < 1:
+            raise ValueError("Queue size must be at least 1")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.name = name
+        self.on_drop = None  # Called with each discarded item, e.g. to recycle its buffer
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        # Counters
+        self.put_count = 0
+        self.dropped = 0
+        self.high_water = 0
+        self.blocked_time = 0.0
+
+    def put(self, item, timeout=None):
+        """Queue an item. Returns False if the item itself was dropped.
+
+        With BLOCK, `timeout` bounds the wait for room; the item is
+        dropped if there is still none.
+        """
+        with self._cond:
+            if self._closed:
+                return False
+
+            if len(self._items) >= self.maxsize:
+                if self.policy == DROP_NEWEST:
+                    self.dropped += 1
+                    if self.on_drop:
+                        self.on_drop(item)
+                    return False
+                elif self.policy == DROP_OLDEST:
+                    dropped = self._items.popleft()
+                    self.dropped += 1
+                    if self.on_drop:
+                        self.on_drop(dropped)
+                else:
+                    start = time.perf_counter()
+                    deadline = None if timeout is None else start + timeout
+                    while len(self._items) >= self.maxsize and not self._closed:
+                        remaining = None if deadline is None else deadline - time.perf_counter()
+                        if remaining is not None and remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    self.blocked_time += time.perf_counter() - start
+                    if self._closed:
+                        return False
+                    if len(self._items) >= self.maxsize:
+                        self.dropped += 1
+                        if self.on_drop:
+                            self.on_drop(item)
+                        return False
+
+            self._items.append(item)
+            self.put_count += 1
+            self.high_water = max(self.high_water, len(self._items))
+            self._cond.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """Take the next item, raising QueueClosed once closed and empty"""
+        with self._cond:
+            while not self._items:
+                if self._closed:
+                    raise QueueClosed(self.name)
+                if not self._cond.wait(timeout):
+                    return None
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def close(self):
+        """Stop accepting items; consumers drain what is left"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+    def stats(self):
+        return {
+            "queue": self.name,
+            "policy": self.policy,
+            "put": self.put_count,
+            "dropped": self.dropped,
+            "high_water": self.high_water,
+            "blocked_time": round(self.blocked_time, 3),
+        }
+
+
+class FramePool:
+    """Preallocated frame buffers recycled between pipeline stages.
+
+    Buffers are handed out by `acquire` and returned with `release` once the
+    last stage is done with them, so the steady-state hot loop allocates
+    nothing. If the pool runs dry a new buffer is allocated and counted,
+    rather than stalling capture.
+    """
+    def __init__(self, shape, dtype=np.uint8, count=8):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self._owned = [np.empty(self.shape, self.dtype) for _ in range(count)]
+        self._free = deque(self._owned)
+        self._lock = threading.Lock()
+        self.size = count
+        self.allocations = 0
+
+    def acquire(self):
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+            self.size += 1
+            self.allocations += 1
+            buf = np.empty(self.shape, self.dtype)
+            self._owned.append(buf)
+        return buf
+
+    def release(self, buf):
+        """Return a buffer; anything the pool did not hand out is ignored"""
+        if buf is None:
+            return
+        with self._lock:
+            if any(buf is owned for owned in self._owned):
+                self._free.append(buf)
+
+    def stats(self):
+        with self._lock:
+            return {"size": self.size, "free": len(self._free), "allocations": self.allocations}
+
+
+class PipelineStage(threading.Thread):
+    """Worker thread that runs one stage of the pipeline.
+
+    A stage without an input queue is a source: `process(None)` is called
+    repeatedly until the stage is stopped. Other stages call `process(item)`
+    for each queued item. Results that are not None go to the output queue.
+    """
+    def __init__(self, name, process, input_queue=None, output_queue=None, setup=None, teardown=None):
+        super().__init__(name=name)
+        self.daemon = True
+        self.process = process
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.setup = setup
+        self.teardown = teardown
+        self.error = None
+        self._stop_event = threading.Event()
+
+        # Counters
+        self.processed = 0
+        self.emitted = 0
+        self.busy_time = 0.0
+
+    def run(self):
+        try:
+            if self.setup:
+                self.setup()
+            while True:
+                if self.input_queue is None:
+                    if self._stop_event.is_set():
+                        break
+                    item = None
+                else:
+                    try:
+                        item = self.input_queue.get(timeout=0.1)
+                    except QueueClosed:
+                        break
+                    if item is None:
+                        continue
+
+                start = time.perf_counter()
+                result = self.process(item)
+                self.busy_time += time.perf_counter() - start
+
+                if item is not None or result is not None:
+                    self.processed += 1
+                if result is not None and self.output_queue is not None:
+                    self.output_queue.put(result)
+                    self.emitted += 1
+        except Exception as e:
+            logging.error(f"Pipeline stage '{self.name}' failed: {e}")
+            self.error = e
+            # Unblock the producer feeding this stage
+            if self.input_queue is not None:
+                self.input_queue.close()
+        finally:
+            if self.teardown:
+                try:
+                    self.teardown()
+                except Exception as e:
+                    logging.error(f"Pipeline stage '{self.name}' teardown failed: {e}")
+                    self.error = self.error or e
+            if self.output_queue is not None:
+                self.output_queue.close()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def stats(self):
+        return {
+            "stage": self.name,
+            "processed": self.processed,
+            "emitted": self.emitted,
+            "busy_time": round(self.busy_time, 3),
+        }
+
+
+class Pipeline:
+    """A chain of stages joined by FrameQueues.
+
+    Stopping the pipeline stops the source; the remaining stages drain their
+    input queues and exit in order, so nothing already captured is lost
+    unless a queue's policy dropped it.
+    """
+    def __init__(self):
+        self.stages = []
+        self.queues = []
+
+    def add_stage(self, name, process, queue_size=None, policy=BLOCK, setup=None, teardown=None):
+        input_queue = None
+        if self.stages:
+            input_queue = FrameQueue(queue_size or 1, policy, name=f"{self.stages[-1].name}->{name}")
+            self.stages[-1].output_queue = input_queue
+            self.queues.append(input_queue)
+        stage = PipelineStage(name, process, input_queue=input_queue, setup=setup, teardown=teardown)
+        self.stages.append(stage)
+        return stage
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def stop(self):
+        if self.stages:
+            self.stages[0].stop()
+
+    def join(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for stage in self.stages:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            stage.join(remaining)
+        return not any(stage.is_alive() for stage in self.stages)
+
+    @property
+    def running(self):
+        return any(stage.is_alive() for stage in self.stages)
+
+    @property
+    def error(self):
+        for stage in self.stages:
+            if stage.error is not None:
+                return stage.error
+        return None
+
+    def stats(self):
+        return {
+            "stages": [stage.stats() for stage in self.stages],
+            "queues": [queue.stats() for queue in self.queues],
+        }
@@ -12,15 +12,35 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QPushButton, QLabel, QComboBox, 
                              QFileDialog, QListWidget, QGroupBox, QMessageBox,
                              QStyle, QFrame, QRadioButton, QButtonGroup, QDialog,
-                             QListWidgetItem, QCheckBox, QKeySequenceEdit, QSlider, QTextEdit, QLineEdit)
+                             QListWidgetItem, QCheckBox, QKeySequenceEdit, QSlider, QTextEdit, QLineEdit,
+                             QProgressBar)
 from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QThread, QRect
 from PyQt5.QtGui import QFont, QPalette, QColor, QIcon, QPainter, QPen, QPixmap, QKeySequence, QImage
 import os
-import pyaudio
-import wave
-import subprocess
+try:
+    # PyAudioWPatch: a PyAudio build that can capture WASAPI loopback
+    import pyaudiowpatch as pyaudio
+except ImportError:
+    import pyaudio
 import logging
 import ctypes
+import multiprocessing
+from pipeline import Pipeline, Frame, FramePool, DROP_OLDEST
+from converter import FrameConverter, frame_shape, YUV420P
+from compositor import (PictureInPicture, POSITIONS, RECTANGLE, ROUNDED, CIRCLE, composite_job,
+                        webcam_track_path, WEBCAM_TRACK_SUFFIX)
+from capture import create_capture_backend, resolve_capture_area
+from encoders import create_encoder
+from ffmpeg_runner import get_runner
+from analysis import ChangeDetector
+from clock import FrameScheduler, SessionClock
+from audio import (AudioFeed, AudioMixer, AudioSource, AutoGain, intermediate_available, open_audio_writer,
+                   select_devices, track_format)
+from recovery import write_marker, remove_marker, recover_orphans, WEBCAM_RECOVERED
+from jobs import Job, JobQueue, QUEUED, DONE, FAILED, CANCELLED
+from idle import ActivityTimeline, idle_cut_job
+from webcam import WebcamReader, WebcamTrackWriter, list_cameras
+from seekindex import FrameIndex, FrameSeeker
 
 # Setup logging
 if getattr(sys, 'frozen', False):
@@ -403,110 +423,168 @@ class WindowSelectorDialog(QDialog):
 
 
 class AudioRecorderThread(QThread):
-    """Thread for handling audio recording"""
+    """Thread for handling audio recording.
+
+    Each source (the default microphone, the system loopback device) is a
+    PyAudio stream in callback mode: the PortAudio thread only copies each
+    block into that source's preallocated ring buffer. This thread drains
+    the rings, aligns every source to the session clock, and mixes them
+    into one track or writes them as separate tracks, one per filename,
+    to disk or into `feeds` for the live muxer. A GIL-bound conversion can
+    delay the drain, but no longer the capture; if a ring still fills up
+    the loss is counted.
+    """
     finished = pyqtSignal()
     error = pyqtSignal(str)
     
-    def __init__(self, filename):
+    CHUNK = 1024
+    FORMAT = pyaudio.paInt16
+    RING_SECONDS = 4
+    DRAIN_INTERVAL = 0.05
+    # Each source is metered while it is captured and brought to this
+    # loudness in the same pass, instead of a fixed boost at merge time
+    TARGET_LOUDNESS = -16.0
+    
+    def __init__(self, filenames, devices, rate, channels, feeds=None, session_clock=None, timeline=None):
         super().__init__()
-        self.filename = filename
+        self.filenames = filenames
+        # AudioDevices from audio.select_devices, and the track format
+        self.devices = devices
+        self.rate = rate
+        self.channels = channels
+        self.feeds = feeds
+        self.session_clock = session_clock
+        # idle.ActivityTimeline to mark sound on, if idle spans are cut
+        self.timeline = timeline
         self.is_recording = False
-        self.is_paused = False
-        
+        self.sources = []
+        self.mixer = None
+        # PortAudio status flags seen by the callbacks
+        self.input_overflows = 0
+        self.input_underflows = 0
+        self.callbacks = 0
+        
+    def _make_callback(self, source):
+        def callback(in_data, frame_count, time_info, status):
+            now = time.monotonic()
+            self.callbacks += 1
+            if status & pyaudio.paInputOverflow:
+                self.input_overflows += 1
+            if status & pyaudio.paInputUnderflow:
+                self.input_underflows += 1
+            # Capture time of the first frame: PortAudio reports how long
+            # ago the block was sampled; without that, assume one block.
+            # Pauses are cut out by the drain, at the sample the pause happened
+            latency = time_info.get("current_time", 0) - time_info.get("input_buffer_adc_time", 0)
+            if not 0 < latency < 1:
+                latency = frame_count / source.rate
+            source.ring.write(np.frombuffer(in_data, np.int16).reshape(frame_count, source.channels), now - latency)
+            return (None, pyaudio.paContinue)
+        return callback
+    
     def run(self):
         try:
-            # Audio settings
-            CHUNK = 1024
-            FORMAT = pyaudio.paInt16
-            CHANNELS = 2
-            RATE = 44100
+            if self.session_clock is None:
+                self.session_clock = SessionClock()
+                self.session_clock.start()
             
-            p = pyaudio.PyAudio()
-            
-            stream = p.open(format=FORMAT,
-                          channels=CHANNELS,
-                          rate=RATE,
-                          input=True,
-                          frames_per_buffer=CHUNK)
-            
-            frames = []
-            self.is_recording = True
+            self.sources = [AudioSource(device.name, device.rate, device.channels, self.rate, self.channels,
+                                        ring_seconds=self.RING_SECONDS, autogain=AutoGain(self.TARGET_LOUDNESS))
+                            for device in self.devices]
             
-            while self.is_recording:
-                if not self.is_paused:
-                    try:
-                        data = stream.read(CHUNK, exception_on_overflow=False)
-                        frames.append(data)
-                    except:
-                        pass
+            p = pyaudio.PyAudio()
+            writers = []
+            streams = []
+            try:
+                # Tracks go straight to the live muxer or to disk, so memory
+                # stays flat however long the session runs
+                if self.feeds:
+                    writers = list(self.feeds)
                 else:
-                    time.sleep(0.1)
-            
-            stream.stop_stream()
-            stream.close()
-            p.terminate()
-            
-            # Save audio file
-            wf = wave.open(self.filename, 'wb')
-            wf.setnchannels(CHANNELS)
-            wf.setsampwidth(p.get_sample_size(FORMAT))
-            wf.setframerate(RATE)
-            wf.writeframes(b''.join(frames))
-            wf.close()
+                    for filename in self.filenames:
+                        writers.append(open_audio_writer(filename, self.channels,
+                                                         p.get_sample_size(self.FORMAT), self.rate))
+                # One mixed track, or one track per source
+                self.mixer = AudioMixer(self.sources, writers, self.rate, self.channels, timeline=self.timeline)
+                self.is_recording = True
+                
+                for device, source in zip(self.devices, self.sources):
+                    logging.info(f"Recording {device.name}: device {device.index}, "
+                                 f"{device.rate} Hz, {device.channels} channel(s)")
+                    streams.append(p.open(format=self.FORMAT,
+                                          channels=device.channels,
+                                          rate=device.rate,
+                                          input=True,
+                                          input_device_index=device.index,
+                                          frames_per_buffer=self.CHUNK,
+                                          stream_callback=self._make_callback(source)))
+                try:
+                    while self.is_recording:
+                        time.sleep(self.DRAIN_INTERVAL)
+                        self._drain()
+                finally:
+                    for stream in streams:
+                        stream.stop_stream()
+                        stream.close()
+                # Blocks delivered before the streams stopped, padded to end
+                # exactly where the session ended
+                self._drain()
+                end_time = self.session_clock.stop()
+                for source in self.sources:
+                    source.corrector.finish(end_time)
+                self.mixer.mix(final=True)
+            finally:
+                p.terminate()
+                for writer in writers:
+                    writer.close()
             
+            logging.info(f"Audio stats: {self.stats()}")
             self.finished.emit()
         except Exception as e:
             self.error.emit(str(e))
     
+    def _drain(self):
+        for source in self.sources:
+            source.drain(self.session_clock)
+        self.mixer.mix()
+    
+    def offset_ms(self):
+        """Audio track offset from the session clock at the last block of the first source"""
+        return self.sources[0].corrector.offset_ms() if self.sources else None
+    
+    def stats(self):
+        stats = {}
+        for source in self.sources:
+            stats.update({f"{source.name}_{key}": value for key, value in source.stats().items()})
+        for index, feed in enumerate(self.feeds or ()):
+            stats.update({f"feed{index}_{key}": value for key, value in feed.stats().items()})
+        stats.update(callbacks=self.callbacks, input_overflows=self.input_overflows,
+                     input_underflows=self.input_underflows)
+        if self.mixer:
+            stats.update(self.mixer.stats())
+        return stats
+    
     def pause(self):
-        self.is_paused = True
+        if self.session_clock:
+            self.session_clock.pause()
     
     def resume(self):
-        self.is_paused = False
+        if self.session_clock:
+            self.session_clock.resume()
     
     def stop(self):
         self.is_recording = False
 
 
 
-class WebcamReader(threading.Thread):
-    """Thread for reading webcam frames continuously"""
-    def __init__(self, camera_id=0):
-        super().__init__()
-        self.camera_id = camera_id
-        self.running = True
-        self.frame = None
-        self.lock = threading.Lock()
-        self.daemon = True  # Daemon thread ensures it dies with the app
-        
-    def run(self):
-        try:
-            cap = cv2.VideoCapture(self.camera_id)
-            while self.running:
-                ret, frame = cap.read()
-                if ret:
-                    with self.lock:
-                        self.frame = frame
-                else:
-                    time.sleep(0.1)
-            cap.release()
-        except Exception as e:
-            logging.error(f"Webcam error: {e}")
-            
-    def get_frame(self):
-        with self.lock:
-            return self.frame.copy() if self.frame is not None else None
-            
-    def stop(self):
-        self.running = False
-
-
 class RecorderThread(QThread):
     """Thread for handling video recording"""
     finished = pyqtSignal()
     error = pyqtSignal(str)
     
-    def __init__(self, filename, fps, codec, quality, mode="monitor", monitor_number=1, window_hwnd=None, region=None, scale=1.0, record_webcam=False, webcam_id=0):
+    def __init__(self, filename, fps, codec, quality, mode="monitor", monitor_number=1, window_hwnd=None, region=None, scale=1.0, record_webcam=False, webcam_id=0,
+                 webcam_layout=None, webcam_track=None, queue_size=4, backpressure=DROP_OLDEST, skip_static=True, capture_backend=None, encoder_settings=None,
+                 segment_seconds=None, audio_feeds=(), session_clock=None, timeline=None):
         super().__init__()
         self.filename = filename
         self.fps = fps
@@ -519,131 +597,249 @@ class RecorderThread(QThread):
         self.scale = scale
         self.record_webcam = record_webcam
         self.webcam_id = webcam_id
+        self.webcam_layout = webcam_layout or PictureInPicture()
+        self.webcam_track = webcam_track
+        self.queue_size = queue_size
+        self.backpressure = backpressure
+        self.skip_static = skip_static
+        self.capture_backend = capture_backend
+        self.encoder_settings = encoder_settings
+        self.segment_seconds = segment_seconds
+        self.audio_feeds = audio_feeds
+        self.session_clock = session_clock
+        self.timeline = timeline
         self.is_recording = False
-        self.is_paused = False
+        self.pipeline = None
+        self.scheduler = None
+        self.change_detector = None
+        self.encoder = None
         
     def run(self):
         webcam_reader = None
         try:
-            # Start webcam if enabled
-            if self.record_webcam:
-                webcam_reader = WebcamReader(self.webcam_id)
+            if self.session_clock is None:
+                self.session_clock = SessionClock()
+                self.session_clock.start()
+            session = self.session_clock
+            
+            # Backend name, or None for the FLUX_CAPTURE_BACKEND/mss default
+            backend = self.capture_backend
+            if backend is None or isinstance(backend, str):
+                backend = create_capture_backend(backend)
+            monitor = resolve_capture_area(backend.monitors(), self.mode, self.monitor_number,
+                                           self.window_hwnd, self.region)
+            
+            # Calculate scaled dimensions
+            scaled_width = int(monitor['width'] * self.scale)
+            scaled_height = int(monitor['height'] * self.scale)
+            if self.encoder_settings and self.encoder_settings.get("input_format") == YUV420P:
+                # Planar 4:2:0 needs even dimensions
+                scaled_width -= scaled_width % 2
+                scaled_height -= scaled_height % 2
+            
+            # Start webcam if enabled, at the format the overlay needs;
+            # frames are composited once the camera delivers, without
+            # holding up the session. As a separate track the camera is
+            # recorded to its own file instead and never overlaid live
+            if self.record_webcam and self.webcam_track:
+                webcam_reader = WebcamTrackWriter(self.webcam_id, self.webcam_track, self.fps, session,
+                                                  self.encoder_settings)
                 webcam_reader.start()
-                time.sleep(0.5) # Warmup
-
-            with mss.mss() as sct:
-                # Determine capture area
-                if self.mode == "monitor":
-                    monitor = sct.monitors[self.monitor_number]
-                elif self.mode == "window" and self.window_hwnd:
-                    rect = win32gui.GetWindowRect(self.window_hwnd)
-                    monitor = {
-                        "left": rect[0],
-                        "top": rect[1],
-                        "width": rect[2] - rect[0],
-                        "height": rect[3] - rect[1]
-                    }
-                elif self.mode == "region" and self.region:
-                    monitor = {
-                        "left": self.region[0],
-                        "top": self.region[1],
-                        "width": self.region[2],
-                        "height": self.region[3]
-                    }
-                else:
-                    monitor = sct.monitors[1]
-                
-                # Calculate scaled dimensions
-                scaled_width = int(monitor['width'] * self.scale)
-                scaled_height = int(monitor['height'] * self.scale)
-                
-                # Setup video writer with scaled dimensions
-                fourcc = cv2.VideoWriter_fourcc(*self.codec)
-                out = cv2.VideoWriter(
-                    self.filename,
-                    fourcc,
-                    self.fps,
-                    (scaled_width, scaled_height)
-                )
-                
-                if not out.isOpened():
-                    raise Exception(f"Failed to open video writer with codec {self.codec}")
+            elif self.record_webcam:
+                layout = self.webcam_layout
+                webcam_reader = WebcamReader(self.webcam_id, overlay_width=layout.overlay_width(scaled_width),
+                                             fps=self.fps, aspect=layout.aspect)
+                webcam_reader.start()
+            
+            # Setup encoder with scaled dimensions; ffmpeg when configured,
+            # otherwise (or if ffmpeg is unavailable) cv2.VideoWriter.
+            # ffmpeg muxes the audio feeds live; other encoders spill them
+            # to WAVs that are merged after recording
+            out = create_encoder(self.filename, scaled_width, scaled_height, self.fps,
+                                 self.encoder_settings, fourcc=self.codec,
+                                 segment_seconds=self.segment_seconds,
+                                 audio_feeds=self.audio_feeds)
+            self.encoder = out
+            
+            scheduler = FrameScheduler(self.fps, session=session)
+            self.scheduler = scheduler
+            
+            def open_capture():
+                # Backends open on the thread that grabs. Slot 0 is the
+                # session start, so the time spent opening the encoder and
+                # capture is covered by repeating the first frame
+                backend.open(monitor)
+                scheduler.start()
+            
+            def close_capture():
+                scheduler.stop()
+                backend.close()
+            
+            def capture(_):
+                if session.paused:
+                    # Woken by resume or stop, not by polling
+                    session.wait_resumed(0.5)
+                    return None
                 
-                self.is_recording = True
-                frame_interval = 1.0 / self.fps
-                last_frame_time = time.time()
+                # Sleep until the next frame deadline, in session time.
+                # None: the session paused or stopped while waiting, and
+                # nothing past that instant belongs in the recording
+                slot = scheduler.wait()
+                if slot is None:
+                    return None
+                return Frame(slot, backend.grab())
+            
+            detector = ChangeDetector(monitor['width'], monitor['height'])
+            self.change_detector = detector
+            detect_state = {"content": 0}
+            
+            timeline = self.timeline
+            
+            def detect(item):
+                item.changed = detector.update(item.data)
+                if timeline is not None:
+                    timeline.mark_video(item.slot / self.fps, item.changed)
+                if item.changed:
+                    detect_state["content"] += 1
+                item.content = detect_state["content"]
+                return item
+            
+            # Output buffers are preallocated for the capture geometry and
+            # recycled, so the steady-state loop does not allocate frames,
+            # in the encoder's input format
+            pool = FramePool(frame_shape(out.input_format, scaled_width, scaled_height), count=self.queue_size + 4)
+            converter = FrameConverter(pool, (monitor['width'], monitor['height']), (scaled_width, scaled_height),
+                                       out.input_format, pip=self.webcam_layout)
+            
+            # Static frames skip conversion while neither the screen nor the
+            # webcam has delivered anything new
+            skip_static = self.skip_static
+            convert_state = {"content": None, "webcam": None}
+            
+            def convert(item):
+                # A track writer publishes nothing: (0, None)
+                sequence, overlay = webcam_reader.latest() if webcam_reader else (0, None)
+                if (skip_static and item.content == convert_state["content"]
+                        and sequence == convert_state["webcam"]):
+                    # Nothing changed since the last converted frame
+                    item.data = None
+                    return item
+                convert_state["content"] = item.content
+                convert_state["webcam"] = sequence
                 
-                while self.is_recording:
-                    if not self.is_paused:
-                        current_time = time.time()
-                        
-                        # Only capture if enough time has passed
-                        if current_time - last_frame_time >= frame_interval:
-                            # Capture screen
-                            screenshot = sct.grab(monitor)
-                            frame = np.array(screenshot)
-                            
-                            # Convert BGRA to BGR
-                            frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
-                            
-                            # Scale frame if needed
-                            if self.scale != 1.0:
-                                frame = cv2.resize(frame, (scaled_width, scaled_height), interpolation=cv2.INTER_AREA)
-                            
-                            # Overlay webcam
-                            if webcam_reader:
-                                web_frame = webcam_reader.get_frame()
-                                if web_frame is not None:
-                                    try:
-                                        # Resize webcam frame (1/5th of screen width)
-                                        h, w, _ = frame.shape
-                                        target_w = w // 5
-                                        if target_w > 0:
-                                            aspect_ratio = web_frame.shape[1] / web_frame.shape[0]
-                                            target_h = int(target_w / aspect_ratio)
-                                            
-                                            web_frame_resized = cv2.resize(web_frame, (target_w, target_h))
-                                            
-                                            # Position: Bottom-Right with padding
-                                            padding = 20
-                                            y_offset = h - target_h - padding
-                                            x_offset = w - target_w - padding
-                                            
-                                            # Ensure it fits
-                                            if y_offset >= 0 and x_offset >= 0:
-                                                frame[y_offset:y_offset+target_h, x_offset:x_offset+target_w] = web_frame_resized
-                                    except Exception as e:
-                                        # Ignore overlay errors to keep recording
-                                        pass
-
-                            # Write frame
-                            out.write(frame)
-                            
-                            last_frame_time = current_time
-                        else:
-                            # Sleep for a short time to avoid busy waiting
-                            time.sleep(0.001)
-                    else:
-                        time.sleep(0.1)
+                # Scale, overlay webcam and convert to the encoder's pixel format
+                item.data = converter.convert(item.data, overlay)
+                return item
+            
+            encode_state = {"last_frame": None}
+            
+            def encode(item):
+                if item.data is None:
+                    # Static frame: repeat the last encoded image
+                    if encode_state["last_frame"] is not None:
+                        for _ in range(scheduler.repeats_for(item.slot)):
+                            out.write(encode_state["last_frame"])
+                    return None
                 
-                out.release()
+                # Duplicate into skipped slots so duration matches wall-clock time
+                for _ in range(scheduler.repeats_for(item.slot)):
+                    out.write(item.data)
+                # Keep the newest frame for tail padding, recycle the previous one
+                pool.release(encode_state["last_frame"])
+                encode_state["last_frame"] = item.data
+                return None
+            
+            def close_encoder():
+                # Pad the tail up to the moment capture stopped
+                if encode_state["last_frame"] is not None:
+                    for _ in range(scheduler.remaining_slots()):
+                        out.write(encode_state["last_frame"])
+                out.close()
+            
+            # Capture -> detect changes -> convert/composite -> encode, joined by
+            # bounded queues so a slow encoder no longer delays the next grab
+            self.pipeline = Pipeline()
+            self.pipeline.add_stage("capture", capture, setup=open_capture, teardown=close_capture)
+            self.pipeline.add_stage("detect", detect, self.queue_size, self.backpressure)
+            self.pipeline.add_stage("convert", convert, self.queue_size, self.backpressure)
+            encode_stage = self.pipeline.add_stage("encode", encode, self.queue_size, self.backpressure, teardown=close_encoder)
+            
+            def on_encode_drop(item):
+                pool.release(item.data)
+                # The encoder never saw this content, so convert the next frame
+                convert_state["content"] = None
+            
+            encode_stage.input_queue.on_drop = on_encode_drop
+            
+            self.is_recording = True
+            self.pipeline.start()
+            
+            while self.is_recording and self.pipeline.running:
+                time.sleep(0.05)
+            
+            self.pipeline.stop()
+            self.pipeline.join()
+            logging.info(f"Pipeline stats: {self.pipeline.stats()}")
+            logging.info(f"Frame scheduler stats: {scheduler.stats()}")
+            logging.info(f"Frame pool stats: {pool.stats()}")
+            logging.info(f"Change detection stats: {detector.stats()}")
+            
+            if self.pipeline.error is not None:
+                raise self.pipeline.error
             
             if webcam_reader:
                 webcam_reader.stop()
                 webcam_reader.join()
+                logging.info(f"Webcam: {webcam_reader.stats}")
             
             self.finished.emit()
             
         except Exception as e:
+            if self.pipeline:
+                self.pipeline.stop()
+            elif self.encoder:
+                # Failed before the encode stage took ownership of the encoder
+                try:
+                    self.encoder.close()
+                except Exception:
+                    pass
+            else:
+                # No encoder will take the audio; keep it as WAVs
+                for feed in self.audio_feeds:
+                    feed.detach()
             if webcam_reader:
                 webcam_reader.stop()
             self.error.emit(str(e))
     
+    def pipeline_stats(self):
+        """Per-stage and per-queue counters of the running pipeline"""
+        return self.pipeline.stats() if self.pipeline else None
+    
+    def frame_stats(self):
+        """Captured, duplicated and dropped frame counts"""
+        return self.scheduler.stats() if self.scheduler else None
+    
+    def recorded_seconds(self):
+        """Duration of video written to the encoder so far"""
+        return self.scheduler.written_slots / self.fps if self.scheduler else 0.0
+    
+    def offset_ms(self):
+        """Video track offset from the session clock once stopped"""
+        if not self.scheduler or self.scheduler.stop_time is None:
+            return None
+        return (self.scheduler.written_slots / self.fps - self.scheduler.elapsed()) * 1000
+    
+    def changed_ratio(self):
+        """Fraction of screen tiles that changed in the latest capture"""
+        return self.change_detector.last_ratio if self.change_detector else None
+    
     def pause(self):
-        self.is_paused = True
+        if self.session_clock:
+            self.session_clock.pause()
     
     def resume(self):
-        self.is_paused = False
+        if self.session_clock:
+            self.session_clock.resume()
     
     def stop(self):
         self.is_recording = False
@@ -651,14 +847,79 @@ class RecorderThread(QThread):
 
 
 
+
+class RecoveryThread(QThread):
+    """Finalizes recordings left behind by a crash"""
+    done = pyqtSignal(list, list)
+
+    def __init__(self, folder):
+        super().__init__()
+        self.folder = folder
+
+    def run(self):
+        try:
+            recovered, failed = recover_orphans(self.folder)
+        except Exception as e:
+            recovered, failed = [], [(self.folder, str(e))]
+        self.done.emit(recovered, failed)
+
+
+class RecordingSession:
+    """The files and threads of one recording, until it is finalized.
+
+    Stopping does not wait for the threads: the encoder and the audio
+    writers may still be flushing. Each thread reports here once it has
+    sent its last signal (finished or error), and the app finalizes the
+    session when all of them have, with this session's own files, even if
+    another recording has started in the meantime.
+    """
+    def __init__(self, video_filename, audio_filenames=(), timeline=None, webcam_track=None):
+        self.video_filename = video_filename
+        self.audio_filenames = list(audio_filenames)
+        # Sound and screen activity, for cutting idle stretches afterwards
+        self.timeline = timeline
+        # The webcam's own track, composited once the recording is complete
+        self.webcam_track = webcam_track
+        self.recorder_thread = None
+        self.audio_thread = None
+        self.errors = []
+        self.av_offset = None
+        self._reported = []
+    
+    @property
+    def threads(self):
+        return [thread for thread in (self.recorder_thread, self.audio_thread) if thread is not None]
+    
+    def report(self, thread, error=None):
+        """Note the last signal of `thread`; True for the one that completes the session"""
+        if thread in self._reported:
+            return False
+        self._reported.append(thread)
+        if error is not None:
+            self.errors.append(error)
+        return len(self._reported) == len(self.threads)
+
+
 class VideoTrimmerDialog(QDialog):
-    """Dialog for trimming videos"""
-    def __init__(self, video_path, parent=None):
+    """Dialog for trimming videos.
+
+    Previews seek through a FrameIndex, built (or read from its cache) in
+    the background: while the slider is dragged each step shows a frame
+    of the same group of pictures that decodes quickly, marked as
+    approximate, and the exact frame is shown once the slider is
+    released. Trim points are taken from the index's frame timestamps.
+    """
+    # The FrameIndex, once loaded
+    index_ready = pyqtSignal(object)
+    
+    def __init__(self, video_path, parent=None, submit_job=None):
         super().__init__(parent)
         self.setWindowTitle("Trim Video")
         self.setModal(True)
         self.resize(600, 500)
         self.video_path = video_path
+        # Queues the ffmpeg trim in the background, see ScreenRecorderApp.submit_job
+        self.submit_job = submit_job
         
         # Open video
         self.cap = cv2.VideoCapture(video_path)
@@ -669,6 +930,12 @@ class VideoTrimmerDialog(QDialog):
         self.start_time = 0.0
         self.end_time = self.duration
         
+        # Until the index is ready, previews seek with cv2 alone
+        self.seeker = None
+        self.shown_frame = None
+        self.index_ready.connect(self.on_index_ready)
+        threading.Thread(target=self.load_index, daemon=True).start()
+        
         self.init_ui()
         self.set_dark_theme()
         
@@ -697,6 +964,7 @@ class VideoTrimmerDialog(QDialog):
         self.seek_slider = QSlider(Qt.Horizontal)
         self.seek_slider.setRange(0, self.total_frames)
         self.seek_slider.valueChanged.connect(self.on_seek)
+        self.seek_slider.sliderReleased.connect(lambda: self.update_preview(self.seek_slider.value()))
         sliders_layout.addWidget(self.seek_slider)
         
         # Controls Layout
@@ -759,10 +1027,39 @@ class VideoTrimmerDialog(QDialog):
         s = int(seconds % 60)
         return f"{m:02d}:{s:02d}"
         
+    def load_index(self):
+        try:
+            index = FrameIndex.load(self.video_path)
+        except Exception as e:
+            logging.warning(f"Seek index unavailable, seeking without it: {e}")
+            return
+        try:
+            self.index_ready.emit(index)
+        except RuntimeError:
+            # The dialog was closed first
+            pass
+    
+    def on_index_ready(self, index):
+        self.seeker = FrameSeeker(self.cap, index, self.video_path)
+        self.shown_frame = None
+        self.update_preview(self.seek_slider.value())
+    
     def update_preview(self, frame_no):
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_no)
-        ret, frame = self.cap.read()
+        approximate = False
+        if self.seeker:
+            # Near keyframes only while dragging
+            target = self.seeker.target(frame_no, exact=not self.seek_slider.isSliderDown())
+            approximate = target != frame_no
+            frame_no = target
+            if frame_no == self.shown_frame:
+                return
+            frame_no, frame = self.seeker.read(frame_no)
+            ret = frame is not None
+        else:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_no)
+            ret, frame = self.cap.read()
         if ret:
+            self.shown_frame = frame_no
             # Resize to fit label
             h, w, c = frame.shape
             target_h = 300
@@ -777,21 +1074,26 @@ class VideoTrimmerDialog(QDialog):
             qt_img = QImage(rgb_frame.data, w, h, bytes_per_line, QImage.Format_RGB888)
             self.preview_label.setPixmap(QPixmap.fromImage(qt_img))
             
-            # Update time label
-            current_sec = frame_no / self.fps if self.fps > 0 else 0
-            self.time_label.setText(f"Time: {self.format_time(current_sec)} / {self.format_time(self.duration)}")
+            # Update time label; "~" while the preview is not the slider's frame
+            current_sec = self.frame_time(frame_no)
+            self.time_label.setText(f"Time: {'~' if approximate else ''}{self.format_time(current_sec)} / "
+                                    f"{self.format_time(self.duration)}")
             
     def on_seek(self, value):
         self.update_preview(value)
         
+    def frame_time(self, frame_no):
+        """Time of frame `frame_no`: its timestamp once the index is loaded"""
+        if self.seeker:
+            return self.seeker.index.time_of(frame_no)
+        return frame_no / self.fps if self.fps > 0 else 0
+    
     def set_start_time(self):
-        frame = self.seek_slider.value()
-        self.start_time = frame / self.fps
+        self.start_time = self.frame_time(self.seek_slider.value())
         self.start_label.setText(self.format_time(self.start_time))
         
     def set_end_time(self):
-        frame = self.seek_slider.value()
-        self.end_time = frame / self.fps
+        self.end_time = self.frame_time(self.seek_slider.value())
         self.end_label.setText(self.format_time(self.end_time))
         
     def trim_video(self):
@@ -799,30 +1101,23 @@ class VideoTrimmerDialog(QDialog):
             QMessageBox.warning(self, "Invalid Range", "Start time must be before end time.")
             return
             
-        # Use ffmpeg to trim
-        import imageio_ffmpeg
-        ffmpeg_exe = imageio_ffmpeg.get_ffmpeg_exe()
-        
         base, ext = os.path.splitext(self.video_path)
         output_path = f"{base}_trimmed{ext}"
         
-        cmd = [
-            ffmpeg_exe, '-i', self.video_path,
+        # Use ffmpeg to trim, in the background job queue
+        args = [
+            '-i', self.video_path,
             '-ss', str(self.start_time),
             '-to', str(self.end_time),
             '-c', 'copy', # Fast stream copy
             '-y',
             output_path
         ]
+        job = Job("trim", f"Trimming {os.path.basename(self.video_path)}", args,
+                  output=output_path, duration=self.end_time - self.start_time)
         
         try:
-            startupinfo = None
-            if os.name == 'nt':
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                
-            subprocess.run(cmd, check=True, startupinfo=startupinfo)
-            QMessageBox.information(self, "Success", f"Trimmed video saved as:\n{os.path.basename(output_path)}")
+            self.submit_job(job)
             self.accept()
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to trim video:\n{e}")
@@ -913,9 +1208,19 @@ class LicenseDialog(QDialog):
 
 
 class ScreenRecorderApp(QMainWindow):
+    # Post-processing job updates, emitted from job worker threads
+    job_updated = pyqtSignal(object)
+    # Webcams found by the background enumeration
+    cameras_found = pyqtSignal(list)
+    # Audio that can't be muxed live is kept in this format until the
+    # merge; see audio.AUDIO_INTERMEDIATES
+    AUDIO_INTERMEDIATE = ".flac"
+    
     def __init__(self):
         super().__init__()
-        self.recorder_thread = None
+        # The RecordingSession being recorded
+        self.session = None
+        self.session_clock = None
         self.is_recording = False
         self.is_paused = False
         self.recording_time = 0
@@ -940,9 +1245,26 @@ class ScreenRecorderApp(QMainWindow):
             "pause_resume": "ctrl+shift+p"
         }
         
+        # ffmpeg post-processing (merge, trim) runs off the UI thread
+        self.jobs = JobQueue(max_workers=2, listener=self.job_updated.emit)
+        # Probe ffmpeg's version and encoders now, off the UI thread, so
+        # the first recording or job doesn't wait for it
+        threading.Thread(target=get_runner().probe, daemon=True).start()
+        self.job_rows = {}
+        self.job_callbacks = {}
+        self.job_updated.connect(self.on_job_updated)
+        
         self.init_ui()
         self.setup_hotkeys()
         
+        # Listing webcams can mean opening each one, so it runs off the UI thread
+        self.cameras_found.connect(self.on_cameras_found)
+        threading.Thread(target=lambda: self.cameras_found.emit(list_cameras()), daemon=True).start()
+
+        # Finalize recordings interrupted by a crash
+        self.recovery_thread = None
+        QTimer.singleShot(1000, self.recover_recordings)
+        
     def resource_path(self, relative_path):
         """ Get absolute path to resource, works for dev and for PyInstaller """
         try:
@@ -1308,6 +1630,32 @@ class ScreenRecorderApp(QMainWindow):
         self.microphone_checkbox.toggled.connect(self.toggle_microphone)
         settings_layout.addWidget(self.microphone_checkbox)
         
+        # System audio checkbox, mixed with the microphone
+        self.system_audio_checkbox = QCheckBox("🔊 Record System Audio")
+        self.system_audio_checkbox.setChecked(False)
+        self.system_audio_checkbox.setStyleSheet(self.microphone_checkbox.styleSheet())
+        self.record_system_audio = False
+        self.system_audio_checkbox.toggled.connect(self.toggle_system_audio)
+        settings_layout.addWidget(self.system_audio_checkbox)
+        
+        # Keep microphone and system audio as separate tracks
+        self.separate_tracks_checkbox = QCheckBox("🎚 Separate Audio Tracks")
+        self.separate_tracks_checkbox.setChecked(False)
+        self.separate_tracks_checkbox.setStyleSheet(self.microphone_checkbox.styleSheet())
+        self.separate_tracks_checkbox.setToolTip("Microphone and system audio as two tracks instead of one mix")
+        self.separate_audio_tracks = False
+        self.separate_tracks_checkbox.toggled.connect(lambda checked: setattr(self, 'separate_audio_tracks', checked))
+        settings_layout.addWidget(self.separate_tracks_checkbox)
+        
+        # Cut silent, static stretches into a condensed copy after recording
+        self.cut_idle_checkbox = QCheckBox("✂ Cut Idle Stretches")
+        self.cut_idle_checkbox.setChecked(False)
+        self.cut_idle_checkbox.setStyleSheet(self.microphone_checkbox.styleSheet())
+        self.cut_idle_checkbox.setToolTip("Save a condensed copy without stretches of silence and no screen change")
+        self.cut_idle = False
+        self.cut_idle_checkbox.toggled.connect(lambda checked: setattr(self, 'cut_idle', checked))
+        settings_layout.addWidget(self.cut_idle_checkbox)
+        
         # Webcam checkbox
         self.webcam_checkbox = QCheckBox("📷 Record Webcam")
         self.webcam_checkbox.setChecked(False)
@@ -1337,9 +1685,51 @@ class ScreenRecorderApp(QMainWindow):
             }
         """)
         self.record_webcam = False
-        self.webcam_checkbox.toggled.connect(lambda checked: setattr(self, 'record_webcam', checked))
+        self.webcam_checkbox.toggled.connect(self.toggle_webcam)
         settings_layout.addWidget(self.webcam_checkbox)
         
+        # Webcam device, filled in by on_cameras_found
+        self.webcam_combo = QComboBox()
+        self.webcam_combo.addItem("Default camera", 0)
+        self.webcam_combo.setStyleSheet(self.get_combo_style())
+        self.webcam_combo.setEnabled(False)
+        settings_layout.addWidget(self.webcam_combo)
+        
+        # Webcam placement and shape
+        webcam_layout_row = QHBoxLayout()
+        self.webcam_position_combo = QComboBox()
+        for position in POSITIONS:
+            self.webcam_position_combo.addItem(position.replace("-", " ").capitalize(), position)
+        self.webcam_position_combo.setCurrentIndex(list(POSITIONS).index("bottom-right"))
+        self.webcam_shape_combo = QComboBox()
+        for label, shape in (("Rectangle", RECTANGLE), ("Rounded", ROUNDED), ("Circle", CIRCLE)):
+            self.webcam_shape_combo.addItem(label, shape)
+        for combo in (self.webcam_position_combo, self.webcam_shape_combo):
+            combo.setStyleSheet(self.get_combo_style())
+            combo.setEnabled(False)
+            webcam_layout_row.addWidget(combo)
+        settings_layout.addLayout(webcam_layout_row)
+        
+        # Record the webcam to its own file and composite it afterwards
+        self.webcam_track_checkbox = QCheckBox("🎞 Webcam as Separate Track")
+        self.webcam_track_checkbox.setChecked(False)
+        self.webcam_track_checkbox.setStyleSheet(self.webcam_checkbox.styleSheet())
+        self.webcam_track_checkbox.setToolTip("Keep the camera in its own file; the overlay is added after "
+                                              "recording and can be redone in another layout")
+        self.webcam_track_checkbox.setEnabled(False)
+        self.webcam_separate_track = False
+        self.webcam_track_checkbox.toggled.connect(lambda checked: setattr(self, 'webcam_separate_track', checked))
+        settings_layout.addWidget(self.webcam_track_checkbox)
+        
+        # Segmented encoding checkbox
+        self.segmented_checkbox = QCheckBox("🧩 Segmented encoding (long recordings)")
+        self.segmented_checkbox.setChecked(False)
+        self.segmented_checkbox.setToolTip("Record 30 s chunks and encode them in parallel on all CPU cores")
+        self.segmented_checkbox.setStyleSheet(self.webcam_checkbox.styleSheet())
+        self.segmented_recording = False
+        self.segmented_checkbox.toggled.connect(lambda checked: setattr(self, 'segmented_recording', checked))
+        settings_layout.addWidget(self.segmented_checkbox)
+        
         settings_group.setLayout(settings_layout)
         main_layout.addWidget(settings_group)
         
@@ -1432,6 +1822,15 @@ class ScreenRecorderApp(QMainWindow):
         recordings_group.setLayout(recordings_layout)
         main_layout.addWidget(recordings_group)
         
+        # Background tasks, shown while post-processing jobs are queued
+        self.jobs_group = QGroupBox("Background Tasks")
+        self.jobs_group.setStyleSheet(self.get_groupbox_style())
+        self.jobs_layout = QVBoxLayout()
+        self.jobs_layout.setContentsMargins(5, 5, 5, 5)
+        self.jobs_group.setLayout(self.jobs_layout)
+        self.jobs_group.hide()
+        main_layout.addWidget(self.jobs_group)
+        
         central_widget.setLayout(main_layout)
         
         # Initial refresh
@@ -1708,17 +2107,29 @@ class ScreenRecorderApp(QMainWindow):
             fps = 30
             scale = 1.0
         
-        # Parse format - use reliable codecs to prevent crashes
+        # Parse format - H.264 through ffmpeg, with a reliable
+        # cv2.VideoWriter codec as fallback
+        # Frames go to ffmpeg as yuv420p converted in-process, the cheapest
+        # path end to end (scripts/benchmarks.py pixfmt)
+        # Fragmented output keeps the file playable if the app is killed.
+        # Each fragment starts on a keyframe: 5 s fragments cost nothing
+        # measurable, 2 s fragments ~16% in size (scripts/benchmarks.py fragment)
+        h264 = {"codec": "libx264", "preset": "veryfast", "crf": 23, "threads": 0, "input_format": YUV420P,
+                "fragment_seconds": 5}
         if "MP4" in format_text:
+            encoder_settings = h264
             codec = "mp4v"  # MPEG-4 Part 2 - most reliable on Windows
             ext = ".mp4"
         elif "AVI" in format_text:
+            encoder_settings = None
             codec = "XVID"  # XVID - very reliable
             ext = ".avi"
         elif "MKV" in format_text:
+            encoder_settings = h264
             codec = "XVID"  # XVID works well in MKV too
             ext = ".mkv"
         else:
+            encoder_settings = h264
             codec = "mp4v"
             ext = ".mp4"
         
@@ -1727,13 +2138,38 @@ class ScreenRecorderApp(QMainWindow):
         mode_suffix = f"_{self.recording_mode}" if self.recording_mode != "monitor" else ""
         filename = os.path.join(self.save_location, f"recording_{timestamp}{mode_suffix}{ext}")
         
-        # Store filenames for potential audio merging
-        self.video_filename = filename
-        self.audio_filename = None
-        self.audio_thread = None
+        # Filenames and threads of this recording, for merging and
+        # post-processing once it has stopped
+        session = RecordingSession(
+            filename,
+            timeline=ActivityTimeline() if self.cut_idle else None,
+            webcam_track=(webcam_track_path(filename)
+                          if self.record_webcam and self.webcam_separate_track else None))
+        
+        # Video slots and audio blocks are all stamped on one clock
+        self.session_clock = SessionClock()
+        self.session_clock.start()
+        
+        # Audio is muxed into the video as it is recorded; an audio file is
+        # only written (and merged after stopping) if the encoder can't
+        # take it. Microphone and system audio are mixed into one track,
+        # or kept as one track each
+        audio_feeds = []
+        audio_devices = self.select_audio_devices()
+        if audio_devices:
+            audio_rate, audio_channels = track_format(audio_devices)
+            # FLAC needs ffmpeg, which the merge needs anyway
+            audio_ext = self.AUDIO_INTERMEDIATE if intermediate_available(self.AUDIO_INTERMEDIATE) else ".wav"
+            if len(audio_devices) > 1 and self.separate_audio_tracks:
+                session.audio_filenames = [os.path.join(self.save_location, f"audio_{timestamp}_{device.name}{audio_ext}")
+                                           for device in audio_devices]
+            else:
+                session.audio_filenames = [os.path.join(self.save_location, f"audio_{timestamp}{audio_ext}")]
+        for audio_filename in session.audio_filenames:
+            audio_feeds.append(AudioFeed(audio_channels, audio_rate, fallback_filename=audio_filename))
         
-        # Start video recording thread
-        self.recorder_thread = RecorderThread(
+        # Video recording thread
+        session.recorder_thread = RecorderThread(
             filename, fps, codec, quality_text,
             mode=self.recording_mode,
             monitor_number=monitor_index,
@@ -1741,23 +2177,41 @@ class ScreenRecorderApp(QMainWindow):
             region=self.selected_region,
             scale=scale,
             record_webcam=self.record_webcam,
-            webcam_id=0
+            webcam_id=self.webcam_combo.currentData(),
+            webcam_layout=self.webcam_layout(),
+            webcam_track=session.webcam_track,
+            encoder_settings=encoder_settings,
+            segment_seconds=30 if self.segmented_recording else None,
+            audio_feeds=audio_feeds,
+            session_clock=self.session_clock,
+            timeline=session.timeline
         )
-        self.recorder_thread.finished.connect(self.on_recording_finished)
-        self.recorder_thread.error.connect(self.on_recording_error)
-        self.recorder_thread.start()
         
-        # Start audio recording if enabled
-        if self.record_audio:
-            self.audio_filename = os.path.join(self.save_location, f"audio_{timestamp}.wav")
-            self.audio_thread = AudioRecorderThread(self.audio_filename)
-            self.audio_thread.error.connect(self.on_recording_error)
-            self.audio_thread.start()
+        # Audio recording thread, if enabled
+        if session.audio_filenames:
+            session.audio_thread = AudioRecorderThread(session.audio_filenames, audio_devices,
+                                                       audio_rate, audio_channels, feeds=audio_feeds,
+                                                       session_clock=self.session_clock,
+                                                       timeline=session.timeline)
+        
+        # Both threads exist before either starts, so the session knows
+        # how many to wait for
+        for thread in session.threads:
+            thread.finished.connect(lambda thread=thread: self.on_thread_done(session, thread))
+            thread.error.connect(lambda message, thread=thread: self.on_thread_done(session, thread, message))
+        for thread in session.threads:
+            thread.start()
+        self.session = session
+
+        try:
+            write_marker(filename, session.audio_filenames, segmented=self.segmented_recording)
+        except OSError as e:
+            logging.warning(f"Could not write recovery marker: {e}")
         
         # Update UI
         self.is_recording = True
         self.recording_time = 0
-        self.timer.start(1000)
+        self.timer.start(250)
         self.record_btn.setText("⏹ Stop Recording")
         self.record_btn.setStyleSheet(self.get_button_style("#DC3545"))
         self.pause_btn.setEnabled(True)
@@ -1777,27 +2231,18 @@ class ScreenRecorderApp(QMainWindow):
     def stop_recording(self):
         logging.info("Stop recording requested")
         try:
-            if self.recorder_thread:
+            # Both tracks end at this instant of the session clock. Audio
+            # stops first: the live muxer finishes once it has the audio
+            # up to that point. The threads are not waited for here; the
+            # session is finalized once each has sent its last signal
+            if self.session_clock:
+                self.session_clock.stop()
+            if self.session:
+                if self.session.audio_thread:
+                    self.session.audio_thread.stop()
                 logging.info("Stopping video thread...")
-                self.recorder_thread.stop()
-                if not self.recorder_thread.wait(2000):
-                    logging.warning("Video thread did not stop in time")
-                else:
-                    logging.info("Video thread stopped")
-            
-            # Stop audio recording if it was running
-            if self.audio_thread:
-                logging.info("Stopping audio thread...")
-                self.audio_thread.stop()
-                if not self.audio_thread.wait(2000):
-                    logging.warning("Audio thread did not stop in time")
-                else:
-                    logging.info("Audio thread stopped")
-                
-                # Merge audio and video if both exist
-                if self.audio_filename and os.path.exists(self.audio_filename) and os.path.exists(self.video_filename):
-                    logging.info("Merging audio and video...")
-                    self.merge_audio_video()
+                self.session.recorder_thread.stop()
+                self.session = None
             
             # Restore window if minimized
             if self.isMinimized():
@@ -1826,6 +2271,7 @@ class ScreenRecorderApp(QMainWindow):
             logging.error(f"Error in stop_recording: {e}")
             QMessageBox.critical(self, "Error Stopping", f"An error occurred while stopping:\n{str(e)}")
             # Force reset UI state
+            self.session = None
             self.is_recording = False
             self.timer.stop()
             self.record_btn.setText("⏺ Start Recording")
@@ -1835,106 +2281,287 @@ class ScreenRecorderApp(QMainWindow):
             self.format_combo.setEnabled(True)
 
     
-    def merge_audio_video(self):
-        """Merge audio and video files using ffmpeg"""
-        ffmpeg_exe = None
-        try:
-            import imageio_ffmpeg
-            ffmpeg_exe = imageio_ffmpeg.get_ffmpeg_exe()
-        except ImportError:
-            import shutil
-            if shutil.which("ffmpeg"):
-                ffmpeg_exe = "ffmpeg"
-        
-        if not ffmpeg_exe:
-            logging.warning("FFmpeg not found. Audio file saved separately.")
-            QMessageBox.warning(self, "FFmpeg Missing", 
-                "FFmpeg is not installed.\n"
-                "Audio file saved separately.")
-            return
+    def merge_audio_video(self, session, then=None):
+        """Queue an ffmpeg job muxing the session's separate audio files into its video.
 
-        try:
-            # Create output filename
-            base_name = os.path.splitext(self.video_filename)[0]
-            ext = os.path.splitext(self.video_filename)[1]
-            output_filename = f"{base_name}_with_audio{ext}"
-            
-            # Use ffmpeg to merge
-            cmd = [
-                ffmpeg_exe, '-i', self.video_filename,
-                '-i', self.audio_filename,
-                '-c:v', 'copy',  # Copy video without re-encoding
-                '-c:a', 'aac',   # Encode audio to AAC
-                '-filter:a', 'volume=5.0', # Boost volume significantly (5x)
-                '-strict', 'experimental',
-                '-y',  # Overwrite output file
-                output_filename
-            ]
-            
-            # Hide console window for ffmpeg on Windows
-            startupinfo = None
-            if os.name == 'nt':
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, startupinfo=startupinfo)
-            
-            if result.returncode == 0:
-                # Success - delete original files and rename
-                if os.path.exists(self.video_filename):
-                    os.remove(self.video_filename)
-                if os.path.exists(self.audio_filename):
-                    os.remove(self.audio_filename)
-                os.rename(output_filename, self.video_filename)
+        Each audio file becomes one audio track. Returns True if the job
+        was queued; it deletes the inputs and marks the session complete
+        once the merged file is in place, then calls `then()` on the UI
+        thread.
+        """
+        video_filename = session.video_filename
+        audio_filenames = list(session.audio_filenames)
+        base_name, ext = os.path.splitext(video_filename)
+        output_filename = f"{base_name}_with_audio{ext}"
+        
+        args = ['-i', video_filename]
+        for audio_filename in audio_filenames:
+            args += ['-i', audio_filename]
+        args += ['-map', '0:v:0']
+        for index in range(len(audio_filenames)):
+            args += ['-map', f'{index + 1}:a:0']
+        args += [
+            '-c:v', 'copy',  # Copy video without re-encoding
+            '-c:a', 'aac',   # Encode audio to AAC; gain was applied when mixing
+            '-strict', 'experimental',
+            '-y',  # Overwrite output file
+            output_filename
+        ]
+        
+        def finalize():
+            # Runs on the job worker: replace the originals with the merge.
+            # The marker goes last, so a crash part way through leaves the
+            # session for recovery with no file missing
+            os.replace(output_filename, video_filename)
+            for audio_filename in audio_filenames:
+                os.remove(audio_filename)
+            remove_marker(video_filename)
+        
+        def on_finished(job):
+            if job.state == DONE:
                 logging.info("Audio merge successful")
-            else:
+                self.refresh_recordings()
+                if then:
+                    then()
+            elif job.state == FAILED:
                 # FFmpeg failed - keep both files
-                logging.error(f"FFmpeg failed: {result.stderr}")
-                QMessageBox.warning(self, "Merge Failed", 
-                    "Failed to merge audio and video.\n"
+                QMessageBox.warning(self, "Merge Failed",
+                    f"Failed to merge audio and video:\n{job.error}\n\n"
                     "Audio file has been saved separately.")
-                    
+        
+        job = Job("merge", f"Merging audio into {os.path.basename(video_filename)}", args,
+                  output=output_filename, finalize=finalize)
+        try:
+            self.submit_job(job, on_finished)
+            return True
         except Exception as e:
-            logging.error(f"Audio merge failed: {e}")
-            QMessageBox.warning(self, "Merge Error", 
-                f"An error occurred while merging audio:\n{str(e)}\n\n"
-                "Audio file has been saved separately.")
+            logging.warning(f"Audio merge unavailable: {e}")
+            QMessageBox.warning(self, "FFmpeg Missing",
+                f"Could not merge audio:\n{str(e)}\n\n"
+                "Audio file saved separately.")
+            return False
+    
+    def submit_job(self, job, on_finished=None):
+        """Queue a post-processing job; `on_finished(job)` runs on the UI thread"""
+        if on_finished:
+            self.job_callbacks[job.id] = on_finished
+        return self.jobs.submit(job)
+    
+    def submit_trim_job(self, job):
+        def on_finished(job):
+            if job.state == DONE:
+                self.refresh_recordings()
+                QMessageBox.information(self, "Success",
+                    f"Trimmed video saved as:\n{os.path.basename(job.output)}")
+            elif job.state == FAILED:
+                QMessageBox.critical(self, "Error", f"Failed to trim video:\n{job.error}")
+        return self.submit_job(job, on_finished)
+    
+    def cut_idle_spans(self, video_path, timeline, has_audio):
+        """Queue a condensed copy of a finished recording without its idle stretches"""
+        if timeline is None or not os.path.exists(video_path):
+            return
+        spans = timeline.idle_spans()
+        idle_seconds = sum(end - start for start, end in spans)
+        logging.info(f"Idle spans: {len(spans)}, {idle_seconds:.1f} s of {timeline.duration:.1f} s")
+        if not spans:
+            return
+        job = idle_cut_job(video_path, spans, timeline.duration, has_audio=has_audio)
+        
+        def on_finished(job):
+            if job.state == DONE:
+                self.refresh_recordings()
+                QMessageBox.information(self, "Idle Time Removed",
+                    f"Removed {idle_seconds / 60:.1f} min in {len(spans)} idle stretches.\n"
+                    f"Saved as:\n{os.path.basename(job.output)}")
+            elif job.state == FAILED:
+                QMessageBox.warning(self, "Cut Failed", f"Failed to cut idle time:\n{job.error}")
+        try:
+            self.submit_job(job, on_finished)
+        except Exception as e:
+            logging.warning(f"Idle cut unavailable: {e}")
+    
+    def composite_pending_webcam(self, video_path, track):
+        """Composite the webcam track recorded alongside a finished recording"""
+        if track and os.path.exists(track) and os.path.exists(video_path):
+            self.composite_webcam(video_path)
+    
+    def composite_webcam(self, video_path):
+        """Queue a copy of `video_path` with its webcam track overlaid in the current layout"""
+        try:
+            job = composite_job(video_path, webcam_track_path(video_path), self.webcam_layout())
+        except Exception as e:
+            QMessageBox.warning(self, "Composite Failed", f"Could not composite the webcam:\n{e}")
+            return
+        
+        def on_finished(job):
+            if job.state == DONE:
+                self.refresh_recordings()
+                QMessageBox.information(self, "Webcam Composited",
+                    f"Saved as:\n{os.path.basename(job.output)}")
+            elif job.state == FAILED:
+                QMessageBox.warning(self, "Composite Failed", f"Failed to composite the webcam:\n{job.error}")
+        try:
+            self.submit_job(job, on_finished)
+        except Exception as e:
+            logging.warning(f"Webcam composite unavailable: {e}")
+            for path in job.temp_files:
+                os.remove(path)
+    
+    def on_job_updated(self, job):
+        row = self.job_rows.get(job.id)
+        if row is None and not job.finished:
+            widget = QWidget()
+            layout = QHBoxLayout(widget)
+            layout.setContentsMargins(0, 0, 0, 0)
+            label = QLabel(job.description)
+            label.setStyleSheet("color: #E0E0E0; font-size: 11px;")
+            progress = QProgressBar()
+            progress.setRange(0, 100)
+            progress.setMaximumHeight(14)
+            progress.setStyleSheet("""
+                QProgressBar { background-color: #2A2A2A; border: 1px solid #333; border-radius: 4px;
+                               color: #E0E0E0; font-size: 10px; text-align: center; }
+                QProgressBar::chunk { background-color: #4A9EFF; border-radius: 4px; }
+            """)
+            cancel_btn = QPushButton("✖")
+            cancel_btn.setFixedSize(22, 18)
+            cancel_btn.setToolTip("Cancel")
+            cancel_btn.setStyleSheet(self.get_button_style("#DC3545", 18))
+            cancel_btn.clicked.connect(lambda _, job=job: self.jobs.cancel(job))
+            layout.addWidget(label, 1)
+            layout.addWidget(progress, 1)
+            layout.addWidget(cancel_btn)
+            self.jobs_layout.addWidget(widget)
+            self.jobs_group.show()
+            row = (widget, progress)
+            self.job_rows[job.id] = row
+        
+        if row is not None:
+            widget, progress = row
+            progress.setValue(int(job.progress))
+            progress.setFormat("Queued" if job.state == QUEUED else "%p%")
+        
+        if job.finished:
+            if row is not None:
+                widget.deleteLater()
+                del self.job_rows[job.id]
+            if not self.job_rows:
+                self.jobs_group.hide()
+            if job.state == CANCELLED:
+                logging.info(f"Job cancelled: {job.description}")
+            callback = self.job_callbacks.pop(job.id, None)
+            if callback:
+                callback(job)
     
     def toggle_pause(self):
         if not self.is_recording:
             return
             
+        # One event on the session clock; the audio and video threads both
+        # cut their tracks at its timestamp
         if not self.is_paused:
-            self.recorder_thread.pause()
-            if self.audio_thread:
-                self.audio_thread.pause()
+            self.session_clock.pause()
             self.is_paused = True
             self.pause_btn.setText("▶ Resume")
             self.pause_btn.setStyleSheet(self.get_button_style("#28A745"))
-            self.timer.stop()
         else:
-            self.recorder_thread.resume()
-            if self.audio_thread:
-                self.audio_thread.resume()
+            self.session_clock.resume()
             self.is_paused = False
             self.pause_btn.setText("⏸ Pause")
             self.pause_btn.setStyleSheet(self.get_button_style("#FFC107"))
-            self.timer.start(1000)
     
     def update_timer(self):
-        self.recording_time += 1
+        # Duration actually written by the pipeline, not timer ticks
+        if self.session:
+            self.recording_time = int(self.session.recorder_thread.recorded_seconds())
         hours = self.recording_time // 3600
         minutes = (self.recording_time % 3600) // 60
         seconds = self.recording_time % 60
         self.timer_label.setText(f"{hours:02d}:{minutes:02d}:{seconds:02d}")
     
-    def on_recording_finished(self):
+    def finalize_session(self, session):
+        """Merge the session's audio and video if both exist, then mark it complete.
+
+        Runs once every thread of the session has sent its last signal.
+        """
+        for thread in session.threads:
+            # Only returning from run() by now
+            if not thread.wait(2000):
+                logging.warning(f"{type(thread).__name__} did not return in time")
+        
+        def post_process(has_audio):
+            self.cut_idle_spans(session.video_filename, session.timeline, has_audio)
+            self.composite_pending_webcam(session.video_filename, session.webcam_track)
+        
+        if session.audio_thread:
+            self.report_sync(session)
+            if (session.audio_filenames and all(os.path.exists(path) for path in session.audio_filenames)
+                    and os.path.exists(session.video_filename)):
+                logging.info("Merging audio and video...")
+                if self.merge_audio_video(session, then=lambda: post_process(True)):
+                    # The merge job marks the session complete once the
+                    # merged file is in place; until then a crash leaves
+                    # the marker for recovery
+                    return
+        # Nothing to merge: the recording is complete as it stands
+        remove_marker(session.video_filename)
+        # Audio was muxed live unless it was left in the separate files
+        post_process(bool(session.audio_filenames)
+                     and not any(os.path.exists(path) for path in session.audio_filenames))
+
+    def report_sync(self, session):
+        """Log how far each track of the session ended from the session clock"""
+        audio_offset = session.audio_thread.offset_ms()
+        video_offset = session.recorder_thread.offset_ms()
+        if audio_offset is None or video_offset is None:
+            return
+        session.av_offset = audio_offset - video_offset
+        logging.info(f"A/V offset at stop: {session.av_offset:+.1f} ms "
+                     f"(audio {audio_offset:+.1f} ms, video {video_offset:+.1f} ms from session clock; "
+                     f"audio stats {session.audio_thread.stats()})")
+    
+    def recover_recordings(self):
+        """Finalize partial files and leftover audio from a previous crash"""
+        if self.recovery_thread is not None or self.is_recording:
+            return
+        self.recovery_thread = RecoveryThread(self.save_location)
+        self.recovery_thread.done.connect(self.on_recovery_done)
+        self.recovery_thread.start()
+
+    def on_recovery_done(self, recovered, failed):
+        self.recovery_thread = None
+        if not recovered and not failed:
+            return
         self.refresh_recordings()
-        QMessageBox.information(self, "Success", "Recording saved successfully!")
+        lines = [f"✔ {os.path.basename(path)} ({message})" for path, message in recovered]
+        lines += [f"✘ {os.path.basename(path)}: {message}" for path, message in failed]
+        QMessageBox.information(self, "Recovered Recordings",
+            "Recordings from an interrupted session were found:\n\n" + "\n".join(lines))
+        # Webcam tracks recorded separately are composited as after a normal stop
+        for path, message in recovered:
+            if message == WEBCAM_RECOVERED:
+                self.composite_webcam(path)
     
-    def on_recording_error(self, error_msg):
-        QMessageBox.critical(self, "Error", f"Recording error: {error_msg}")
-        self.stop_recording()
+    def on_thread_done(self, session, thread, error_msg=None):
+        """A thread of `session` finished, or failed with `error_msg`"""
+        # Reported before the message box, whose event loop may deliver
+        # the other thread's signal
+        complete = session.report(thread, error_msg)
+        if error_msg is not None:
+            # An error from a session that was already stopped must not stop the next one
+            if session is self.session:
+                self.stop_recording()
+            QMessageBox.critical(self, "Error", f"Recording error: {error_msg}")
+        if not complete:
+            return
+        self.finalize_session(session)
+        self.refresh_recordings()
+        if not session.errors:
+            message = "Recording saved successfully!"
+            if session.av_offset is not None:
+                message += f"\n\nA/V offset at stop: {session.av_offset:+.0f} ms"
+            QMessageBox.information(self, "Success", message)
 
     def show_license(self):
         """Show the license dialog"""
@@ -1949,8 +2576,10 @@ class ScreenRecorderApp(QMainWindow):
                 item.widget().deleteLater()
         
         if os.path.exists(self.save_location):
+            # Webcam tracks are listed with their recording, not on their own
             files = [f for f in os.listdir(self.save_location) 
-                    if f.endswith(('.mp4', '.avi', '.mkv'))]
+                    if f.endswith(('.mp4', '.avi', '.mkv'))
+                    and not f.endswith(WEBCAM_TRACK_SUFFIX)]
             files.sort(reverse=True)
             
             for file in files:
@@ -2019,6 +2648,15 @@ class ScreenRecorderApp(QMainWindow):
                 trim_btn.clicked.connect(lambda checked, f=full_path: self.trim_recording(f))
                 item_layout.addWidget(trim_btn)
                 
+                # Composite button, for recordings with a webcam track
+                if os.path.exists(webcam_track_path(full_path)):
+                    composite_btn = QPushButton("📷")
+                    composite_btn.setFixedSize(24, 24)
+                    composite_btn.setStyleSheet(trim_btn.styleSheet())
+                    composite_btn.setToolTip("Overlay the webcam track in the current webcam layout")
+                    composite_btn.clicked.connect(lambda checked, f=full_path: self.composite_webcam(f))
+                    item_layout.addWidget(composite_btn)
+                
                 # Delete button
                 delete_btn = QPushButton("🗑")
                 delete_btn.setFixedSize(24, 24)
@@ -2049,9 +2687,8 @@ class ScreenRecorderApp(QMainWindow):
     def trim_recording(self, filepath):
         """Open video trimmer dialog"""
         if os.path.exists(filepath):
-            dialog = VideoTrimmerDialog(filepath, self)
-            if dialog.exec_() == QDialog.Accepted:
-                self.refresh_recordings()
+            dialog = VideoTrimmerDialog(filepath, self, submit_job=self.submit_trim_job)
+            dialog.exec_()
     
     def delete_recording(self, filepath, widget):
         """Delete a recording after confirmation"""
@@ -2068,21 +2705,65 @@ class ScreenRecorderApp(QMainWindow):
         if reply == QMessageBox.Yes:
             try:
                 os.remove(filepath)
+                FrameIndex.remove(filepath)
+                if os.path.exists(webcam_track_path(filepath)):
+                    os.remove(webcam_track_path(filepath))
                 widget.deleteLater()
                 QMessageBox.information(self, "Deleted", "Recording deleted successfully!")
             except Exception as e:
                 QMessageBox.critical(self, "Error", f"Failed to delete recording:\n{str(e)}")
     
+    def toggle_webcam(self, checked):
+        self.record_webcam = checked
+        for widget in (self.webcam_combo, self.webcam_position_combo, self.webcam_shape_combo,
+                       self.webcam_track_checkbox):
+            widget.setEnabled(checked)
+    
+    def webcam_layout(self):
+        """PictureInPicture from the webcam settings"""
+        shape = self.webcam_shape_combo.currentData()
+        # Rounded and circular overlays get a border in the accent colour (#4A9EFF)
+        return PictureInPicture(position=self.webcam_position_combo.currentData(), shape=shape,
+                                border=0 if shape == RECTANGLE else 3, border_color=(255, 158, 74))
+    
+    def on_cameras_found(self, cameras):
+        """Offer the enumerated webcams, keeping the default if none were found"""
+        if not cameras:
+            return
+        self.webcam_combo.clear()
+        for camera in cameras:
+            self.webcam_combo.addItem(camera.name, camera.index)
+    
     def toggle_microphone(self, checked):
-        if checked:
-            try:
-                import imageio_ffmpeg
-                imageio_ffmpeg.get_ffmpeg_exe()
-            except ImportError:
-                QMessageBox.warning(self, "Dependency Missing", 
-                    "The 'imageio-ffmpeg' library is required for audio merging.\n"
-                    "Please install it using: pip install imageio-ffmpeg")
+        if checked and not get_runner().available:
+            QMessageBox.warning(self, "Dependency Missing", 
+                "FFmpeg is required for audio merging.\n"
+                "Please install it using: pip install imageio-ffmpeg")
         self.record_audio = checked
+    
+    def toggle_system_audio(self, checked):
+        self.record_system_audio = checked
+    
+    def select_audio_devices(self):
+        """Capture devices for the selected audio sources, opened in their
+        own channel count and sample rate; warns about missing ones"""
+        if not (self.record_audio or self.record_system_audio):
+            return []
+        p = pyaudio.PyAudio()
+        try:
+            devices = select_devices(p, AudioRecorderThread.FORMAT, self.record_audio, self.record_system_audio)
+        except Exception as e:
+            logging.error(f"Audio device unavailable: {e}")
+            QMessageBox.warning(self, "Audio Unavailable", f"Audio is not recorded:\n{e}")
+            return []
+        finally:
+            p.terminate()
+        if self.record_system_audio and not any(device.name == "system" for device in devices):
+            QMessageBox.warning(self, "System Audio Unavailable",
+                "No loopback or monitor input was found, so system audio is not recorded.\n"
+                "On Windows install PyAudioWPatch (pip install PyAudioWPatch) or enable "
+                "\"Stereo Mix\"; on Linux use a PulseAudio/PipeWire monitor source.")
+        return devices
 
     def open_hotkey_settings(self):
         """Open hotkey settings dialog"""
@@ -2104,11 +2785,13 @@ class ScreenRecorderApp(QMainWindow):
         os.startfile(self.save_location)
     
     def closeEvent(self, event):
-        """Clean up hotkeys on close"""
+        """Clean up hotkeys and background jobs on close"""
         try:
             keyboard.unhook_all_hotkeys()
         except:
             pass
+        # Interrupted merges are picked up by crash recovery on next start
+        self.jobs.shutdown(cancel=True)
         event.accept()
 
 
@@ -2139,4 +2822,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # Segment encoding workers re-launch this executable when frozen
+    multiprocessing.freeze_support()
     main()
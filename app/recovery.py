@@ -0,0 +1,288 @@
+"""Crash recovery for interrupted recordings"""
+import os
+import re
+import json
+import glob
+import uuid
+import struct
+import logging
+from datetime import datetime
+
+from audio import AUDIO_INTERMEDIATES
+from encoders import transcode_segment
+from ffmpeg_runner import get_runner
+from compositor import webcam_track_path
+
+MARKER_SUFFIX = ".inprogress"
+
+# Written into this process's markers; unlike the pid it cannot be reused
+# by a later process after a crash
+SESSION_TOKEN = uuid.uuid4().hex
+
+# Message for a recovered recording whose webcam track is waiting to be composited
+WEBCAM_RECOVERED = "recovered with webcam track"
+
+
+def marker_path(video_filename):
+    return video_filename + MARKER_SUFFIX
+
+
+def write_marker(video_filename, audio_filenames=(), segmented=False):
+    """Record that a session is in progress, so a crash can be recovered"""
+    data = {
+        "video": os.path.basename(video_filename),
+        "audio": [os.path.basename(path) for path in audio_filenames],
+        "segmented": segmented,
+        "session": SESSION_TOKEN,
+        "started": datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(marker_path(video_filename), "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def remove_marker(video_filename):
+    try:
+        os.remove(marker_path(video_filename))
+    except FileNotFoundError:
+        pass
+
+
+def _marker_audio(data):
+    # Markers from before multi-track audio hold one name or None
+    audio = data.get("audio")
+    if isinstance(audio, str):
+        return [audio]
+    return audio or []
+
+
+def repair_wav_header(path):
+    """Fix the RIFF and data chunk sizes of a WAV that was never closed.
+
+    Returns True if the header was rewritten.
+    """
+    size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            raise Exception(f"Not a WAV file: {os.path.basename(path)}")
+
+        # Walk the chunks up to 'data'
+        offset = 12
+        while offset + 8 <= size:
+            f.seek(offset)
+            chunk_id, chunk_size = struct.unpack("<4sI", f.read(8))
+            if chunk_id == b"data":
+                break
+            offset += 8 + chunk_size + (chunk_size & 1)
+        else:
+            raise Exception(f"No data chunk in {os.path.basename(path)}")
+
+        riff_size = size - 8
+        data_size = size - offset - 8
+        f.seek(4)
+        current_riff = struct.unpack("<I", f.read(4))[0]
+        if current_riff == riff_size and chunk_size == data_size:
+            return False
+
+        f.seek(4)
+        f.write(struct.pack("<I", riff_size))
+        f.seek(offset + 4)
+        f.write(struct.pack("<I", data_size))
+    return True
+
+
+def _flac_unfinished(path):
+    # STREAMINFO holds a total sample count of 0 until the muxer finishes
+    with open(path, "rb") as f:
+        head = f.read(42)
+    if len(head) < 42 or head[:4] != b"fLaC":
+        raise Exception(f"Not a FLAC file: {os.path.basename(path)}")
+    return int.from_bytes(head[21:26], "big") & 0xFFFFFFFFF == 0
+
+
+def _ogg_unfinished(path):
+    # The last page of a finished stream carries the end-of-stream flag
+    with open(path, "rb") as f:
+        f.seek(max(0, os.path.getsize(path) - 65536))
+        tail = f.read()
+    page = tail.rfind(b"OggS")
+    if page < 0 or page + 5 >= len(tail):
+        raise Exception(f"Not an Ogg file: {os.path.basename(path)}")
+    return not tail[page + 5] & 0x04
+
+
+def repair_audio(path, ffmpeg_exe=None):
+    """Make an audio intermediate that was never closed readable to its end.
+
+    A WAV gets its header sizes fixed in place. An unfinished Ogg Opus
+    file is remuxed with stream copy to end the stream; FLAC is encoded
+    again (losslessly), since only the encoder can hand the muxer the
+    sample count for STREAMINFO. Returns True if the file was rewritten.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".wav":
+        return repair_wav_header(path)
+    unfinished = {".flac": _flac_unfinished, ".opus": _ogg_unfinished}.get(ext)
+    if unfinished is None or not unfinished(path):
+        return False
+    codec_args = AUDIO_INTERMEDIATES[ext] if ext == ".flac" else ['-c', 'copy']
+    repaired = os.path.splitext(path)[0] + ".repaired" + ext
+    try:
+        _run_ffmpeg(get_runner(ffmpeg_exe).require().path,
+                    ['-err_detect', 'ignore_err', '-i', path] + codec_args + ['-y', repaired])
+        os.replace(repaired, path)
+    finally:
+        if os.path.exists(repaired):
+            os.remove(repaired)
+    return True
+
+
+def _run_ffmpeg(ffmpeg_exe, args):
+    result = get_runner(ffmpeg_exe).run(args)
+    if result.returncode != 0:
+        raise Exception(result.stderr.strip() or f"ffmpeg exited with {result.returncode}")
+
+
+def _recover_segments(ffmpeg_exe, video_path):
+    """Concatenate whatever segments a segmented session left behind"""
+    base, ext = os.path.splitext(video_path)
+    pattern = re.compile(re.escape(os.path.basename(base)) + r"\.seg(\d{4})(\.spool\.mkv|" + re.escape(ext) + ")$")
+    indexes = {}
+    for path in glob.glob(glob.escape(base) + ".seg*"):
+        match = pattern.search(os.path.basename(path))
+        if match:
+            indexes.setdefault(int(match.group(1)), {})[match.group(2)] = path
+    if not indexes:
+        return []
+
+    segments = []
+    for index in sorted(indexes):
+        found = indexes[index]
+        target = f"{base}.seg{index:04d}{ext}"
+        if ".spool.mkv" in found:
+            # A spool that is still there was never fully encoded; any
+            # final segment next to it may be truncated, so redo it
+            transcode_segment(ffmpeg_exe, found[".spool.mkv"], target, "libx264", "veryfast", 23, 0, "yuv420p")
+        segments.append(target)
+
+    list_path = f"{base}.segments.txt"
+    with open(list_path, "w", encoding="utf-8") as f:
+        for segment in segments:
+            escaped = os.path.abspath(segment).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    _run_ffmpeg(ffmpeg_exe, ['-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy', '-y', video_path])
+    os.remove(list_path)
+    for segment in segments:
+        os.remove(segment)
+    return segments
+
+
+def recover_session(marker, ffmpeg_exe=None):
+    """Finalize the files of one interrupted session.
+
+    The video is remuxed with stream copy into `<name>_recovered<ext>`,
+    which rewrites the index of a fragmented MP4 or unfinished MKV, and
+    leftover audio tracks are repaired and muxed in. A separate webcam
+    track is remuxed the same way, named to pair with the recovered
+    file. Returns the path of the recovered file, or None if there was
+    nothing to recover. A session without screen video cannot be
+    recovered: its marker is removed and an exception names the audio
+    or webcam files that were kept.
+    """
+    folder = os.path.dirname(marker)
+    with open(marker, encoding="utf-8") as f:
+        data = json.load(f)
+    video_path = os.path.join(folder, data["video"])
+    audio_paths = [os.path.join(folder, name) for name in _marker_audio(data)]
+    ffmpeg_exe = get_runner(ffmpeg_exe).require().path
+
+    if data.get("segmented"):
+        _recover_segments(ffmpeg_exe, video_path)
+
+    audio_paths = [path for path in audio_paths if os.path.exists(path)]
+    for audio_path in audio_paths:
+        # Compressed intermediates are flushed packet by packet and decode
+        # as they are; only a WAV header needs fixing
+        if audio_path.lower().endswith(".wav"):
+            repair_wav_header(audio_path)
+
+    track_path = webcam_track_path(video_path)
+    if not os.path.exists(video_path) or os.path.getsize(video_path) == 0:
+        os.remove(marker)
+        kept = audio_paths + [path for path in [track_path] if os.path.exists(path)]
+        if kept:
+            raise Exception("no screen video was recorded; kept "
+                            + ", ".join(os.path.basename(path) for path in kept))
+        return None
+
+    base, ext = os.path.splitext(video_path)
+    recovered = f"{base}_recovered{ext}"
+    args = ['-err_detect', 'ignore_err', '-i', video_path]
+    for audio_path in audio_paths:
+        args += ['-i', audio_path]
+    if audio_paths:
+        args += ['-map', '0:v:0']
+        for index in range(len(audio_paths)):
+            args += ['-map', f'{index + 1}:a:0']
+        args += ['-c:a', 'aac', '-shortest']
+    args += ['-c:v', 'copy', '-y', recovered]
+    _run_ffmpeg(ffmpeg_exe, args)
+
+    if os.path.exists(track_path) and os.path.getsize(track_path):
+        _run_ffmpeg(ffmpeg_exe, ['-err_detect', 'ignore_err', '-i', track_path,
+                                 '-c', 'copy', '-y', webcam_track_path(recovered)])
+        os.remove(track_path)
+
+    os.remove(video_path)
+    for audio_path in audio_paths:
+        os.remove(audio_path)
+    os.remove(marker)
+    return recovered
+
+
+def recover_orphans(folder, ffmpeg_exe=None):
+    """Scan `folder` for interrupted sessions and leftover audio.
+
+    Returns (recovered, failed) lists of (path, message) tuples. Sessions
+    started by this process (by SESSION_TOKEN) are still recording and
+    are left alone.
+    """
+    recovered = []
+    failed = []
+    if not os.path.isdir(folder):
+        return recovered, failed
+
+    active = set()
+    for marker in sorted(glob.glob(os.path.join(glob.escape(folder), "*" + MARKER_SUFFIX))):
+        try:
+            with open(marker, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("session") == SESSION_TOKEN:
+                active.update(_marker_audio(data))
+                continue
+            path = recover_session(marker, ffmpeg_exe)
+            if path:
+                if os.path.exists(webcam_track_path(path)):
+                    recovered.append((path, WEBCAM_RECOVERED))
+                else:
+                    recovered.append((path, "recovered"))
+                logging.info(f"Recovered interrupted recording: {path}")
+        except Exception as e:
+            logging.error(f"Recovery failed for {marker}: {e}")
+            failed.append((marker, str(e)))
+
+    # Audio saved separately after a failed merge, or from a crash without a
+    # marker, in any format open_audio_writer writes
+    paths = []
+    for ext in [".wav"] + sorted(AUDIO_INTERMEDIATES):
+        paths += glob.glob(os.path.join(glob.escape(folder), "audio_*" + ext))
+    for path in sorted(paths):
+        if os.path.basename(path) in active:
+            continue
+        try:
+            if repair_audio(path, ffmpeg_exe):
+                recovered.append((path, "audio header repaired"))
+        except Exception as e:
+            failed.append((path, str(e)))
+
+    return recovered, failed
@@ -0,0 +1,219 @@
+"""Frame and keyframe index of a video, for fast preview seeking"""
+import os
+import logging
+
+import cv2
+import numpy as np
+
+from ffmpeg_runner import get_runner
+
+# Indexes are cached in this folder next to the video
+INDEX_FOLDER = ".seekindex"
+
+
+class FrameIndex:
+    """Presentation time of every frame and the keyframe each one depends on.
+
+    Built once per file from a stream copy of the video packets (nothing
+    is decoded) and cached on disk, keyed by the file's size and
+    modification time. `times[n]` is the time of frame n in seconds from
+    the first frame, `start` the first frame's own timestamp in the file,
+    and
+    `keyframe_of[n]` the keyframe at or before it, so finding where to
+    start decoding is a single lookup.
+    """
+    def __init__(self, times, keyframe_of, start=0.0):
+        self.times = times
+        self.keyframe_of = keyframe_of
+        self.start = start
+        self.keyframes = np.unique(keyframe_of)
+
+    @property
+    def frame_count(self):
+        return len(self.times)
+
+    def next_keyframe(self, frame_no):
+        """First keyframe after `frame_no`, or the frame count"""
+        i = np.searchsorted(self.keyframes, frame_no, side="right")
+        return int(self.keyframes[i]) if i < len(self.keyframes) else self.frame_count
+
+    def previous_keyframe(self, frame_no):
+        """Last keyframe before the group of pictures of `frame_no`, or None"""
+        i = np.searchsorted(self.keyframes, self.keyframe_of[frame_no])
+        return int(self.keyframes[i - 1]) if i > 0 else None
+
+    def time_of(self, frame_no):
+        """Time of frame `frame_no` from the first frame; past the end, the end of the last frame"""
+        if frame_no < self.frame_count:
+            return float(self.times[max(frame_no, 0)])
+        if self.frame_count > 1:
+            return float(self.times[-1] + (self.times[-1] - self.times[-2]))
+        return 0.0
+
+    @classmethod
+    def from_packets(cls, pts, keys):
+        """Index from packet timestamps (seconds) and keyframe flags, in file order"""
+        order = np.argsort(pts, kind="stable")
+        start = float(pts[order[0]]) if len(order) else 0.0
+        times = pts[order] - start
+        frames = np.arange(len(order), dtype=np.int32)
+        # Each frame starts decoding from the latest keyframe at or before it
+        keyframe_of = np.maximum.accumulate(np.where(keys[order], frames, 0)).astype(np.int32)
+        return cls(times, keyframe_of, start)
+
+    @classmethod
+    def build(cls, video_path, ffmpeg_exe=None):
+        """Index `video_path` by listing its video packets with ffmpeg"""
+        result = get_runner(ffmpeg_exe).run(['-i', video_path, '-map', '0:v:0', '-c', 'copy', '-copyts',
+                                            '-f', 'framecrc', '-'])
+        if result.returncode != 0:
+            raise Exception(result.stderr.strip().splitlines()[-1] if result.stderr.strip()
+                            else f"ffmpeg exited with {result.returncode}")
+        time_base = None
+        pts, keys = [], []
+        for line in result.stdout.splitlines():
+            if line.startswith("#tb 0:"):
+                num, den = line.split(":", 1)[1].strip().split("/")
+                time_base = int(num) / int(den)
+                continue
+            if line.startswith("#") or not line.strip():
+                continue
+            # stream, dts, pts, duration, size, checksum[, F=flags]; flags
+            # are only printed when they differ from "keyframe"
+            fields = [field.strip() for field in line.split(",")]
+            flags = next((int(field[2:], 16) for field in fields[6:] if field.startswith("F=")), 1)
+            pts.append(int(fields[2]))
+            keys.append(bool(flags & 1))
+        if time_base is None or not pts:
+            raise Exception(f"No video frames in {os.path.basename(video_path)}")
+        return cls.from_packets(np.array(pts, np.float64) * time_base, np.array(keys, bool))
+
+    @staticmethod
+    def cache_path(video_path):
+        folder, name = os.path.split(os.path.abspath(video_path))
+        return os.path.join(folder, INDEX_FOLDER, name + ".npz")
+
+    @classmethod
+    def load(cls, video_path, ffmpeg_exe=None):
+        """The cached index of `video_path`, building and caching it if missing or stale"""
+        stat = os.stat(video_path)
+        stamp = np.array([stat.st_size, stat.st_mtime_ns], np.int64)
+        cache = cls.cache_path(video_path)
+        try:
+            with np.load(cache) as data:
+                if np.array_equal(data["stamp"], stamp):
+                    return cls(data["times"], data["keyframe_of"], float(data["start"]))
+        except (OSError, KeyError, ValueError):
+            pass
+
+        index = cls.build(video_path, ffmpeg_exe)
+        try:
+            os.makedirs(os.path.dirname(cache), exist_ok=True)
+            with open(cache, "wb") as f:
+                np.savez(f, stamp=stamp, times=index.times, keyframe_of=index.keyframe_of,
+                         start=np.float64(index.start))
+        except OSError as e:
+            logging.warning(f"Could not cache seek index: {e}")
+        return index
+
+    @classmethod
+    def remove(cls, video_path):
+        try:
+            os.remove(cls.cache_path(video_path))
+        except OSError:
+            pass
+
+
+class FrameSeeker:
+    """Reads frames out of order from a cv2.VideoCapture using a FrameIndex.
+
+    Every exact read starts from the indexed keyframe of the target's
+    group of pictures and decodes forward to the target:
+
+    - when the capture already stands between that keyframe and the
+      target, it just grabs forward;
+    - otherwise the capture is seeked. OpenCV's FFmpeg backend starts
+      decoding at the keyframe before `SEEK_LEAD` frames ahead of the
+      target, so that is the target's own keyframe when the target lies
+      at least `SEEK_LEAD` frames into its group;
+    - closer to its keyframe, OpenCV would decode the whole previous
+      group as well, so ffmpeg is run on `video_path` instead, seeking
+      straight to the keyframe's timestamp. That costs about as much as
+      decoding `SPAWN_FRAMES` frames, so a short previous group is still
+      left to OpenCV.
+
+    `exact=False` is for scrubbing: it picks the frame of the target's
+    group that is cheapest to reach, the keyframe plus `SEEK_LEAD`, so
+    each step costs a bounded number of decodes however long the groups
+    are. That frame is only near the one asked for; callers show it as
+    approximate.
+    """
+    # How far ahead of a seek target OpenCV's FFmpeg backend starts
+    SEEK_LEAD = 16
+    # Starting an ffmpeg process costs about this many decoded frames
+    SPAWN_FRAMES = 16
+
+    def __init__(self, cap, index, video_path=None):
+        self.cap = cap
+        self.index = index
+        self.video_path = video_path
+        self.position = None    # Frame the next read returns
+        self.decoded = 0        # Frames decoded, for stats
+        self.spawned = 0        # Reads decoded by an ffmpeg process
+
+    def target(self, frame_no, exact=True):
+        """The frame `read` shows for `frame_no`"""
+        frame_no = min(max(frame_no, 0), self.index.frame_count - 1)
+        if exact:
+            return frame_no
+        keyframe = int(self.index.keyframe_of[frame_no])
+        return min(keyframe + self.SEEK_LEAD, self.index.next_keyframe(frame_no) - 1)
+
+    def read(self, frame_no, exact=True):
+        """(frame number shown, frame) or (frame number, None)"""
+        frame_no = self.target(frame_no, exact)
+        keyframe = int(self.index.keyframe_of[frame_no])
+        if self.position is None or not keyframe <= self.position <= frame_no:
+            previous = self.index.previous_keyframe(frame_no)
+            if (frame_no - keyframe < self.SEEK_LEAD and previous is not None
+                    and keyframe - previous > self.SPAWN_FRAMES and self.video_path):
+                frame = self._decode_from(keyframe, frame_no)
+                if frame is not None:
+                    # The capture itself has not moved
+                    return frame_no, frame
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_no)
+            self.position = frame_no
+        while self.position < frame_no:
+            if not self.cap.grab():
+                self.position = None
+                return frame_no, None
+            self.position += 1
+            self.decoded += 1
+        ret, frame = self.cap.read()
+        self.decoded += 1
+        self.position = frame_no + 1 if ret else None
+        return frame_no, frame if ret else None
+
+    def _decode_from(self, keyframe, frame_no):
+        """Frame `frame_no` decoded by ffmpeg from `keyframe`, or None"""
+        width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        times = self.index.times
+        half = (times[1] - times[0]) / 2 if len(times) > 1 else 0.001
+        # Timestamps as stored in the file (-copyts): the demuxer lands
+        # on the keyframe at or before the seek, which is `keyframe`
+        # itself, and the target is picked by its own timestamp, so a
+        # container that seeks elsewhere yields either the right frame
+        # (from an earlier keyframe) or nothing
+        seek = self.index.start + times[keyframe] + half
+        shown = self.index.start + times[frame_no]
+        args = ['-copyts', '-seek_timestamp', '1', '-noaccurate_seek', '-ss', f"{seek:.6f}", '-i', self.video_path,
+                '-map', '0:v:0', '-vf', f"select=between(t\\,{shown - half:.6f}\\,{shown + half:.6f})",
+                '-frames:v', '1', '-fps_mode', 'passthrough', '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-']
+        result = get_runner().run(args, text=False)
+        if result.returncode != 0 or len(result.stdout) != width * height * 3:
+            logging.debug(f"Keyframe seek failed, seeking with OpenCV: {result.stderr.decode(errors='replace')[-200:]}")
+            return None
+        self.decoded += frame_no - keyframe + 1
+        self.spawned += 1
+        return np.frombuffer(result.stdout, np.uint8).reshape(height, width, 3)
@@ -0,0 +1,313 @@
+"""Webcam devices: enumeration, format negotiation and the frame reader"""
+import os
+import glob
+import time
+import logging
+import threading
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from converter import BGR24
+from encoders import create_encoder
+
+try:
+    # pygrabber lists DirectShow devices by name, in OpenCV's index order
+    from pygrabber.dshow_graph import FilterGraph
+except ImportError:
+    FilterGraph = None
+
+CameraDevice = namedtuple("CameraDevice", "index name")
+CameraFormat = namedtuple("CameraFormat", "fourcc width height fps")
+
+MJPG = "MJPG"
+YUYV = "YUYV"
+
+# Capture sizes nearly every UVC camera offers, smallest first
+STANDARD_SIZES = [(320, 240), (424, 240), (640, 360), (640, 480), (800, 600),
+                  (960, 540), (1280, 720), (1600, 900), (1920, 1080)]
+
+# Uncompressed 4:2:2 that fits comfortably in USB 2.0 bandwidth (bytes per
+# second); above it, cameras only reach the frame rate as MJPEG
+YUYV_BUDGET = 24e6
+
+
+def camera_backend():
+    """OpenCV capture API that honours format requests on this platform"""
+    if os.name == 'nt':
+        # Media Foundation ignores most FOURCC requests
+        return cv2.CAP_DSHOW
+    if os.path.isdir("/sys/class/video4linux"):
+        return cv2.CAP_V4L2
+    return cv2.CAP_ANY
+
+
+def list_cameras(max_devices=8):
+    """Cameras as CameraDevice(index, name), indexed as cv2.VideoCapture expects.
+
+    Names come from DirectShow (with pygrabber) or sysfs; otherwise
+    indices are probed by opening them, which takes a moment per device.
+    """
+    if FilterGraph is not None:
+        try:
+            return [CameraDevice(i, name) for i, name in enumerate(FilterGraph().get_input_devices())]
+        except Exception as e:
+            logging.debug(f"DirectShow enumeration failed: {e}")
+
+    nodes = sorted(glob.glob("/sys/class/video4linux/video*"), key=lambda path: int(path.rsplit("video", 1)[1]))
+    if nodes:
+        cameras = []
+        for node in nodes:
+            try:
+                # Index 0 is the capture node; the others carry metadata
+                with open(os.path.join(node, "index")) as f:
+                    if f.read().strip() != "0":
+                        continue
+                with open(os.path.join(node, "name")) as f:
+                    name = f.read().strip()
+            except OSError:
+                continue
+            cameras.append(CameraDevice(int(node.rsplit("video", 1)[1]), name))
+        return cameras
+
+    cameras = []
+    for index in range(max_devices):
+        cap = cv2.VideoCapture(index, camera_backend())
+        opened = cap.isOpened()
+        cap.release()
+        if not opened:
+            break
+        cameras.append(CameraDevice(index, f"Camera {index}"))
+    return cameras
+
+
+def choose_format(overlay_width, fps):
+    """Smallest standard capture format that covers the overlay at `fps`.
+
+    Returns the requested CameraFormat: YUYV when it fits the USB budget,
+    since it needs no decoding, MJPEG otherwise.
+    """
+    width, height = next(((w, h) for w, h in STANDARD_SIZES if w >= overlay_width), STANDARD_SIZES[-1])
+    fourcc = YUYV if width * height * 2 * fps <= YUYV_BUDGET else MJPG
+    return CameraFormat(fourcc, width, height, fps)
+
+
+def fourcc_name(value):
+    code = int(value)
+    return "".join(chr((code >> 8 * i) & 0xFF) for i in range(4)).strip("\0")
+
+
+def open_camera(index, requested):
+    """Open camera `index` and negotiate `requested` (a CameraFormat).
+
+    The other pixel format is tried if the driver refuses the first. The
+    camera decides in the end: the returned CameraFormat is what it
+    reports, and the caller copes with whatever size arrives.
+    """
+    cap = cv2.VideoCapture(index, camera_backend())
+    if not cap.isOpened():
+        cap.release()
+        raise Exception(f"Camera {index} could not be opened")
+
+    for fourcc in (requested.fourcc, MJPG if requested.fourcc == YUYV else YUYV):
+        # FOURCC first: some drivers reset the size when the format changes
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, requested.width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, requested.height)
+        cap.set(cv2.CAP_PROP_FPS, requested.fps)
+        if fourcc_name(cap.get(cv2.CAP_PROP_FOURCC)) == fourcc:
+            break
+
+    actual = CameraFormat(fourcc_name(cap.get(cv2.CAP_PROP_FOURCC)) or "?",
+                          int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                          int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                          cap.get(cv2.CAP_PROP_FPS) or requested.fps)
+    logging.info(f"Camera {index}: requested {requested.width}x{requested.height} {requested.fourcc} "
+                 f"@{requested.fps}, got {actual.width}x{actual.height} {actual.fourcc} @{actual.fps:g}")
+    return cap, actual
+
+
+class WebcamReader(threading.Thread):
+    """Thread for reading webcam frames continuously.
+
+    The camera is opened at the smallest format that covers the overlay
+    (see `choose_format`) and read at its own cadence: `grab` waits for
+    the next frame, and only frames due at the recording rate are decoded
+    and resized. Each is cropped to `aspect` (width/height, None for the
+    camera's own) and resized to the overlay size here, on the reader's
+    own thread, and published with a sequence number. Three overlay
+    buffers rotate: one being written, one published, one held by the
+    compositor, so `latest` hands out a buffer without copying it and the
+    compositor can tell from the sequence number whether anything is new.
+    """
+    def __init__(self, camera_id=0, overlay_width=None, fps=30, aspect=None):
+        super().__init__()
+        self.camera_id = camera_id
+        self.overlay_width = overlay_width
+        self.aspect = aspect
+        self.fps = fps
+        self.format = None
+        self.running = True
+        self.lock = threading.Lock()
+        self.daemon = True  # Daemon thread ensures it dies with the app
+        self.buffers = []
+        self.published = None   # Index of the newest overlay
+        self.held = None        # Index the compositor is reading
+        self.sequence = 0
+        self.camera_frames = 0
+        self.cpu_seconds = 0.0
+        self.seconds = 0.0
+
+    def open(self):
+        """(capture, CameraFormat); anything with grab/retrieve/release will do"""
+        return open_camera(self.camera_id, choose_format(self.overlay_width or 0, self.fps))
+
+    def run(self):
+        started, cpu_started = time.perf_counter(), time.thread_time()
+        try:
+            cap, self.format = self.open()
+            # Decode at the recording rate at most; grab every camera frame
+            # so the newest one is always the next in line
+            camera_period = 1.0 / max(self.format.fps, 1)
+            period = 1.0 / min(self.fps, self.format.fps or self.fps)
+            due = 0.0
+            while self.running:
+                grab_started = time.perf_counter()
+                if not cap.grab():
+                    time.sleep(0.1)
+                    continue
+                self.camera_frames += 1
+                timestamp = time.monotonic()
+                now = time.perf_counter()
+                # Half a camera frame of slack absorbs delivery jitter
+                if now + camera_period / 2 >= due:
+                    due = max(due + period, now + period - camera_period / 2)
+                    ret, frame = cap.retrieve()
+                    if ret:
+                        self._publish(frame, timestamp)
+                # Backends that return immediately instead of waiting for
+                # the camera would otherwise spin a core
+                spare = camera_period / 2 - (time.perf_counter() - grab_started)
+                if spare > 0:
+                    time.sleep(spare)
+            cap.release()
+        except Exception as e:
+            logging.error(f"Webcam error: {e}")
+        finally:
+            self._finish()
+            self.seconds = time.perf_counter() - started
+            self.cpu_seconds = time.thread_time() - cpu_started
+
+    def _finish(self):
+        pass
+
+    def _publish(self, frame, timestamp):
+        width = self.overlay_width
+        if not width:
+            return
+        if self.aspect is not None:
+            # Centre crop, e.g. square for a circular overlay
+            fh, fw = frame.shape[:2]
+            if fw / fh > self.aspect:
+                crop = int(fh * self.aspect)
+                frame = frame[:, (fw - crop) // 2:(fw - crop) // 2 + crop]
+            else:
+                crop = int(fw / self.aspect)
+                frame = frame[(fh - crop) // 2:(fh - crop) // 2 + crop]
+        height = int(width / (frame.shape[1] / frame.shape[0]))
+        if not self.buffers or self.buffers[0].shape[:2] != (height, width):
+            with self.lock:
+                self.buffers = [np.empty((height, width, 3), np.uint8) for _ in range(3)]
+                self.published = self.held = None
+        # Neither the published nor the held buffer is ever written
+        index = next(i for i in range(3) if i != self.published and i != self.held)
+        cv2.resize(frame, (width, height), dst=self.buffers[index], interpolation=cv2.INTER_AREA)
+        with self.lock:
+            self.published = index
+            self.sequence += 1
+
+    def latest(self):
+        """(sequence, overlay) of the newest frame, or (0, None) before the first.
+
+        The overlay stays valid until the next call.
+        """
+        with self.lock:
+            if self.published is None:
+                return 0, None
+            self.held = self.published
+            return self.sequence, self.buffers[self.held]
+
+    @property
+    def stats(self):
+        return {
+            "format": self.format,
+            "camera_frames": self.camera_frames,
+            "published": self.sequence,
+            "cpu_percent": self.cpu_seconds / self.seconds * 100 if self.seconds else 0.0,
+        }
+
+    def stop(self):
+        self.running = False
+
+
+class WebcamTrackWriter(WebcamReader):
+    """Records the camera to its own video file on the session clock.
+
+    Frame n of the track covers session time n / fps, as in the screen
+    recording, so the two line up frame for frame and can be composited
+    after recording (see compositor.composite_job) in any layout. Slots
+    before the first camera frame repeat it, gaps repeat the previous
+    frame, and the track is padded to the session length when it stops;
+    paused time maps to no slots. Nothing is published for live overlay.
+    """
+    # Camera resolution for the track: enough for any later layout
+    MIN_WIDTH = 640
+
+    def __init__(self, camera_id, filename, fps, session, encoder_settings=None):
+        super().__init__(camera_id, fps=fps)
+        self.filename = filename
+        self.session = session
+        self.encoder_settings = encoder_settings
+        self.encoder = None
+        self.slots = 0          # Frames written
+        self._last = None
+
+    def open(self):
+        return open_camera(self.camera_id, choose_format(self.MIN_WIDTH, self.fps))
+
+    def _publish(self, frame, timestamp):
+        if self.session.stop_time is not None and timestamp >= self.session.stop_time:
+            return
+        slot = int(self.session.session_time(timestamp) * self.fps)
+        if slot < self.slots:
+            # Paused, or still within the slot of the previous frame
+            return
+        if self.encoder is None:
+            height, width = frame.shape[:2]
+            # Camera frames are BGR whatever the screen encoder takes
+            settings = dict(self.encoder_settings, input_format=BGR24) if self.encoder_settings else None
+            self.encoder = create_encoder(self.filename, width, height, self.fps, settings)
+            self._last = frame
+        self._fill(slot)
+        self.encoder.write(frame)
+        self.slots = slot + 1
+        self._last = frame
+
+    def _fill(self, slot):
+        """Repeat the last frame up to (not including) `slot`"""
+        while self.slots < slot:
+            self.encoder.write(self._last)
+            self.slots += 1
+
+    def _finish(self):
+        if self.encoder is None:
+            return
+        try:
+            self._fill(int(self.session.now() * self.fps))
+        finally:
+            self.encoder.close()
+
+    @property
+    def stats(self):
+        return dict(super().stats, slots=self.slots)
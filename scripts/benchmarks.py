@@ -0,0 +1,579 @@
+"""Performance benchmarks for the recording pipeline.
+
+Run from the project root, e.g.:
+    python scripts\\benchmarks.py alloc --size 3840x2160
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+
+# Make the application modules importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from pipeline import FramePool
+from converter import FrameConverter, BGR24, BGRA, YUV420P, frame_shape
+from capture import CAPTURE_BACKENDS, create_capture_backend, resolve_capture_area
+from encoders import FFmpegEncoder
+from audio import AudioSource, AudioMixer, AutoGain, open_audio_writer
+from webcam import WebcamReader, CameraFormat, choose_format
+from compositor import PictureInPicture, RECTANGLE, ROUNDED, CIRCLE
+from seekindex import FrameIndex, FrameSeeker
+from ffmpeg_runner import get_runner
+
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def report(title, rows):
+    print(f"\n{title}")
+    for label, value in rows:
+        print(f"  {label:<32} {value}")
+
+
+def bench_alloc(args):
+    """Steady-state allocation of the convert hot loop: legacy vs pooled"""
+    import cv2
+
+    width, height = parse_size(args.size)
+    out_size = (int(width * args.scale), int(height * args.scale))
+    raw = bytearray(np.random.randint(0, 255, width * height * 4, dtype=np.uint8).tobytes())
+    bgra = np.frombuffer(raw, dtype=np.uint8).reshape(height, width, 4)
+    web_frame = np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
+
+    def legacy(_):
+        frame = np.array(bgra)
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+        if out_size != (width, height):
+            frame = cv2.resize(frame, out_size, interpolation=cv2.INTER_AREA)
+        target_w = frame.shape[1] // 5
+        target_h = int(target_w / (640 / 480))
+        frame[20:20+target_h, 20:20+target_w] = cv2.resize(web_frame, (target_w, target_h))
+        return frame
+
+    pool = FramePool((out_size[1], out_size[0], 3), count=4)
+    converter = FrameConverter(pool, (width, height), out_size)
+
+    def pooled(previous):
+        frame = converter.convert(bgra)
+        converter.overlay(frame, web_frame)
+        pool.release(previous)
+        return frame
+
+    rows = []
+    for name, step in (("legacy", legacy), ("pooled", pooled)):
+        frame = None
+        # Warm up so one-time buffers are excluded from the steady state
+        for _ in range(5):
+            frame = step(frame)
+
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        allocated = 0
+        start = time.perf_counter()
+        for _ in range(args.frames):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            frame = step(frame)
+            _, peak = tracemalloc.get_traced_memory()
+            allocated += max(0, peak - before)
+        elapsed = time.perf_counter() - start
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        rows.append((f"{name}: allocated per frame", f"{allocated / args.frames / 1e6:.2f} MB"))
+        rows.append((f"{name}: allocation rate @30fps", f"{allocated / args.frames * 30 / 1e6:.1f} MB/s"))
+        rows.append((f"{name}: retained after run", f"{(current - base) / 1e6:.2f} MB"))
+        rows.append((f"{name}: time per frame", f"{elapsed / args.frames * 1000:.2f} ms"))
+    rows.append(("pool buffers allocated in loop", pool.stats()["allocations"]))
+
+    report(f"Allocation benchmark {width}x{height} -> {out_size[0]}x{out_size[1]}, {args.frames} frames", rows)
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def bench_grab(args):
+    """Grab latency per capture backend"""
+    names = args.backends.split(",") if args.backends else list(CAPTURE_BACKENDS)
+    rows = []
+    for name in names:
+        options = {}
+        if name == "synthetic":
+            width, height = parse_size(args.size)
+            options = {"width": width, "height": height}
+        try:
+            backend = create_capture_backend(name, **options)
+            area = resolve_capture_area(backend.monitors(), monitor_number=args.monitor)
+            backend.open(area)
+        except Exception as e:
+            rows.append((name, f"unavailable ({e})"))
+            continue
+
+        with backend:
+            for _ in range(5):
+                backend.grab()
+            samples = []
+            for _ in range(args.frames):
+                start = time.perf_counter()
+                backend.grab()
+                samples.append((time.perf_counter() - start) * 1000)
+
+        mean = sum(samples) / len(samples)
+        rows.append((f"{name} {area['width']}x{area['height']}",
+                     f"mean {mean:.2f} ms  p50 {percentile(samples, 0.5):.2f} ms  "
+                     f"p95 {percentile(samples, 0.95):.2f} ms  max fps {1000 / mean:.0f}"))
+
+    report(f"Grab latency, {args.frames} grabs", rows)
+
+
+class NullEncoder(FFmpegEncoder):
+    """FFmpegEncoder converting to yuv420p but discarding the output"""
+    def output_args(self):
+        return ['-an', '-c:v', 'rawvideo', '-pix_fmt', 'yuv420p', '-f', 'null']
+
+
+def bench_pixfmt(args):
+    """BGR24 vs BGRA pass-through vs in-process I420 into the ffmpeg pipe"""
+    rows = []
+    for size in args.sizes.split(","):
+        width, height = parse_size(size)
+        bgra = np.random.randint(0, 255, (height, width, 4), dtype=np.uint8)
+        for pixel_format in (BGR24, BGRA, YUV420P):
+            pool = FramePool(frame_shape(pixel_format, width, height), count=2)
+            converter = FrameConverter(pool, (width, height), (width, height), pixel_format)
+
+            # In-process conversion only
+            start = time.perf_counter()
+            for _ in range(args.frames):
+                pool.release(converter.convert(bgra))
+            convert_ms = (time.perf_counter() - start) / args.frames * 1000
+
+            # Conversion + pipe + ffmpeg's own conversion to yuv420p
+            encoder = NullEncoder("-", width, height, 30, input_format=pixel_format)
+            encoder.open()
+            children = os.times()
+            start = time.perf_counter()
+            for _ in range(args.frames):
+                frame = converter.convert(bgra)
+                encoder.write(frame)
+                pool.release(frame)
+            encoder.close()
+            elapsed = time.perf_counter() - start
+            child_cpu = sum(os.times()[2:4]) - sum(children[2:4])
+
+            frame_bytes = int(np.prod(frame_shape(pixel_format, width, height)))
+            rows.append((f"{width}x{height} {pixel_format}",
+                         f"convert {convert_ms:.2f} ms  pipe {frame_bytes / 1e6:.1f} MB/frame  "
+                         f"end-to-end {args.frames / elapsed:.0f} fps  ffmpeg cpu {child_cpu / args.frames * 1000:.2f} ms/frame"))
+
+    report(f"Encoder input formats, {args.frames} frames each", rows)
+
+
+def bench_fragment(args):
+    """Write time and size overhead of fragmented (crash-safe) output"""
+    import tempfile
+
+    width, height = parse_size(args.size)
+    pool = FramePool(frame_shape(YUV420P, width, height), count=2)
+    converter = FrameConverter(pool, (width, height), (width, height), YUV420P)
+    # A moving pattern so every fragment carries real P-frames
+    source = create_capture_backend("synthetic", width=width, height=height)
+    source.open(resolve_capture_area(source.monitors()))
+    frames = []
+    for _ in range(args.frames):
+        frame = converter.convert(source.grab())
+        frames.append(frame.copy())
+        pool.release(frame)
+    source.close()
+
+    intervals = [None] + [float(value) for value in args.intervals.split(",")]
+    rows = []
+    with tempfile.TemporaryDirectory() as folder:
+        for ext in (".mp4", ".mkv"):
+            baseline = None
+            for interval in intervals:
+                filename = os.path.join(folder, f"fragment_{interval}{ext}")
+                encoder = FFmpegEncoder(filename, width, height, args.fps, input_format=YUV420P,
+                                        fragment_seconds=interval)
+                encoder.open()
+                start = time.perf_counter()
+                for frame in frames:
+                    encoder.write(frame)
+                encoder.close()
+                elapsed = time.perf_counter() - start
+                size = os.path.getsize(filename)
+                if baseline is None:
+                    baseline = (elapsed, size)
+                label = f"{ext[1:]} {'off' if interval is None else f'{interval:g} s'}"
+                rows.append((label, f"{args.frames / elapsed:.0f} fps  {size / 1e6:.2f} MB  "
+                                    f"time {(elapsed / baseline[0] - 1) * 100:+.1f}%  "
+                                    f"size {(size / baseline[1] - 1) * 100:+.1f}%"))
+
+    report(f"Fragmented output {width}x{height}, {args.frames} frames @ {args.fps} fps", rows)
+
+
+class NullSink:
+    def __init__(self):
+        self.frames = 0
+
+    def write(self, block):
+        self.frames += len(block)
+
+
+def bench_mix(args):
+    """Mixing cost per second of audio: microphone + loopback, resampled, metered, gained, limited"""
+    rate, channels, block = 44100, 2, args.block
+    seconds = args.seconds
+    rng = np.random.default_rng(0)
+    inputs = {
+        # name: (device rate, device channels, level)
+        "microphone": (44100, 1, 600),
+        "system": (args.system_rate, 2, 6000),
+    }
+    signals = {name: (rng.standard_normal((device_rate * seconds, device_channels)) * level).astype(np.int16)
+               for name, (device_rate, device_channels, level) in inputs.items()}
+
+    def run(names, separate, autogain):
+        sources = [AudioSource(name, inputs[name][0], inputs[name][1], rate, channels,
+                               autogain=AutoGain() if autogain else None)
+                   for name in names]
+        sinks = [NullSink() for _ in sources] if separate else [NullSink()]
+        mixer = AudioMixer(sources, sinks, rate, channels)
+        steps = int(seconds * rate / block)
+        start = time.perf_counter()
+        for step in range(steps):
+            t = step * block / rate
+            for source in sources:
+                device_block = int(round(block * source.rate / rate))
+                offset = int(round(t * source.rate))
+                source.process(signals[source.name][offset:offset + device_block], t)
+            mixer.mix()
+        for source in sources:
+            source.corrector.finish(steps * block / rate)
+        mixer.mix(final=True)
+        elapsed = time.perf_counter() - start
+        return elapsed, sum(sink.frames for sink in sinks) / len(sinks) / rate, mixer.loudness()
+
+    rows = []
+    for label, names, separate, autogain in (
+            ("microphone only", ["microphone"], False, False),
+            ("microphone only, loudness", ["microphone"], False, True),
+            ("mic + system, mixed", ["microphone", "system"], False, False),
+            ("mic + system, mixed, loudness", ["microphone", "system"], False, True),
+            ("mic + system, separate, loudness", ["microphone", "system"], True, True)):
+        elapsed, audio_seconds, loudness = run(names, separate, autogain)
+        levels = ", ".join(f"{value:.1f}" for value in loudness)
+        rows.append((label, f"{elapsed / audio_seconds * 1000:6.2f} ms per audio second "
+                            f"({audio_seconds / elapsed:,.0f}x realtime), output {levels} LUFS"))
+
+    report(f"Audio mixing, {seconds} s @ {rate} Hz, {block}-frame blocks, system at {args.system_rate} Hz", rows)
+
+
+def bench_audioenc(args):
+    """Audio intermediate throughput and size: WAV vs FLAC vs Opus, mono vs stereo"""
+    import tempfile
+
+    rate, seconds, block = args.rate, args.seconds, args.block
+    rng = np.random.default_rng(0)
+    t = np.arange(rate * seconds) / rate
+    # Speech-like: a few harmonics with a slow envelope, over a noise floor
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 0.7 * t)
+    voice = sum(np.sin(2 * np.pi * f * t) / (i + 1) for i, f in enumerate((180, 360, 540, 1100)))
+    signal = (voice * envelope * 4000 + rng.standard_normal(len(t)) * 60).astype(np.int16)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as folder:
+        for channels in (1, 2):
+            pcm = np.repeat(signal[:, None], channels, axis=1)
+            wav_size = None
+            for ext in args.formats.split(","):
+                path = os.path.join(folder, f"bench{channels}{ext}")
+                start = time.perf_counter()
+                writer = open_audio_writer(path, channels, 2, rate)
+                for offset in range(0, len(pcm), block):
+                    writer.write(pcm[offset:offset + block])
+                writer.close()
+                elapsed = time.perf_counter() - start
+                size = os.path.getsize(path)
+                wav_size = wav_size or size
+                rows.append((f"{channels} ch {ext}",
+                             f"{seconds / elapsed:7.0f}x realtime, {size / seconds / 1024:6.1f} KiB/s "
+                             f"({size / wav_size * 100:5.1f}% of {args.formats.split(',')[0]})"))
+
+    report(f"Audio intermediates, {seconds} s @ {rate} Hz, {block}-frame writes", rows)
+
+
+class SyntheticCamera:
+    """Stands in for cv2.VideoCapture: frames at `format.fps`, decoded like the real format.
+
+    `blocking` cameras make grab wait for the next frame, as DirectShow
+    and V4L2 do; others return at once, like backends that hand out the
+    last frame again.
+    """
+    def __init__(self, format, blocking=True):
+        import cv2
+
+        self.format = format
+        self.blocking = blocking
+        rng = np.random.default_rng(0)
+        image = cv2.GaussianBlur(rng.integers(0, 255, (format.height, format.width, 3), dtype=np.uint8), (9, 9), 0)
+        if format.fourcc == "MJPG":
+            self.payload = cv2.imencode(".jpg", image)[1]
+        else:
+            # YUYV: 2 bytes per pixel
+            self.payload = cv2.cvtColor(image, cv2.COLOR_BGR2YUV)[:, :, :2].copy()
+        self.next_frame = time.perf_counter()
+
+    def grab(self):
+        if self.blocking:
+            delay = self.next_frame - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.next_frame = max(self.next_frame + 1.0 / self.format.fps, time.perf_counter())
+        return True
+
+    def retrieve(self):
+        import cv2
+
+        if self.format.fourcc == "MJPG":
+            return True, cv2.imdecode(self.payload, cv2.IMREAD_COLOR)
+        return True, cv2.cvtColor(self.payload, cv2.COLOR_YUV2BGR_YUYV)
+
+    def read(self):
+        self.grab()
+        return self.retrieve()
+
+    def release(self):
+        pass
+
+
+def bench_webcam(args):
+    """Webcam reader CPU: driver-default format read in a loop vs negotiated format at camera cadence"""
+    import cv2
+    import threading
+
+    width, height = parse_size(args.output)
+    overlay_width = width // 5
+    default_width, default_height = parse_size(args.default_size)
+    default = CameraFormat(args.default_fourcc, default_width, default_height, args.camera_fps)
+    negotiated = choose_format(overlay_width, args.fps)
+    # The camera runs at its own rate whatever the recording asks for
+    negotiated = negotiated._replace(fps=args.camera_fps)
+
+    def legacy(camera, stop, result):
+        # The previous reader: read every frame and copy it for the
+        # compositor, which resized it again on every output frame
+        started, cpu_started = time.perf_counter(), time.thread_time()
+        frames = 0
+        while not stop.is_set():
+            ret, frame = camera.read()
+            if ret:
+                frames += 1
+                frame = frame.copy()
+                cv2.resize(frame, (overlay_width, int(overlay_width * frame.shape[0] / frame.shape[1])))
+        result.update(decoded=frames, cpu=(time.thread_time() - cpu_started) / (time.perf_counter() - started))
+
+    class Reader(WebcamReader):
+        def __init__(self, camera):
+            super().__init__(overlay_width=overlay_width, fps=args.fps)
+            self.camera = camera
+
+        def open(self):
+            return self.camera, self.camera.format
+
+    rows = []
+    for blocking in (True, False):
+        kind = "blocking" if blocking else "polling"
+        result = {}
+        stop = threading.Event()
+        thread = threading.Thread(target=legacy, args=(SyntheticCamera(default, blocking), stop, result))
+        thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        thread.join()
+        rows.append((f"legacy {default.width}x{default.height} {default.fourcc}, {kind}",
+                     f"{result['cpu'] * 100:5.1f}% CPU, {result['decoded'] / args.seconds:6.1f} decodes/s"))
+
+        reader = Reader(SyntheticCamera(negotiated, blocking))
+        reader.start()
+        time.sleep(args.seconds)
+        reader.stop()
+        reader.join()
+        stats = reader.stats
+        rows.append((f"reader {negotiated.width}x{negotiated.height} {negotiated.fourcc}, {kind}",
+                     f"{stats['cpu_percent']:5.1f}% CPU, {stats['published'] / args.seconds:6.1f} decodes/s"))
+
+    report(f"Webcam reader, {overlay_width}px overlay for {args.output} @ {args.fps} fps, "
+           f"camera @ {args.camera_fps} fps, {args.seconds} s each", rows)
+
+
+def bench_pip(args):
+    """Picture-in-picture cost per frame: legacy rectangle paste vs masked, bordered, translucent overlays"""
+    import cv2
+
+    camera = np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
+    rows = []
+    for size in args.sizes.split(","):
+        width, height = parse_size(size)
+        frame = np.random.randint(0, 255, (height, width, 4), dtype=np.uint8)
+
+        overlay_w = width // 5
+        overlay = cv2.resize(camera, (overlay_w, overlay_w * 3 // 4))
+
+        def legacy():
+            frame[height - overlay.shape[0] - 20:height - 20, width - overlay_w - 20:width - 20, :3] = overlay
+
+        layouts = [
+            ("rectangle", PictureInPicture(shape=RECTANGLE)),
+            ("rounded, border", PictureInPicture(shape=ROUNDED, border=3)),
+            ("circle, border", PictureInPicture(shape=CIRCLE, border=3)),
+            ("rounded, 80% opacity", PictureInPicture(shape=ROUNDED, opacity=0.8)),
+        ]
+        cases = [("legacy paste", legacy)]
+        for label, layout in layouts:
+            # Overlays arrive pre-sized from the webcam reader
+            sized = cv2.resize(camera[:, 80:560] if layout.aspect else camera,
+                               (overlay_w, overlay_w if layout.aspect else overlay_w * 3 // 4))
+            cases.append((label, lambda layout=layout, sized=sized: layout.composite(frame, sized)))
+
+        for label, composite in cases:
+            composite()
+            start = time.perf_counter()
+            for _ in range(args.frames):
+                composite()
+            elapsed = time.perf_counter() - start
+            rows.append((f"{size} {label}", f"{elapsed / args.frames * 1000:6.3f} ms per frame"))
+
+    report(f"Picture-in-picture onto BGRA frames, {args.frames} frames", rows)
+
+
+def bench_seek(args):
+    """Trimmer preview seeks: cv2 frame seeks vs the keyframe index (exact and scrubbing)"""
+    import cv2
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = args.video
+        if path is None:
+            path = os.path.join(folder, "seek.mp4")
+            get_runner().require().run(['-f', 'lavfi', '-i', f'testsrc2=size={args.size}:rate={args.fps}',
+                                        '-t', str(args.seconds), '-c:v', 'libx264', '-preset', 'ultrafast',
+                                        '-g', str(args.gop), '-y', path])
+        FrameIndex.remove(path)
+        start = time.perf_counter()
+        index = FrameIndex.load(path)
+        built = time.perf_counter() - start
+        start = time.perf_counter()
+        FrameIndex.load(path)
+        cached = time.perf_counter() - start
+
+        rng = np.random.default_rng(0)
+        jumps = rng.integers(0, index.frame_count, args.seeks)
+        steps = np.arange(index.frame_count // 3, index.frame_count // 3 + args.seeks)
+
+        def legacy(cap, frame_no):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(frame_no))
+            cap.read()
+
+        rows = [("index build", f"{built * 1000:8.1f} ms ({index.frame_count} frames, "
+                                f"{len(index.keyframes)} keyframes)"),
+                ("index from cache", f"{cached * 1000:8.1f} ms")]
+        for pattern, targets in (("random jumps", jumps), ("frame steps", steps)):
+            for label, exact in (("cv2 seek", None), ("index, exact", True), ("index, keyframe", False)):
+                cap = cv2.VideoCapture(path)
+                seeker = FrameSeeker(cap, index, path)
+                shown = None
+                start = time.perf_counter()
+                for frame_no in targets:
+                    if exact is None:
+                        legacy(cap, frame_no)
+                    elif seeker.target(int(frame_no), exact) != shown:
+                        # The dialog keeps the preview when the frame is the same
+                        shown, _ = seeker.read(int(frame_no), exact)
+                elapsed = time.perf_counter() - start
+                cap.release()
+                rows.append((f"{pattern}: {label}", f"{elapsed / len(targets) * 1000:8.1f} ms per seek"))
+        source = path if args.video else f"{args.seconds} s {args.size} @ {args.fps} fps, GOP {args.gop}"
+        report(f"Preview seeking, {source}, {args.seeks} seeks", rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flux Screen Recorder benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    alloc = sub.add_parser("alloc", help=bench_alloc.__doc__)
+    alloc.add_argument("--size", default="3840x2160")
+    alloc.add_argument("--scale", type=float, default=1.0)
+    alloc.add_argument("--frames", type=int, default=100)
+    alloc.set_defaults(func=bench_alloc)
+
+    grab = sub.add_parser("grab", help=bench_grab.__doc__)
+    grab.add_argument("--backends", help="Comma-separated backend names (default: all)")
+    grab.add_argument("--monitor", type=int, default=1)
+    grab.add_argument("--size", default="1920x1080", help="Synthetic backend resolution")
+    grab.add_argument("--frames", type=int, default=200)
+    grab.set_defaults(func=bench_grab)
+
+    pixfmt = sub.add_parser("pixfmt", help=bench_pixfmt.__doc__)
+    pixfmt.add_argument("--sizes", default="1920x1080,3840x2160")
+    pixfmt.add_argument("--frames", type=int, default=60)
+    pixfmt.set_defaults(func=bench_pixfmt)
+
+    fragment = sub.add_parser("fragment", help=bench_fragment.__doc__)
+    fragment.add_argument("--size", default="1920x1080")
+    fragment.add_argument("--fps", type=int, default=30)
+    fragment.add_argument("--frames", type=int, default=300)
+    fragment.add_argument("--intervals", default="0.5,1,2,5", help="Comma-separated fragment lengths in seconds")
+    fragment.set_defaults(func=bench_fragment)
+
+    mix = sub.add_parser("mix", help=bench_mix.__doc__)
+    mix.add_argument("--seconds", type=int, default=60)
+    mix.add_argument("--block", type=int, default=2205, help="Frames per drain (50 ms at 44.1 kHz)")
+    mix.add_argument("--system-rate", type=int, default=48000, help="Loopback device rate")
+    mix.set_defaults(func=bench_mix)
+
+    audioenc = sub.add_parser("audioenc", help=bench_audioenc.__doc__)
+    audioenc.add_argument("--seconds", type=int, default=120)
+    audioenc.add_argument("--rate", type=int, default=48000)
+    audioenc.add_argument("--block", type=int, default=2400, help="Frames per write (50 ms at 48 kHz)")
+    audioenc.add_argument("--formats", default=".wav,.flac,.opus", help="Comma-separated extensions, first is the baseline")
+    audioenc.set_defaults(func=bench_audioenc)
+
+    webcam = sub.add_parser("webcam", help=bench_webcam.__doc__)
+    webcam.add_argument("--output", default="1920x1080", help="Recording resolution")
+    webcam.add_argument("--fps", type=int, default=15, help="Recording frame rate")
+    webcam.add_argument("--camera-fps", type=int, default=30)
+    webcam.add_argument("--default-size", default="1280x720", help="Format the driver picks when not asked")
+    webcam.add_argument("--default-fourcc", default="MJPG")
+    webcam.add_argument("--seconds", type=float, default=5)
+    webcam.set_defaults(func=bench_webcam)
+
+    pip = sub.add_parser("pip", help=bench_pip.__doc__)
+    pip.add_argument("--sizes", default="1920x1080,3840x2160")
+    pip.add_argument("--frames", type=int, default=200)
+    pip.set_defaults(func=bench_pip)
+
+    seek = sub.add_parser("seek", help=bench_seek.__doc__)
+    seek.add_argument("--video", help="Video to seek in (default: a generated one)")
+    seek.add_argument("--seconds", type=int, default=600)
+    seek.add_argument("--size", default="1280x720")
+    seek.add_argument("--fps", type=int, default=30)
+    seek.add_argument("--gop", type=int, default=250)
+    seek.add_argument("--seeks", type=int, default=60)
+    seek.set_defaults(func=bench_seek)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Dirty-tile folding of the ChangeDetector"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Make the application modules importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from analysis import ChangeDetector
+
+
+def frame(width, height, value=0):
+    return np.full((height, width, 4), value, np.uint8)
+
+
+def test_first_frame_counts_as_changed_and_a_repeat_as_static():
+    detector = ChangeDetector(64, 64, tile=32)
+    image = frame(64, 64)
+    assert detector.update(image) == 1.0
+    assert detector.update(image.copy()) == 0.0
+    assert detector.stats()["static_frames"] == 1
+
+
+@pytest.mark.parametrize("x, y", [(0, 0), (7, 0), (8, 31), (31, 31), (32, 0), (63, 32), (40, 63)])
+def test_one_pixel_marks_its_own_tile(x, y):
+    # Pixels on either side of each uint64 word and tile boundary
+    detector = ChangeDetector(64, 64, tile=32)
+    image = frame(64, 64)
+    detector.update(image)
+    changed = image.copy()
+    changed[y, x, 2] = 255
+    assert detector.update(changed) == 1 / 4
+
+
+def test_partial_tiles_at_the_right_and_bottom_edges():
+    # 70x40 with 32 px tiles: 3 columns (the last 6 px wide) by 2 rows
+    detector = ChangeDetector(70, 40, tile=32)
+    assert detector.tile_count == 6
+    image = frame(70, 40)
+    detector.update(image)
+    changed = image.copy()
+    changed[39, 69, 0] = 1
+    assert detector.update(changed) == 1 / 6
+    changed[0, 0, 3] = 1
+    assert detector.update(changed) == 1 / 6
+
+
+def test_changes_are_measured_against_the_last_changed_frame():
+    detector = ChangeDetector(64, 32, tile=32)
+    image = frame(64, 32)
+    detector.update(image)
+    changed = image.copy()
+    changed[:, 40:] = 9
+    assert detector.update(changed) == 0.5
+    assert detector.update(changed) == 0.0
+    detector.reset()
+    assert detector.update(changed) == 1.0
+
+
+def test_tile_must_be_a_multiple_of_eight():
+    with pytest.raises(ValueError):
+        ChangeDetector(64, 64, tile=12)
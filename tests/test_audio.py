@@ -0,0 +1,141 @@
+"""Audio ring buffer, streaming WAV writer and drift correction"""
+import os
+import sys
+
+import wave
+
+import numpy as np
+from pytest import approx
+
+# Make the application modules importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from audio import AudioRingBuffer, DriftCorrector, StreamingWavWriter
+
+
+def frames(start, count, channels=2):
+    """(count, channels) int16 frames numbered from `start`"""
+    return np.repeat(np.arange(start, start + count, dtype=np.int16)[:, None], channels, axis=1)
+
+
+def test_reads_wrap_around_the_end():
+    ring = AudioRingBuffer(8, 2)
+    out = np.empty((8, 2), np.int16)
+    ring.write(frames(0, 6))
+    assert ring.read(out[:4]) == 4
+    ring.write(frames(6, 6))
+    assert ring.available() == 8
+    assert ring.read(out) == 8
+    assert (out[:, 0] == np.arange(4, 12)).all()
+
+
+def test_overrun_drops_the_newest_frames():
+    ring = AudioRingBuffer(8, 2)
+    assert ring.write(frames(0, 5)) == 5
+    assert ring.write(frames(5, 5)) == 3
+    assert ring.write(frames(10, 2)) == 0
+    assert ring.overflows == 2
+    assert ring.overflow_frames == 4
+    assert ring.max_fill == 8
+
+    out = np.empty((10, 2), np.int16)
+    assert ring.read(out) == 8
+    assert (out[:8, 0] == np.arange(8)).all()
+    assert ring.stats()["written"] == ring.stats()["read"] == 8
+
+
+def test_timestamps_follow_the_frames_read():
+    ring = AudioRingBuffer(16, 1, rate=1000)
+    ring.write(frames(0, 4, 1), timestamp=10.0)
+    ring.write(frames(4, 4, 1), timestamp=10.5)
+    assert ring.timestamp_at(2) == approx(10.002)
+    assert ring.timestamp_at(6) == approx(10.502)
+    # A block cut short by an overrun keeps its stamp; one dropped whole gets none
+    assert ring.write(frames(8, 20, 1), timestamp=11.0) == 8
+    assert ring.write(frames(28, 4, 1), timestamp=12.0) == 0
+    assert ring.timestamp_at(10) == approx(11.002)
+    assert ring.timestamp_at(15) == approx(11.007)
+
+
+def test_wav_header_is_fixed_up_while_recording(tmp_path):
+    path = str(tmp_path / "audio.wav")
+    now = [0.0]
+    writer = StreamingWavWriter(path, 2, 2, 48000, fixup_seconds=2.0, clock=lambda: now[0])
+    writer.open()
+    writer.write(frames(0, 100))
+    now[0] = 2.0
+    writer.write(frames(100, 100))
+    writer.write(frames(200, 100))
+    # A reader before close sees everything up to the last fix-up
+    with wave.open(path, "rb") as f:
+        assert f.getnframes() == 200
+    writer.close()
+    with wave.open(path, "rb") as f:
+        assert (f.getnchannels(), f.getsampwidth(), f.getframerate()) == (2, 2, 48000)
+        assert f.getnframes() == 300 == writer.frames_written
+        data = np.frombuffer(f.readframes(300), np.int16).reshape(-1, 2)
+    assert (data[:, 0] == np.arange(300)).all()
+
+
+class Sink:
+    """Collects what a DriftCorrector writes"""
+    def __init__(self):
+        self.blocks = []
+
+    def write(self, block):
+        self.blocks.append(np.array(block))
+
+    @property
+    def data(self):
+        return np.concatenate(self.blocks)[:, 0] if self.blocks else np.empty(0, np.int16)
+
+
+def test_late_start_is_filled_with_silence():
+    sink = Sink()
+    corrector = DriftCorrector(sink, 1000, 1)
+    corrector.write(frames(1, 50, 1), 0.1)
+    assert len(sink.data) == 150
+    assert not sink.data[:100].any() and (sink.data[100:] == np.arange(1, 51)).all()
+    assert corrector.inserted == 100
+
+
+def test_jump_past_the_hard_limit_drops_frames_at_once():
+    sink = Sink()
+    corrector = DriftCorrector(sink, 1000, 1)
+    corrector.write(frames(0, 500, 1), 0.0)
+    # Stamped 300 frames before the end of what was written
+    corrector.write(frames(1000, 400, 1), 0.2)
+    assert corrector.dropped == 300
+    assert (sink.data[500:] == np.arange(1300, 1400)).all()
+
+
+def test_frames_ahead_of_the_clock_are_held_until_finish():
+    sink = Sink()
+    corrector = DriftCorrector(sink, 1000, 1)
+    corrector.write(frames(0, 100, 1), 0.0)
+    # A fast sample clock: this block ends 10 frames past the session clock
+    corrector.write(frames(100, 100, 1), 0.09)
+    assert len(sink.data) == 190
+    corrector.finish(0.195)
+    assert (sink.data == np.arange(195)).all()
+    assert corrector.trimmed == 5
+    assert corrector.written == 195
+
+
+def test_finish_pads_to_the_end_of_the_session():
+    sink = Sink()
+    corrector = DriftCorrector(sink, 1000, 1)
+    corrector.write(frames(1, 100, 1), 0.0)
+    corrector.finish(0.25)
+    assert len(sink.data) == 250
+    assert not sink.data[100:].any()
+
+
+def test_slow_drift_is_resampled_within_the_ratio():
+    sink = Sink()
+    corrector = DriftCorrector(sink, 1000, 1, deadband=0.001, smoothing=1.0)
+    corrector.write(frames(0, 1000, 1), 0.0)
+    # 10 frames behind: stretched by at most 0.5% of the block
+    corrector.write(frames(0, 1000, 1), 1.01)
+    assert corrector.stretched == 5
+    assert len(sink.data) == 2005
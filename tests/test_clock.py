@@ -0,0 +1,129 @@
+"""Session clock events and the FrameScheduler slots counted on them"""
+import os
+import sys
+
+# Make the application modules importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from clock import SessionClock, FrameScheduler
+
+
+class FakeClock:
+    """Monotonic clock advanced by hand; times stay exact binary fractions"""
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_slots_follow_deadlines_not_sleeps():
+    clock = FakeClock()
+    scheduler = FrameScheduler(4, clock=clock, sleep=clock.sleep)
+    scheduler.start()
+    assert [scheduler.wait() for _ in range(3)] == [0, 1, 2]
+    # A capture that overruns lands in the slot it actually reached
+    clock.now += 0.625
+    assert scheduler.wait() == 4
+    assert scheduler.missed == 1
+
+
+def test_repeats_fill_skipped_slots_and_drop_covered_ones():
+    scheduler = FrameScheduler(4)
+    assert scheduler.repeats_for(0) == 1
+    assert scheduler.repeats_for(3) == 3
+    assert scheduler.repeats_for(2) == 0
+    assert scheduler.repeats_for(4) == 1
+    assert scheduler.stats()["written"] == 5
+    assert scheduler.duplicated == 2
+    assert scheduler.dropped == 1
+
+
+def test_pause_takes_up_no_slots():
+    clock = FakeClock()
+    scheduler = FrameScheduler(4, clock=clock, sleep=clock.sleep)
+    scheduler.start()
+    clock.now += 0.625
+    assert scheduler.wait() == 2
+    assert scheduler.repeats_for(2) == 3
+
+    scheduler.pause()
+    clock.now += 5.0
+    assert scheduler.wait() is None
+    scheduler.resume()
+
+    # The first capture after resuming continues where the pause began
+    assert scheduler.wait() == 3
+    assert scheduler.repeats_for(3) == 1
+    assert scheduler.duplicated == 2
+
+
+def test_remaining_slots_pad_to_the_stop():
+    clock = FakeClock()
+    scheduler = FrameScheduler(4, clock=clock, sleep=clock.sleep)
+    scheduler.start()
+    scheduler.repeats_for(0)
+    clock.now += 1.25
+    scheduler.pause()
+    clock.now += 1.0
+    scheduler.stop()
+    assert scheduler.remaining_slots() == 4
+    assert scheduler.written_slots == 5
+
+
+def test_session_time_skips_pauses():
+    clock = FakeClock()
+    session = SessionClock(clock)
+    session.start()
+    clock.now += 1.0
+    session.pause()
+    clock.now += 3.0
+    assert session.now() == 1.0
+    session.resume()
+    clock.now += 0.5
+    assert session.now() == 1.5
+    # A timestamp inside the pause maps to where the pause began
+    assert session.session_time(102.0) == 1.0
+    assert session.recorded_spans(100.5, 105.0) == [(100.5, 101.0), (104.0, 105.0)]
+    assert session.stop() == 1.5
+    clock.now += 1.0
+    assert session.now() == 1.5
+
+
+def test_stop_while_paused_ends_at_the_pause():
+    clock = FakeClock()
+    session = SessionClock(clock)
+    session.start()
+    clock.now += 2.0
+    session.pause()
+    clock.now += 1.0
+    assert session.stop() == 2.0
+    assert session.recorded_spans(100.0, 110.0) == [(100.0, 102.0)]
+
+
+def test_scheduler_on_the_session_repeats_across_pause_and_resume():
+    clock = FakeClock()
+    session = SessionClock(clock)
+    session.start()
+    scheduler = FrameScheduler(4, clock=clock, sleep=clock.sleep, session=session)
+    scheduler.start()
+    clock.now += 0.625
+    assert scheduler.repeats_for(scheduler.wait()) == 3
+
+    session.pause()
+    assert scheduler.wait() is None
+    clock.now += 10.0
+    session.resume()
+    assert scheduler.wait() == 3
+    assert scheduler.repeats_for(3) == 1
+
+    clock.now += 0.625
+    assert scheduler.wait() == 5
+    assert scheduler.repeats_for(5) == 2
+    clock.now += 0.375
+    session.stop()
+    assert scheduler.remaining_slots() == 1
+    assert scheduler.written_slots == 7
@@ -0,0 +1,101 @@
+"""ffmpeg arguments of the webcam composite job"""
+import os
+import sys
+
+import cv2
+import pytest
+
+# Make the application modules importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import compositor
+from compositor import PictureInPicture, CIRCLE, composite_job, webcam_track_path
+from ffmpeg_runner import get_runner
+
+
+def input_options(args):
+    """{input path: options given before its -i}"""
+    inputs, options = {}, []
+    i = 0
+    while i < len(args):
+        if args[i] == '-i':
+            inputs[args[i + 1]] = options
+            options = []
+            i += 2
+        elif args[i] == '-filter_complex':
+            break
+        else:
+            options.append(args[i])
+            i += 1
+    return inputs
+
+
+@pytest.fixture
+def sizes(monkeypatch):
+    sizes = {}
+    monkeypatch.setattr(compositor, "_video_size", lambda path: sizes[path])
+    return sizes
+
+
+def test_composite_job_args(tmp_path, sizes):
+    video = str(tmp_path / "screen.mp4")
+    camera = webcam_track_path(video)
+    sizes.update({video: (1920, 1080), camera: (640, 480)})
+
+    job = composite_job(video, camera, PictureInPicture("top-left", size=0.25, shape=CIRCLE, border=4))
+    try:
+        args = job.args
+        inputs = input_options(args)
+        assert list(inputs) == [video, camera] + job.temp_files
+        assert inputs[video] == [] and inputs[camera] == []
+        # Still images last one frame unless looped
+        for mask in job.temp_files:
+            assert inputs[mask] == ['-loop', '1']
+            assert os.path.exists(mask)
+
+        graph = args[args.index('-filter_complex') + 1]
+        assert "[1:v]crop=480:480,scale=480:480" in graph
+        assert "alphamerge=shortest=1" in graph
+        assert "overlay=20:20:eof_action=pass" in graph
+        assert "overlay=20:20:shortest=1" in graph
+        assert args[args.index('-map') + 1] == '[video]'
+        assert '0:a?' in args
+        assert args[-1] == job.output == str(tmp_path / "screen_pip.mp4")
+    finally:
+        for mask in job.temp_files:
+            os.remove(mask)
+
+
+def test_composite_job_overlay_too_large(tmp_path, sizes):
+    video = str(tmp_path / "screen.mp4")
+    camera = webcam_track_path(video)
+    sizes.update({video: (320, 180), camera: (640, 480)})
+
+    with pytest.raises(Exception, match="does not fit"):
+        composite_job(video, camera, PictureInPicture(size=0.9))
+    assert not list(tmp_path.glob("*.png"))
+
+
+@pytest.mark.skipif(not get_runner().available, reason="ffmpeg not found")
+def test_composite_job_runs_to_video_length(tmp_path):
+    runner = get_runner()
+    video = str(tmp_path / "screen.mp4")
+    camera = webcam_track_path(video)
+    for source, path in (("testsrc2=size=320x180:rate=10", video), ("smptebars=size=160x120:rate=10", camera)):
+        result = runner.run(['-f', 'lavfi', '-i', source, '-t', '2', '-c:v', 'libx264',
+                             '-pix_fmt', 'yuv420p', '-y', path])
+        assert result.returncode == 0, result.stderr
+
+    job = composite_job(video, camera, PictureInPicture(size=0.3, shape=CIRCLE, border=2, margin=4))
+    try:
+        result = runner.run(job.args)
+        assert result.returncode == 0, result.stderr
+    finally:
+        for mask in job.temp_files:
+            os.remove(mask)
+    capture = cv2.VideoCapture(job.output)
+    frames = 0
+    while capture.grab():
+        frames += 1
+    capture.release()
+    assert frames == 20
@@ -0,0 +1,66 @@
+"""Idle spans of an ActivityTimeline and the parts of a recording they leave"""
+import os
+import sys
+
+import numpy as np
+
+# Make the application modules importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from idle import ActivityTimeline, kept_spans, idle_cut_job
+
+
+def timeline_with(active_seconds, duration, resolution=0.1):
+    """A timeline with screen changes at each of `active_seconds`, static frames elsewhere"""
+    timeline = ActivityTimeline(resolution=resolution)
+    for cell in range(int(round(duration / resolution))):
+        timestamp = cell * resolution
+        changed = any(abs(timestamp - second) < resolution / 2 for second in active_seconds)
+        timeline.mark_video(timestamp, 0.5 if changed else 0.0)
+    return timeline
+
+
+def test_idle_spans_keep_padding_around_activity():
+    timeline = timeline_with([1.0, 9.0], 12.0)
+    # The idle tail after the last change is shorter than min_idle
+    assert timeline.idle_spans(min_idle=3.0, padding=0.5) == [(1.6, 8.5)]
+    assert timeline.idle_spans(min_idle=2.0, padding=0.5) == [(1.6, 8.5), (9.6, 12.0)]
+    assert timeline.idle_spans(min_idle=8.0, padding=0.5) == []
+
+
+def test_idle_tail_and_head_count():
+    timeline = timeline_with([5.0], 12.0)
+    assert timeline.idle_spans(min_idle=3.0, padding=0.5) == [(0.0, 4.5), (5.6, 12.0)]
+
+
+def test_sound_keeps_a_static_screen():
+    timeline = timeline_with([], 10.0)
+    frame_seconds = 0.02
+    active = np.zeros(500, np.bool_)
+    active[200:250] = True  # Speech from 4 s to 5 s
+    timeline.mark_audio(0.0, active, frame_seconds)
+    assert timeline.idle_spans(min_idle=3.0, padding=0.5) == [(0.0, 3.5), (5.5, 10.0)]
+    assert timeline.duration == 10.0
+
+
+def test_small_changes_count_as_static():
+    timeline = ActivityTimeline(resolution=0.1, min_change=0.01)
+    for cell in range(50):
+        timeline.mark_video(cell * 0.1, 0.005)
+    assert timeline.idle_spans(min_idle=3.0, padding=0.5) == [(0.0, 5.0)]
+
+
+def test_kept_spans_complement_the_idle_spans():
+    assert kept_spans([(1.6, 8.5)], 12.0) == [(0.0, 1.6), (8.5, 12.0)]
+    assert kept_spans([(0.0, 4.5), (5.6, 12.0)], 12.0) == [(4.5, 5.6)]
+    assert kept_spans([], 3.0) == [(0.0, 3.0)]
+
+
+def test_exact_cut_selects_the_kept_spans(tmp_path):
+    video = str(tmp_path / "screen.mp4")
+    job = idle_cut_job(video, [(1.6, 8.5)], 12.0, has_audio=False)
+    graph = job.args[job.args.index('-vf') + 1]
+    assert "between(t,0.000,1.600)+between(t,8.500,12.000)" in graph
+    assert '-af' not in job.args
+    assert job.output == str(tmp_path / "screen_condensed.mp4")
+    assert abs(job.duration - 5.1) < 1e-9
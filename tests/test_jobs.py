@@ -0,0 +1,83 @@
+"""Progress and outcome of JobQueue jobs, from ffmpeg's -progress output"""
+import io
+import os
+import sys
+
+# Make the application modules importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from jobs import Job, JobQueue, DONE, FAILED, CANCELLED
+
+
+class FakeProcess:
+    def __init__(self, stdout, stderr="", returncode=0):
+        self.stdout = io.BytesIO(stdout.encode())
+        self.stderr = io.BytesIO(stderr.encode())
+        self.returncode = returncode
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self):
+        return self.returncode
+
+    def terminate(self):
+        pass
+
+
+class FakeRunner:
+    """Stands in for ffmpeg, replaying canned output"""
+    def __init__(self, process):
+        self.process = process
+        self.args = None
+
+    def require(self):
+        return self
+
+    def popen(self, args, **kwargs):
+        self.args = args
+        return self.process
+
+
+def run(job, process):
+    """Run `job` on the calling thread; returns the progress values reported"""
+    reported = []
+    queue = JobQueue(listener=lambda job: reported.append((job.state, round(job.progress))))
+    queue.runner = FakeRunner(process)
+    queue._run(job)
+    queue.shutdown()
+    return reported
+
+
+def test_progress_from_out_time_us():
+    job = Job("trim", "Trimming", ['-i', 'in.mp4', 'out.mp4'], duration=10.0)
+    reported = run(job, FakeProcess(
+        "frame=1\nout_time_us=2500000\nout_time_ms=N/A\nprogress=continue\n"
+        "out_time_ms=5000000\nout_time_us=5200000\nout_time_us=20000000\nprogress=end\n"))
+    assert reported == [("running", 0), ("running", 25), ("running", 50), ("running", 52),
+                        ("running", 99), (DONE, 100)]
+    assert job.state == DONE
+
+
+def test_duration_read_from_the_input_summary():
+    job = Job("merge", "Merging", ['-i', 'in.mp4', 'out.mp4'])
+    run(job, FakeProcess("", "Input #0, mov,mp4\n  Duration: 00:01:40.00, start: 0.000000\n"))
+    assert job.duration == 100.0
+    assert job.state == DONE
+
+
+def test_failure_reports_the_last_error_line_and_removes_the_output(tmp_path):
+    output = tmp_path / "out.mp4"
+    output.write_bytes(b"partial")
+    job = Job("trim", "Trimming", ['-i', 'in.mp4', str(output)], output=str(output), duration=10.0)
+    run(job, FakeProcess("out_time_us=1000000\n", "in.mp4: Invalid data found\n\n", returncode=1))
+    assert job.state == FAILED
+    assert job.error == "in.mp4: Invalid data found"
+    assert not output.exists()
+
+
+def test_cancelled_before_start_never_runs():
+    job = Job("trim", "Trimming", ['-i', 'in.mp4', 'out.mp4'])
+    job.cancelled.set()
+    reported = run(job, FakeProcess(""))
+    assert reported == [(CANCELLED, 0)]
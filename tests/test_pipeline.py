@@ -0,0 +1,100 @@
+"""Backpressure policies of the pipeline's FrameQueue and buffer recycling in the FramePool"""
+import os
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+# Make the application modules importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from pipeline import FrameQueue, FramePool, QueueClosed, BLOCK, DROP_OLDEST, DROP_NEWEST
+
+
+def drain(queue):
+    items = []
+    while len(queue):
+        items.append(queue.get())
+    return items
+
+
+def test_drop_oldest_keeps_the_newest_items():
+    queue = FrameQueue(2, DROP_OLDEST)
+    dropped = []
+    queue.on_drop = dropped.append
+    assert all(queue.put(item) for item in range(5))
+    assert drain(queue) == [3, 4]
+    assert dropped == [0, 1, 2]
+    assert queue.stats()["dropped"] == 3
+    assert queue.stats()["high_water"] == 2
+
+
+def test_drop_newest_rejects_the_incoming_item():
+    queue = FrameQueue(2, DROP_NEWEST)
+    dropped = []
+    queue.on_drop = dropped.append
+    assert [queue.put(item) for item in range(4)] == [True, True, False, False]
+    assert drain(queue) == [0, 1]
+    assert dropped == [2, 3]
+
+
+def test_block_waits_for_room():
+    queue = FrameQueue(1, BLOCK)
+    queue.put("first")
+    taken = []
+    consumer = threading.Timer(0.05, lambda: taken.append(queue.get()))
+    consumer.start()
+    assert queue.put("second")
+    consumer.join()
+    assert taken == ["first"]
+    assert drain(queue) == ["second"]
+    assert queue.blocked_time > 0
+
+
+def test_block_timeout_drops_the_item():
+    queue = FrameQueue(1, BLOCK)
+    dropped = []
+    queue.on_drop = dropped.append
+    queue.put("first")
+    assert not queue.put("second", timeout=0.01)
+    assert dropped == ["second"]
+    assert drain(queue) == ["first"]
+
+
+def test_close_unblocks_the_producer_and_drains():
+    queue = FrameQueue(1, BLOCK)
+    queue.put("first")
+    threading.Timer(0.05, queue.close).start()
+    assert not queue.put("second")
+    assert queue.get() == "first"
+    with pytest.raises(QueueClosed):
+        queue.get()
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        FrameQueue(1, "spill")
+    with pytest.raises(ValueError):
+        FrameQueue(0)
+
+
+def test_pool_recycles_its_buffers():
+    pool = FramePool((4, 4, 3), count=2)
+    first, second = pool.acquire(), pool.acquire()
+    assert first is not second and first.shape == (4, 4, 3)
+    pool.release(first)
+    assert pool.acquire() is first
+    assert pool.stats() == {"size": 2, "free": 0, "allocations": 0}
+
+
+def test_pool_grows_when_dry_and_ignores_foreign_buffers():
+    pool = FramePool((2, 2), count=1)
+    pool.acquire()
+    extra = pool.acquire()
+    assert pool.stats()["allocations"] == 1
+    pool.release(np.empty((2, 2), np.uint8))
+    pool.release(None)
+    assert pool.stats()["free"] == 0
+    pool.release(extra)
+    assert pool.acquire() is extra
@@ -0,0 +1,123 @@
+"""Crash recovery: audio repair and interrupted session markers"""
+import os
+import sys
+import json
+import time
+import wave
+import struct
+
+import pytest
+
+# Make the application modules importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import recovery
+from recovery import repair_wav_header, write_marker, marker_path, recover_orphans
+from audio import FFmpegAudioWriter
+from ffmpeg_runner import get_runner
+
+
+def write_wav(path, frames=1000, channels=2, rate=48000):
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(b"\x01\x00" * frames * channels)
+
+
+def unclosed(path):
+    """Zero the sizes in the header, as a writer killed before closing leaves them"""
+    with open(path, "r+b") as f:
+        f.seek(4)
+        f.write(struct.pack("<I", 0))
+        f.seek(40)
+        f.write(struct.pack("<I", 0))
+
+
+def test_repair_restores_the_sizes(tmp_path):
+    path = tmp_path / "audio_1.wav"
+    write_wav(path)
+    unclosed(path)
+    assert repair_wav_header(str(path))
+    with wave.open(str(path), "rb") as f:
+        assert f.getnframes() == 1000
+    assert not repair_wav_header(str(path))
+
+
+def test_repair_finds_the_data_chunk_after_other_chunks(tmp_path):
+    path = tmp_path / "audio_1.wav"
+    write_wav(path, frames=10)
+    data = path.read_bytes()
+    # A LIST chunk of odd size (padded) between fmt and data
+    list_chunk = b"LIST" + struct.pack("<I", 5) + b"INFOx\x00"
+    path.write_bytes(data[:36] + list_chunk + data[36:44] + b"\x02\x00" * 40 + b"\x03\x00" * 8)
+    assert repair_wav_header(str(path))
+    with wave.open(str(path), "rb") as f:
+        assert f.getnframes() == 24
+
+
+def test_repair_rejects_other_files(tmp_path):
+    path = tmp_path / "audio_1.wav"
+    path.write_bytes(b"fLaC" + b"\x00" * 40)
+    with pytest.raises(Exception, match="Not a WAV file"):
+        repair_wav_header(str(path))
+
+
+def test_this_process_sessions_are_left_alone(tmp_path):
+    video = tmp_path / "recording.mp4"
+    audio = tmp_path / "audio_1.wav"
+    video.write_bytes(b"video")
+    write_wav(audio)
+    unclosed(audio)
+    write_marker(str(video), [str(audio)])
+
+    assert recover_orphans(str(tmp_path)) == ([], [])
+    assert os.path.exists(marker_path(str(video)))
+    # Its audio is still being written, not an orphan to repair
+    with open(audio, "rb") as f:
+        f.seek(4)
+        assert f.read(4) == struct.pack("<I", 0)
+
+
+def test_session_without_video_is_reported_as_failed(tmp_path, monkeypatch):
+    monkeypatch.setattr(recovery, "SESSION_TOKEN", "this process")
+    video = tmp_path / "recording.mp4"
+    audio = tmp_path / "audio_1.wav"
+    write_wav(audio)
+    unclosed(audio)
+    with open(marker_path(str(video)), "w", encoding="utf-8") as f:
+        json.dump({"video": video.name, "audio": [audio.name], "session": "crashed process"}, f)
+
+    recovered, failed = recover_orphans(str(tmp_path))
+    assert recovered == []
+    assert failed == [(marker_path(str(video)), "no screen video was recorded; kept audio_1.wav")]
+    assert not os.path.exists(marker_path(str(video)))
+    with wave.open(str(audio), "rb") as f:
+        assert f.getnframes() == 1000
+
+
+def killed_writer(path, frames=6 * 48000):
+    """An audio intermediate whose ffmpeg was killed before it could finish the file"""
+    writer = FFmpegAudioWriter(str(path), 2, 2, 48000)
+    writer.open()
+    writer.write(b"\x01\x00" * frames * 2)
+    writer.proc.stdin.flush()
+    # ffmpeg probes about 5 s of input before it opens the output; let it
+    # flush what it has, then kill it
+    deadline = time.monotonic() + 10
+    while not (os.path.exists(path) and os.path.getsize(path) > 1000) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    writer.proc.kill()
+    writer.proc.wait()
+
+
+@pytest.mark.skipif(not get_runner().available, reason="ffmpeg not found")
+@pytest.mark.parametrize("ext", [".flac", ".opus"])
+def test_orphaned_intermediates_are_repaired(tmp_path, ext):
+    path = tmp_path / f"audio_1{ext}"
+    killed_writer(path)
+    recovered, failed = recover_orphans(str(tmp_path))
+    assert failed == []
+    assert recovered == [(str(path), "audio header repaired")]
+    assert not recovery.repair_audio(str(path))
+    assert os.listdir(tmp_path) == [path.name]